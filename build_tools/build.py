@@ -7,10 +7,25 @@ Generates executable and installer
 
 import os
 import sys
+import ast
+import time
 import shutil
+import pkgutil
+import argparse
+import tempfile
+import statistics
 import subprocess
 from pathlib import Path
 
+# Distribution profiles: where each one lands and the executable inside it
+EXE_NAME = 'Listener.exe' if os.name == 'nt' else 'Listener'
+PROFILES = {
+    # Single self-extracting file; unpacks the whole bundle to a temp dir on every launch
+    'onefile': {'dist': Path('dist'), 'exe': Path(EXE_NAME)},
+    # One directory with only the Qt modules main.py imports; starts without unpacking
+    'startup': {'dist': Path('dist/startup'), 'exe': Path('Listener') / EXE_NAME},
+}
+
 def run_command(cmd, description):
     """Run a command and handle errors"""
     print(f"\n🔄 {description}...")
@@ -82,9 +97,27 @@ def create_icon():
         ico_path.touch()
         return str(ico_path)
 
-def build_executable():
+def qt_modules_used(script='src/main.py'):
+    """PyQt6 modules imported by the application"""
+    tree = ast.parse(Path(script).read_text(encoding='utf-8'))
+    modules = {'sip'}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.ImportFrom) and node.module and node.module.startswith('PyQt6.'):
+            modules.add(node.module.split('.')[1])
+        elif isinstance(node, ast.Import):
+            modules.update(alias.name.split('.')[1] for alias in node.names if alias.name.startswith('PyQt6.'))
+    return modules
+
+def qt_modules_unused(script='src/main.py'):
+    """Installed PyQt6 modules the application never imports"""
+    import PyQt6
+    
+    used = qt_modules_used(script)
+    return sorted(module.name for module in pkgutil.iter_modules(PyQt6.__path__) if module.name not in used)
+
+def build_executable(profile='onefile'):
     """Build executable using PyInstaller"""
-    print("\n🏗️  Building executable...")
+    print(f"\n🏗️  Building executable ({profile} profile)...")
     
     # Ensure icon exists
     icon_path = create_icon()
@@ -92,19 +125,89 @@ def build_executable():
     # PyInstaller command
     cmd = [
         'pyinstaller',
-        '--onefile',                    # Single file executable
+        '--noconfirm',
         '--windowed',                   # No console window
         '--name=Listener',              # Executable name
         f'--icon={icon_path}',          # Application icon
         '--add-data=config;config',     # Include config directory
         '--hidden-import=PyQt6.sip',    # Ensure PyQt6 imports work
-        '--collect-all=PyQt6',          # Collect all PyQt6 modules
-        'src/main.py'                   # Main script
+        f'--distpath={PROFILES[profile]["dist"]}',
     ]
     
-    return run_command(' '.join(cmd), "Building executable")
-
-def create_installer_script():
+    if profile == 'startup':
+        # No --collect-all: PyInstaller's hooks pull in the Qt libraries and plugins
+        # for the modules main.py imports, everything else is excluded outright
+        cmd.append('--onedir')
+        cmd.extend(f'--exclude-module=PyQt6.{module}' for module in qt_modules_unused())
+        cmd.append('--exclude-module=tkinter')
+    else:
+        cmd.append('--onefile')         # Single file executable
+        cmd.append('--collect-all=PyQt6')  # Collect all PyQt6 modules
+    
+    cmd.append('src/main.py')           # Main script
+    return run_command(' '.join(cmd), f"Building executable ({profile})")
+
+def profile_size(profile):
+    """Bytes on disk for a built profile"""
+    dist = PROFILES[profile]['dist']
+    exe = dist / PROFILES[profile]['exe']
+    if exe.parent == dist:
+        return exe.stat().st_size
+    return sum(f.stat().st_size for f in exe.parent.rglob('*') if f.is_file())
+
+def time_to_window(exe, timeout=120):
+    """Seconds from launching the executable until its main window is shown"""
+    probe = Path(tempfile.mkdtemp()) / 'startup.probe'
+    try:
+        started = time.time()
+        process = subprocess.run([str(exe), f'--startup-probe={probe}'], timeout=timeout,
+                                 capture_output=True)
+        if not probe.exists():
+            raise RuntimeError(f"{exe} exited with code {process.returncode} before showing its window")
+        return float(probe.read_text(encoding='utf-8')) - started
+    finally:
+        shutil.rmtree(probe.parent, ignore_errors=True)
+
+def benchmark_startup(profiles, runs=5):
+    """Report on-disk size and time-to-window for each built profile"""
+    print(f"\n⏱️  Startup benchmark ({runs} launches per profile)...")
+    results = {}
+    
+    for profile in profiles:
+        dist = PROFILES[profile]['dist']
+        exe = dist / PROFILES[profile]['exe']
+        if not exe.exists():
+            print(f"⚠️  {exe} not found, skipping {profile}")
+            continue
+        
+        # Launch from a scratch copy so the first-run config/data/logs stay out of dist/
+        workdir = Path(tempfile.mkdtemp(prefix=f'listener-{profile}-'))
+        try:
+            if exe.parent == dist:
+                shutil.copy2(exe, workdir / exe.name)
+                copied = workdir / exe.name
+            else:
+                shutil.copytree(exe.parent, workdir / exe.parent.name)
+                copied = workdir / exe.parent.name / exe.name
+            
+            timings = [time_to_window(copied) for _ in range(runs)]
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        
+        results[profile] = {
+            'size_mb': profile_size(profile) / (1024 * 1024),
+            'first': timings[0],
+            'median': statistics.median(timings),
+            'max': max(timings),
+        }
+    
+    print(f"\n   {'Profile':<10} {'Size (MB)':>10} {'First (s)':>10} {'Median (s)':>11} {'Max (s)':>8}")
+    for profile, result in results.items():
+        print(f"   {profile:<10} {result['size_mb']:>10.1f} {result['first']:>10.2f} "
+              f"{result['median']:>11.2f} {result['max']:>8.2f}")
+    return results
+
+def create_installer_script(profile='onefile'):
     """Create NSIS installer script"""
     print("\n📦 Creating installer script...")
     
@@ -170,7 +273,7 @@ Section "Core Application" SecCore
     SetOutPath "$INSTDIR"
     
     ; Main executable
-    File "dist\\${APP_EXECUTABLE}"
+    %APP_FILES%
     
     ; Create directories
     CreateDirectory "$INSTDIR\\config"
@@ -256,6 +359,7 @@ Section "Uninstall"
     Delete "$INSTDIR\\${APP_EXECUTABLE}"
     Delete "$INSTDIR\\Uninstall.exe"
     Delete "$INSTDIR\\icons\\listener.ico"
+    RMDir /r "$INSTDIR\\_internal"  ; Libraries of the startup profile
     
     ; Remove directories if empty
     RMDir "$INSTDIR\\icons"
@@ -282,6 +386,12 @@ Section "Uninstall"
 SectionEnd
 '''
     
+    if profile == 'startup':
+        app_files = 'File /r "dist\\startup\\Listener\\*.*"'
+    else:
+        app_files = 'File "dist\\${APP_EXECUTABLE}"'
+    nsis_script = nsis_script.replace('%APP_FILES%', app_files)
+    
     with open(installer_dir / 'installer.nsi', 'w', encoding='utf-8') as f:
         f.write(nsis_script)
     
@@ -411,8 +521,23 @@ if %errorlevel% neq 0 (
     
     print("✅ Batch scripts created")
 
+def parse_args():
+    """Command line options"""
+    parser = argparse.ArgumentParser(description="Build Listener Professional")
+    parser.add_argument('--profile', choices=[*PROFILES, 'all'], default='onefile',
+                        help="onefile: single exe (default); startup: slim one-directory build")
+    parser.add_argument('--benchmark', action='store_true',
+                        help="measure on-disk size and time-to-window of the built profiles")
+    parser.add_argument('--benchmark-only', action='store_true',
+                        help="benchmark existing builds in dist/ without rebuilding")
+    parser.add_argument('--runs', type=int, default=5, help="launches per profile when benchmarking")
+    return parser.parse_args()
+
 def main():
     """Main build process"""
+    args = parse_args()
+    profiles = list(PROFILES) if args.profile == 'all' else [args.profile]
+    
     print("="*60)
     print("        Listener Professional v4.0 - Build System")
     print("="*60)
@@ -424,32 +549,41 @@ def main():
     
     print(f"\n📁 Working directory: {os.getcwd()}")
     
+    if args.benchmark_only:
+        return bool(benchmark_startup(profiles, args.runs))
+    
     # Clean previous builds
     clean_build_dirs()
     
     # Create license
     create_license()
     
-    # Create installer script
-    create_installer_script()
+    # Create installer script (packages the last profile built)
+    create_installer_script(profiles[-1])
     
     # Create batch scripts
     create_batch_scripts()
     
     # Build executable
-    if not build_executable():
-        print("\n❌ Build failed!")
-        return False
+    for profile in profiles:
+        if not build_executable(profile):
+            print("\n❌ Build failed!")
+            return False
     
     # Build installer
     build_installer()
     
+    if args.benchmark:
+        benchmark_startup(profiles, args.runs)
+    
     print("\n" + "="*60)
     print("                    BUILD COMPLETE!")
     print("="*60)
     print("\n📁 Output files:")
-    if os.path.exists('dist/Listener.exe'):
-        print(f"   ✅ Executable: dist/Listener.exe")
+    for profile in profiles:
+        exe = PROFILES[profile]['dist'] / PROFILES[profile]['exe']
+        if exe.exists():
+            print(f"   ✅ Executable ({profile}): {exe}")
     if os.path.exists('ListenerInstaller.exe'):
         print(f"   ✅ Installer: ListenerInstaller.exe")
     
@@ -8,9 +8,22 @@ Utilities for development and testing
 import os
 import sys
 import json
+import time
+import random
+import tempfile
 import subprocess
 from pathlib import Path
 
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+
+def load_main_module(src_dir=SRC_DIR):
+    """Import main.py from src_dir (this tree's src by default) for benchmarks and checks"""
+    src_dir = str(Path(src_dir).resolve())
+    if src_dir not in sys.path:
+        sys.path.insert(0, src_dir)
+    import main
+    return main
+
 def check_dependencies():
     """Check if all required dependencies are available"""
     required_packages = [
@@ -91,7 +104,7 @@ def test_application():
     print("🧪 Testing application...")
     
     # Check if main.py exists and is valid Python
-    main_path = Path('src/main.py')
+    main_path = SRC_DIR / "main.py"
     if not main_path.exists():
         print("❌ Main application file not found")
         return False
@@ -190,10 +203,7 @@ def run_quick_test():
     
     try:
         # Import main modules to check for import errors
-        sys.path.insert(0, 'src')
-        
-        # Test imports
-        import main
+        main = load_main_module()
         print("✅ Main module imports successfully")
         
         # Test configuration manager
@@ -208,9 +218,717 @@ def run_quick_test():
     except Exception as e:
         print(f"❌ Quick test failed: {e}")
         return False
-    finally:
-        if 'src' in sys.path:
-            sys.path.remove('src')
+
+# Recorded-style AMI traffic with the field names Asterisk sends: (seconds, fields)
+AMI_REPLAY = [
+    # Asterisk 13: inbound call to 100, answered after 5 s, 60 s talk
+    (0, {'Event': "DialBegin", 'Channel': "SIP/trunk-00000001", 'CallerIDNum': "07701234567",
+         'ConnectedLineNum': "<unknown>", 'Uniqueid': "1500000000.1", 'Linkedid': "1500000000.1",
+         'DestChannel': "SIP/100-00000002", 'DestCallerIDNum': "100", 'DestConnectedLineNum': "07701234567",
+         'DestUniqueid': "1500000000.2", 'DestLinkedid': "1500000000.1", 'DialString': "100"}),
+    (5, {'Event': "BridgeEnter", 'BridgeUniqueid': "b1", 'Channel': "SIP/trunk-00000001",
+         'CallerIDNum': "07701234567", 'ConnectedLineNum': "100",
+         'Uniqueid': "1500000000.1", 'Linkedid': "1500000000.1"}),
+    (5, {'Event': "BridgeEnter", 'BridgeUniqueid': "b1", 'Channel': "SIP/100-00000002",
+         'CallerIDNum': "100", 'ConnectedLineNum': "07701234567",
+         'Uniqueid': "1500000000.2", 'Linkedid': "1500000000.1"}),
+    (65, {'Event': "Hangup", 'Channel': "SIP/100-00000002", 'CallerIDNum': "100",
+          'ConnectedLineNum': "07701234567", 'Uniqueid': "1500000000.2", 'Linkedid': "1500000000.1",
+          'Cause': "16", 'Cause-txt': "Normal Clearing"}),
+    (65, {'Event': "Hangup", 'Channel': "SIP/trunk-00000001", 'CallerIDNum': "07701234567",
+          'ConnectedLineNum': "100", 'Uniqueid': "1500000000.1", 'Linkedid': "1500000000.1",
+          'Cause': "16", 'Cause-txt': "Normal Clearing"}),
+    # Asterisk 13: caller gives up after 8 s of ringing
+    (100, {'Event': "DialBegin", 'Channel': "SIP/trunk-00000003", 'CallerIDNum': "07807654321",
+           'Uniqueid': "1500000000.3", 'Linkedid': "1500000000.3", 'DestChannel': "SIP/100-00000004",
+           'DestCallerIDNum': "100", 'DestUniqueid': "1500000000.4", 'DestLinkedid': "1500000000.3"}),
+    (108, {'Event': "Hangup", 'Channel': "SIP/trunk-00000003", 'CallerIDNum': "07807654321",
+           'ConnectedLineNum': "100", 'Uniqueid': "1500000000.3", 'Linkedid': "1500000000.3", 'Cause': "16"}),
+    (108, {'Event': "Hangup", 'Channel': "SIP/100-00000004", 'CallerIDNum': "100",
+           'ConnectedLineNum': "07807654321", 'Uniqueid': "1500000000.4", 'Linkedid': "1500000000.3",
+           'Cause': "26", 'Cause-txt': "Answered elsewhere"}),
+    # Asterisk 13: outbound call from 100, 30 s talk
+    (200, {'Event': "DialBegin", 'Channel': "SIP/100-00000005", 'CallerIDNum': "100",
+           'Uniqueid': "1500000000.5", 'Linkedid': "1500000000.5", 'DestChannel': "SIP/trunk-00000006",
+           'DestCallerIDNum': "07909999999", 'DestUniqueid': "1500000000.6", 'DestLinkedid': "1500000000.5"}),
+    (210, {'Event': "BridgeEnter", 'Channel': "SIP/trunk-00000006", 'CallerIDNum': "07909999999",
+           'ConnectedLineNum': "100", 'Uniqueid': "1500000000.6", 'Linkedid': "1500000000.5"}),
+    (240, {'Event': "Hangup", 'Channel': "SIP/trunk-00000006", 'CallerIDNum': "07909999999",
+           'ConnectedLineNum': "100", 'Uniqueid': "1500000000.6", 'Linkedid': "1500000000.5"}),
+    (240, {'Event': "Hangup", 'Channel': "SIP/100-00000005", 'CallerIDNum': "100",
+           'ConnectedLineNum': "07909999999", 'Uniqueid': "1500000000.5", 'Linkedid': "1500000000.5"}),
+    # Asterisk 11: Dial/SubEvent Begin, one Bridge event naming both channels,
+    # and Hangups without a Linkedid; 5 s ringing, 20 s talk
+    (295, {'Event': "Dial", 'Privilege': "call,all", 'SubEvent': "Begin", 'Channel': "SIP/trunk-00000007",
+           'Destination': "SIP/100-00000008", 'CallerIDNum': "07705555555", 'CallerIDName': "<unknown>",
+           'ConnectedLineNum': "<unknown>", 'UniqueID': "1500000000.7", 'DestUniqueID': "1500000000.8",
+           'Dialstring': "100"}),
+    (300, {'Event': "Bridge", 'Privilege': "call,all", 'Bridgestate': "Link", 'Bridgetype': "core",
+           'Channel1': "SIP/trunk-00000007", 'Channel2': "SIP/100-00000008",
+           'Uniqueid1': "1500000000.7", 'Uniqueid2': "1500000000.8",
+           'CallerID1': "07705555555", 'CallerID2': "100"}),
+    (320, {'Event': "Bridge", 'Bridgestate': "Unlink", 'Channel1': "SIP/trunk-00000007",
+           'Channel2': "SIP/100-00000008", 'Uniqueid1': "1500000000.7", 'Uniqueid2': "1500000000.8",
+           'CallerID1': "07705555555", 'CallerID2': "100"}),
+    (320, {'Event': "Hangup", 'Channel': "SIP/100-00000008", 'Uniqueid': "1500000000.8",
+           'CallerIDNum': "100", 'ConnectedLineNum': "07705555555", 'Cause': "16"}),
+    (320, {'Event': "Dial", 'SubEvent': "End", 'Channel': "SIP/trunk-00000007",
+           'UniqueID': "1500000000.7", 'DialStatus': "ANSWER"}),
+    (320, {'Event': "Hangup", 'Channel': "SIP/trunk-00000007", 'Uniqueid': "1500000000.7",
+           'CallerIDNum': "07705555555", 'ConnectedLineNum': "100", 'Cause': "16"}),
+    # Asterisk 11: queue rings 100 through a Local channel; caller gives up after 11 s
+    (350, {'Event': "Join", 'Channel': "SIP/trunk-0000000d", 'CallerIDNum': "07706666666",
+           'Queue': "sales", 'Position': "1", 'Count': "1", 'Uniqueid': "1500000000.13"}),
+    (351, {'Event': "Dial", 'SubEvent': "Begin", 'Channel': "SIP/trunk-0000000d",
+           'Destination': "Local/100@from-queue-0000;1", 'CallerIDNum': "07706666666",
+           'UniqueID': "1500000000.13", 'DestUniqueID': "1500000000.14", 'Dialstring': "100@from-queue/n"}),
+    (362, {'Event': "Hangup", 'Channel': "SIP/trunk-0000000d", 'Uniqueid': "1500000000.13",
+           'CallerIDNum': "07706666666", 'ConnectedLineNum': "100", 'Cause': "16"}),
+    (362, {'Event': "Hangup", 'Channel': "Local/100@from-queue-0000;1", 'Uniqueid': "1500000000.14",
+           'CallerIDNum': "100", 'ConnectedLineNum': "07706666666", 'Cause': "16"}),
+    # Another agent's call must not reach extension 100
+    (400, {'Event': "BridgeEnter", 'Channel': "SIP/101-00000009", 'CallerIDNum': "101",
+           'ConnectedLineNum': "07701111111", 'Uniqueid': "1500000000.10", 'Linkedid': "1500000000.9"}),
+    # Asterisk 13: queue call; only the queue events name the queue
+    (500, {'Event': "QueueCallerJoin", 'Channel': "SIP/trunk-0000000b", 'CallerIDNum': "07702222222",
+           'Uniqueid': "1500000000.11", 'Linkedid': "1500000000.11", 'Queue': "support", 'Position': "1",
+           'Count': "1"}),
+    (502, {'Event': "AgentCalled", 'Channel': "SIP/trunk-0000000b", 'CallerIDNum': "07702222222",
+           'Uniqueid': "1500000000.11", 'Linkedid': "1500000000.11", 'DestChannel': "SIP/100-0000000c",
+           'DestCallerIDNum': "100", 'DestUniqueid': "1500000000.12", 'Queue': "support",
+           'Interface': "SIP/100"}),
+    (502, {'Event': "DialBegin", 'Channel': "SIP/trunk-0000000b", 'CallerIDNum': "07702222222",
+           'Uniqueid': "1500000000.11", 'Linkedid': "1500000000.11", 'DestChannel': "SIP/100-0000000c",
+           'DestCallerIDNum': "100", 'DestUniqueid': "1500000000.12", 'DestLinkedid': "1500000000.11"}),
+    (506, {'Event': "AgentConnect", 'Channel': "SIP/trunk-0000000b", 'Uniqueid': "1500000000.11",
+           'Linkedid': "1500000000.11", 'DestChannel': "SIP/100-0000000c", 'Queue': "support",
+           'HoldTime': "6", 'RingTime': "4"}),
+    (506, {'Event': "BridgeEnter", 'Channel': "SIP/100-0000000c", 'CallerIDNum': "100",
+           'ConnectedLineNum': "07702222222", 'Uniqueid': "1500000000.12", 'Linkedid': "1500000000.11"}),
+    (506, {'Event': "QueueCallerLeave", 'Channel': "SIP/trunk-0000000b", 'Uniqueid': "1500000000.11",
+           'Linkedid': "1500000000.11", 'Queue': "support", 'Count': "0"}),
+    (626, {'Event': "Hangup", 'Channel': "SIP/100-0000000c", 'CallerIDNum': "100",
+           'ConnectedLineNum': "07702222222", 'Uniqueid': "1500000000.12", 'Linkedid': "1500000000.11"}),
+]
+
+def test_ami_replay():
+    """Replay AMI events with real Asterisk field names and check the call statistics they produce"""
+    print("🧪 Replaying AMI events from Asterisk 11 and 13...")
+    
+    main = load_main_module()
+    from PyQt6.QtCore import QCoreApplication
+    
+    app = QCoreApplication.instance() or QCoreApplication([])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config = main.ConfigManager(tmp_dir).load_config()
+    config['agent']['extension'] = "100"
+    
+    listener = main.AMIListenerThread(config)
+    listener.update_call_status_file = lambda call: None
+    delivered = []
+    listener.call_event.connect(delivered.append)
+    
+    tracker = main.CallTracker()
+    summaries = []
+    for at, fields in AMI_REPLAY:
+        count = len(delivered)
+        listener.handle_event(fields)
+        # Statistics only follow calls ringing the agent, as in the window
+        for call in delivered[count:]:
+            summary = tracker.observe(call, now=at) if main.is_inbound(call) else None
+            if summary:
+                summaries.append(summary)
+    
+    events = [(call.event, call.caller_id, call.destination) for call in delivered]
+    expected_events = [
+        ("DialBegin", "07701234567", "100"), ("Bridge", "07701234567", "100"), ("Hangup", "07701234567", "100"),
+        ("DialBegin", "07807654321", "100"), ("Hangup", "07807654321", "100"),
+        ("DialBegin", "100", "07909999999"), ("Bridge", "100", "07909999999"), ("Hangup", "100", "07909999999"),
+        ("DialBegin", "07705555555", "100"), ("Bridge", "07705555555", "100"), ("Hangup", "07705555555", "100"),
+        ("DialBegin", "07706666666", "100"), ("Hangup", "07706666666", "100"),
+        ("DialBegin", "07702222222", "100"), ("Bridge", "07702222222", "100"), ("Hangup", "07702222222", "100"),
+    ]
+    expected_summaries = [(True, 5, 60, ""), (False, 8, None, ""), (True, 5, 20, ""), (False, 11, None, "sales"),
+                          (True, 4, 120, "support")]
+    got_summaries = [(s['answered'], s['ring_time'], s['talk_time'], s['queue']) for s in summaries]
+    
+    passed = True
+    for label, got, expected in (("call events", events, expected_events),
+                                 ("completed calls", got_summaries, expected_summaries)):
+        ok = got == expected
+        passed &= ok
+        print(f"  {'✅' if ok else '❌'} {label}")
+        if not ok:
+            print(f"     expected {expected}\n     got      {got}")
+    
+    print("\n✅ AMI replay matches" if passed else "\n❌ AMI replay does not match")
+    return passed
+
+def test_repeat_callers():
+    """Check that only inbound calls count towards repeat callers, once per call"""
+    print("🧪 Checking repeat caller counting...")
+    
+    main = load_main_module()
+    from PyQt6.QtCore import QCoreApplication
+    
+    app = QCoreApplication.instance() or QCoreApplication([])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config = main.ConfigManager(tmp_dir).load_config()
+    config['agent']['extension'] = "100"
+    
+    listener = main.AMIListenerThread(config)
+    listener.update_call_status_file = lambda call: None
+    delivered = []
+    listener.call_event.connect(delivered.append)
+    
+    def dial(caller, destination, linkedid, leg):
+        listener.handle_event({
+            'Event': "DialBegin", 'Channel': f"SIP/{caller}-{linkedid}", 'CallerIDNum': caller,
+            'Uniqueid': f"1500000000.{linkedid}", 'Linkedid': f"1500000000.{linkedid}",
+            'DestChannel': f"SIP/{destination}-{leg}", 'DestCallerIDNum': destination,
+            'DestUniqueid': f"1500000000.{leg}", 'DestLinkedid': f"1500000000.{linkedid}",
+        })
+        return delivered[-1].repeat_count
+    
+    checks = [
+        # Four outbound calls from the agent to different numbers
+        ("outbound calls", [dial("100", f"0790000000{n}", 10 + n, 20 + n) for n in range(4)], [0, 0, 0, 0]),
+        # A queue ringing the agent three times on one call, then two more calls
+        ("queue retries", [dial("07702222222", "100", 30, 31 + n) for n in range(3)], [1, 1, 1]),
+        ("new calls", [dial("07702222222", "100", 40 + n, 50 + n) for n in range(2)], [2, 3]),
+    ]
+    
+    passed = True
+    for label, got, expected in checks:
+        ok = got == expected
+        passed &= ok
+        print(f"  {'✅' if ok else '❌'} {label}: {got}")
+        if not ok:
+            print(f"     expected {expected}")
+    
+    print("\n✅ Repeat callers counted per inbound call" if passed else "\n❌ Repeat caller counts are wrong")
+    return passed
+
+def benchmark_history_search(rows=1_000_000, budget_ms=50):
+    """Time indexed call history queries against a large synthetic store"""
+    print(f"⏱️  Benchmarking call history search ({rows:,} rows)...")
+    
+    main = load_main_module()
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store = main.CallHistoryStore(Path(tmp_dir) / "call_history.db")
+        rnd = random.Random(1)
+        now = time.time()
+        
+        names = ", ".join(name for name, _ in store.COLUMNS)
+        placeholders = ", ".join("?" for _ in store.COLUMNS)
+        
+        def generate():
+            for i in range(rows):
+                record = {
+                    'ts': now - rows + i,
+                    'timestamp': '',
+                    'event': rnd.choice(["DialBegin", "Bridge", "Hangup"]),
+                    'caller_id': f"07{rnd.randint(100000000, 999999999)}",
+                    'destination': "100",
+                    'channel': "SIP/trunk-0001",
+                    'uniqueid': str(i),
+                    'extension': str(100 + rnd.randint(0, 29)),
+                }
+                yield [record.get(name, '') for name, _ in store.COLUMNS]
+        
+        store.conn.executemany(f"INSERT INTO calls ({names}) VALUES ({placeholders})", generate())
+        store.conn.commit()
+        
+        cases = [
+            ("latest page", {}),
+            ("short prefix", {'caller_prefix': "07"}),
+            ("operator prefix", {'caller_prefix': "0770"}),
+            ("long prefix", {'caller_prefix': "077012"}),
+            ("full number", {'caller_prefix': "07701234567"}),
+            ("event type", {'event': "Hangup"}),
+            ("extension", {'extension': "105"}),
+            ("this week", {'date_from': now - 7 * 86400}),
+            ("combined", {'caller_prefix': "0770", 'date_from': now - 7 * 86400, 'extension': "105"}),
+        ]
+        
+        all_passed = True
+        for label, filters in cases:
+            started = time.perf_counter()
+            page = store.query(filters)
+            if page:
+                store.query(filters, before=(page[-1]['ts'], page[-1]['id']))
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            
+            passed = elapsed_ms < budget_ms
+            all_passed &= passed
+            print(f"  {'✅' if passed else '❌'} {label:<16} {elapsed_ms:7.1f} ms (2 pages)")
+        
+        store.close()
+    
+    if all_passed:
+        print(f"\n✅ All queries under {budget_ms} ms")
+    else:
+        print(f"\n❌ Some queries exceeded {budget_ms} ms")
+    return all_passed
+
+def benchmark_prefix_classifier(rules=100_000, lookups=200_000):
+    """Show that prefix classification cost does not grow with the rule count"""
+    print(f"⏱️  Benchmarking number classification ({rules:,} rules)...")
+    
+    main = load_main_module()
+    rnd = random.Random(1)
+    numbers = [f"07{rnd.randint(100000000, 999999999)}" for _ in range(1000)]
+    results = {}
+    
+    for rule_count in (100, rules):
+        classifier = main.PrefixClassifier("964")
+        prefixes = {
+            "0" + "".join(rnd.choice("0123456789") for _ in range(rnd.randint(2, 8)))
+            for _ in range(rule_count * 2)
+        }
+        rule_rows = [(prefix, rnd.choice(["mobile", "landline", "vip", "blocked"]))
+                     for prefix in list(prefixes)[:rule_count]]
+        
+        started = time.perf_counter()
+        for prefix, category in rule_rows:
+            classifier.add_rule(prefix, category, "")
+        build_ms = (time.perf_counter() - started) * 1000
+        
+        started = time.perf_counter()
+        for i in range(lookups):
+            classifier.classify(numbers[i % len(numbers)])
+        lookup_us = (time.perf_counter() - started) * 1_000_000 / lookups
+        
+        results[rule_count] = lookup_us
+        print(f"  {rule_count:>9,} rules: build {build_ms:8.1f} ms, lookup {lookup_us:5.2f} µs")
+    
+    ratio = results[rules] / results[100]
+    passed = ratio < 2.0
+    print(f"\n{'✅' if passed else '❌'} Lookup cost ratio {rules:,} vs 100 rules: {ratio:.2f}x")
+    return passed
+
+def benchmark_status_outputs(updates=2000, poll_interval=0.001):
+    """Compare update-to-visibility latency of the status file and shared memory region"""
+    print(f"⏱️  Benchmarking call status outputs ({updates:,} updates)...")
+    
+    load_main_module()
+    import threading
+    from callstatus_shm import StatusRegionWriter, StatusRegionReader
+    
+    def percentile(values, q):
+        values = sorted(values)
+        return values[int(q * (len(values) - 1))]
+    
+    def run(label, write, open_reader):
+        written_at = {}
+        latencies = []
+        poll_costs = []
+        done = threading.Event()
+        poll = open_reader()
+        
+        def reader():
+            seen = None
+            while not done.is_set() or seen != updates - 1:
+                started = time.perf_counter()
+                current = poll()
+                poll_costs.append(time.perf_counter() - started)
+                if current is not None and current != seen:
+                    latencies.append(time.perf_counter() - written_at[current])
+                    seen = current
+                time.sleep(poll_interval)
+        
+        thread = threading.Thread(target=reader)
+        thread.start()
+        rnd = random.Random(1)
+        for i in range(updates):
+            written_at[i] = time.perf_counter()
+            write(i, f"<CRM><callRecord><CallerID>07{rnd.randint(100000000, 999999999)}</CallerID>"
+                     f"<Seq>{i}</Seq></callRecord></CRM>")
+            time.sleep(rnd.uniform(0.002, 0.006))
+        done.set()
+        thread.join()
+        
+        latencies_ms = [value * 1000 for value in latencies]
+        poll_us = sum(poll_costs) / len(poll_costs) * 1_000_000
+        print(f"  {label:<14} poll {poll_us:6.1f} µs, visible after "
+              f"p50 {percentile(latencies_ms, 0.5):5.2f} ms, p99 {percentile(latencies_ms, 0.99):5.2f} ms "
+              f"({len(latencies):,} of {updates:,} updates seen)")
+        return poll_us
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        status_file = Path(tmp_dir) / "CaCallstatus.dat"
+        status_file.write_text("", encoding='utf-8')
+        
+        def write_file(i, content):
+            with open(status_file, 'w', encoding='utf-8') as f:
+                f.write(content)
+        
+        def open_file_reader():
+            # What a CRM polling the file does: stat, then read when it changed
+            last = {'mtime': None}
+            def poll():
+                mtime = os.stat(status_file).st_mtime_ns
+                if mtime == last['mtime']:
+                    return None
+                last['mtime'] = mtime
+                content = status_file.read_text(encoding='utf-8')
+                start = content.find("<Seq>")
+                return int(content[start + 5:content.find("</Seq>")]) if start >= 0 else None
+            return poll
+        
+        file_cost = run("status file", write_file, open_file_reader)
+        
+        region_path = Path(tmp_dir) / "CaCallstatus.shm"
+        writer = StatusRegionWriter(region_path)
+        
+        def open_region_reader():
+            reader = StatusRegionReader(region_path)
+            def poll():
+                if not reader.changed():
+                    return None
+                _, _, content = reader.read()
+                start = content.find("<Seq>")
+                return int(content[start + 5:content.find("</Seq>")]) if start >= 0 else None
+            return poll
+        
+        region_cost = run("shared memory", lambda i, content: writer.publish(content), open_region_reader)
+        writer.close()
+    
+    print(f"\n📊 Shared memory polls are {file_cost / region_cost:.0f}x cheaper than file polls")
+    return True
+
+def benchmark_event_replay(events=200_000, src_dir=SRC_DIR):
+    """Replay synthetic AMI traffic through the listener and measure per-event cost
+    
+    Pass the src directory of another checkout to measure that revision with
+    the same traffic, e.g. from a git worktree:
+        dev_tools.py replay 200000 /tmp/base/src
+    The revision needs SyntheticTraffic and AMIListenerThread.handle_event,
+    which arrived with the synthetic traffic engine (da75867, user-040);
+    older revisions are reported as a failed run.
+    """
+    print(f"⏱️  Benchmarking call event replay ({events:,} events, {src_dir})...")
+    
+    main = load_main_module(src_dir)
+    if not hasattr(main, 'SyntheticTraffic') or not hasattr(main.AMIListenerThread, 'handle_event'):
+        print("❌ This revision predates the synthetic traffic engine (da75867); nothing to replay")
+        return False
+    
+    try:
+        return run_event_replay(main, events)
+    except Exception as e:
+        print(f"❌ Event replay failed: {type(e).__name__}: {e}")
+        return False
+
+def run_event_replay(main, events):
+    """Measure retained memory, emit cost and cross-thread delivery for one revision"""
+    import threading
+    import tracemalloc
+    from PyQt6.QtCore import QCoreApplication
+    
+    app = QCoreApplication.instance() or QCoreApplication([])
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config = main.ConfigManager(tmp_dir).load_config()
+    config['agent']['extension'] = "100"
+    config['demo'].update(seed=1, calls_per_minute=60_000, extensions=["100"], ring_all_ratio=0)
+    
+    traffic = main.SyntheticTraffic(config['demo'], ["100"], seed=1)
+    fields = []
+    horizon = 0.0
+    while len(fields) < events:
+        horizon += 60
+        fields.extend(data for _, data in traffic.events_until(horizon))
+    fields = fields[:events]
+    
+    listener = main.AMIListenerThread(config)
+    # Only the event object and its signal are measured, not the disk sinks
+    listener.update_call_status_file = lambda call: None
+    
+    # Retained memory per delivered event
+    kept = []
+    listener.call_event.connect(kept.append)
+    sample = fields[:20_000]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for data in sample:
+        listener.handle_event(data)
+    per_event_bytes = (tracemalloc.get_traced_memory()[0] - before) / len(sample)
+    tracemalloc.stop()
+    listener.call_event.disconnect(kept.append)
+    kept.clear()
+    
+    # Cost of building and emitting events on the listener side
+    started = time.perf_counter()
+    for data in fields:
+        listener.handle_event(data)
+    emit_us = (time.perf_counter() - started) * 1_000_000 / events
+    
+    # Cross-thread delivery to a slot on the GUI thread, as in the application
+    received = [0]
+    def on_event(call):
+        received[0] += 1
+    listener.call_event.connect(on_event)
+    
+    errors = []
+    def produce():
+        try:
+            for data in fields:
+                listener.handle_event(data)
+        except Exception as e:
+            errors.append(e)
+    
+    producer = threading.Thread(target=produce)
+    started = time.perf_counter()
+    producer.start()
+    last_progress = (received[0], time.perf_counter())
+    while producer.is_alive() or received[0] < events:
+        app.processEvents()
+        if received[0] != last_progress[0]:
+            last_progress = (received[0], time.perf_counter())
+        # Give up once the producer is done and nothing has arrived for a while
+        elif not producer.is_alive() and (errors or time.perf_counter() - last_progress[1] > 10):
+            break
+    delivered_us = (time.perf_counter() - started) * 1_000_000 / events
+    producer.join()
+    
+    if errors:
+        raise errors[0]
+    if received[0] < events:
+        print(f"❌ Only {received[0]:,} of {events:,} events reached the GUI thread")
+        return False
+    
+    print(f"  retained per event   {per_event_bytes:8.0f} bytes")
+    print(f"  build + emit         {emit_us:8.2f} µs/event")
+    print(f"  cross-thread replay  {delivered_us:8.2f} µs/event")
+    return True
+
+def benchmark_journal(events=200_000, always_events=5000):
+    """Measure event journal throughput and fsync latency for each fsync policy"""
+    print(f"⏱️  Benchmarking event journal ({events:,} events, {always_events:,} for 'always')...")
+    
+    main = load_main_module()
+    calls = [
+        main.CallEvent("DialBegin" if i % 2 == 0 else "Hangup", f"0770{i % 10_000_000:07d}", "100",
+                       f"SIP/trunk-{i:08x}", f"1700000000.{i}", f"1700000000.{i}", "", "100",
+                       1_700_000_000 + i, float(i), "Caller Name", "", "mobile", "Mobile", 1)
+        for i in range(events)
+    ]
+    
+    print(f"  {'policy':<10}{'events/s':>12}{'MB/s':>9}{'fsyncs':>8}{'fsync p50':>11}{'fsync p99':>11}")
+    for policy in ("always", "interval", "os"):
+        batch = calls[:always_events] if policy == "always" else calls
+        main.metrics = main.MetricsRegistry()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            config = main.ConfigManager(tmp_dir).load_config()
+            config['journal'].update(fsync=policy, fsync_interval_ms=100)
+            errors = []
+            journal = main.EventJournal(Path(tmp_dir) / "journal", config, errors.append)
+            journal.start()
+            
+            started = time.perf_counter()
+            for call in batch:
+                # Measure sustained throughput, not how fast the bounded queue overflows
+                while journal.pending.full():
+                    time.sleep(0.0005)
+                journal.append(call)
+            journal.stop(timeout=600)
+            elapsed = time.perf_counter() - started
+            
+            if errors or journal.last_sequence() != len(batch):
+                print(f"❌ {policy}: journal incomplete {errors}")
+                return False
+            
+            written = sum(path.stat().st_size for path in journal.files())
+            fsync_count = main.metrics.histograms.get("journal.fsync_ms")
+            fsync_count = fsync_count.count if fsync_count else 0
+            p50, p99 = (main.metrics.quantile("journal.fsync_ms", q) for q in (0.5, 0.99))
+            latency = f"{p50:8.2f} ms{p99:8.2f} ms" if fsync_count else f"{'-':>11}{'-':>11}"
+            print(f"  {policy:<10}{len(batch) / elapsed:>12,.0f}{written / elapsed / 1e6:>9.1f}"
+                  f"{fsync_count:>8}{latency}")
+    return True
+
+def benchmark_journal_restore(size_mb=1024, budget_ms=200):
+    """Time startup restore from the tail of a large event journal"""
+    print(f"⏱️  Benchmarking call restore from a {size_mb:,} MB event journal...")
+    
+    main = load_main_module()
+    
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        config = main.ConfigManager(tmp_dir).load_config()
+        limit = config['journal']['restore_records']
+        journal = main.EventJournal(Path(tmp_dir) / "journal", config, print)
+        journal.directory.mkdir()
+        
+        # One file is the worst case: nothing can be skipped by file name
+        template = ('{{"seq":{0},"event":"{1}","caller_id":"0770{0:07d}","destination":"100",'
+                    '"channel":"SIP/trunk-{0:08x}","uniqueid":"1700000000.{0}","linkedid":"1700000000.{0}",'
+                    '"queue":"","extension":"100","wall_time":{2},"caller_name":"Caller Name",'
+                    '"account":"","category":"mobile","label":"Mobile","repeat_count":1}}\n')
+        events = ("DialBegin", "Bridge", "Hangup")
+        start_time = time.time() - 30 * 86400
+        seq = 0
+        with open(journal.directory / "events-20000101-000000-000000000001.jsonl", 'w') as f:
+            while f.tell() < size_mb * 1024 * 1024:
+                block = []
+                for _ in range(10_000):
+                    seq += 1
+                    block.append(template.format(seq, events[seq % 3], start_time + seq * 0.5))
+                f.write("".join(block))
+        last_time = start_time + seq * 0.5
+        
+        cases = [
+            ("clean shutdown", 0),
+            ("crash, 500 lost", 500),
+            ("empty history", None),
+        ]
+        
+        all_passed = True
+        for label, lost in cases:
+            store = main.CallHistoryStore(Path(tmp_dir) / f"{label}.db")
+            if lost is not None:
+                store.add({'ts': last_time - lost * 0.5, 'event': "Hangup"})
+                store.commit()
+            
+            started = time.perf_counter()
+            restored = store.restore_from_journal(journal, limit)
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            store.close()
+            
+            expected = limit if lost is None else lost
+            passed = elapsed_ms < budget_ms and restored == expected
+            all_passed &= passed
+            print(f"  {'✅' if passed else '❌'} {label:<16} {restored:5} restored in {elapsed_ms:7.1f} ms")
+    
+    print(f"  ({seq:,} events in the journal)")
+    if all_passed:
+        print(f"\n✅ Restores under {budget_ms} ms")
+    else:
+        print(f"\n❌ Restore exceeded {budget_ms} ms or restored the wrong records")
+    return all_passed
+
+def resident_memory_mb():
+    """Current RSS of this process (Linux)"""
+    with open('/proc/self/statm') as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+
+def soak_test(events=1_000_000, samples=20, rss_tolerance_mb=16, object_tolerance=0.05):
+    """Replay synthetic traffic through the full GUI pipeline and check memory stays flat
+    
+    Once the table row and log line caps are reached, RSS and the number of
+    live Python objects should stop growing; the test fails if the last
+    quarter of the run is still above the second quarter by more than the
+    tolerances. Samples are taken with the producer paused and every
+    backlog drained, since objects in flight between the threads otherwise
+    make single samples swing widely; each quarter is then represented by
+    its lowest sample.
+    """
+    print(f"🧪 Soak test: {events:,} synthetic events through the full pipeline...")
+    
+    os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+    main = load_main_module()
+    import gc
+    import itertools
+    import threading
+    from PyQt6.QtCore import Qt
+    from PyQt6.QtWidgets import QApplication
+    
+    app = QApplication.instance() or QApplication([])
+    with tempfile.TemporaryDirectory() as app_dir:
+        window = main.ListenerMainWindow(app_dir)
+        window.show()
+        config = window.config
+        config['agent']['extension'] = "100"
+        config['agent']['callstatus_file'] = str(Path(app_dir) / "data" / "CaCallstatus.dat")
+        config['demo'].update(seed=1, calls_per_minute=6000, extensions=["100", "101"], ring_all_ratio=0.2)
+        
+        def traffic():
+            # Generated lazily: a million pre-built events would dwarf what is measured
+            generator = main.SyntheticTraffic(config['demo'], ["100", "101"], seed=1)
+            horizon = 0.0
+            while True:
+                horizon += 60
+                for _, data in generator.events_until(horizon):
+                    yield data
+        
+        # Same wiring as start_listener, fed by a producer thread instead of the PBX
+        listener = window.create_listener()
+        listener.status_writer.start()
+        emitted = [0]
+        delivered = [0]
+        listener.call_event.connect(lambda call: emitted.__setitem__(0, emitted[0] + 1),
+                                    Qt.ConnectionType.DirectConnection)
+        listener.call_event.connect(lambda call: delivered.__setitem__(0, delivered[0] + 1))
+        
+        produced = [0]
+        journal = window.journal
+        running = threading.Event()
+        running.set()
+        def produce():
+            for data in itertools.islice(traffic(), events):
+                running.wait()
+                listener.handle_event(data)
+                produced[0] += 1
+                # Keep the queued signal and journal backlogs small so they are
+                # not mistaken for a leak, and so the journal never drops events
+                while (emitted[0] - delivered[0] > 2000 or
+                       journal.pending.qsize() > journal.MAX_BATCH * 2):
+                    time.sleep(0.001)
+        
+        producer = threading.Thread(target=produce, daemon=True)
+        rows = []
+        next_sample = 0
+        started = time.perf_counter()
+        producer.start()
+        
+        def drained():
+            return (delivered[0] >= emitted[0] and journal.pending.empty() and
+                    listener.status_writer.pending.empty())
+        
+        while producer.is_alive() or not drained():
+            app.processEvents()
+            if produced[0] >= next_sample or not producer.is_alive():
+                running.clear()
+                while not drained():
+                    app.processEvents()
+                    time.sleep(0.001)
+                gc.collect()
+                rows.append((produced[0], resident_memory_mb(), len(gc.get_objects()),
+                             window.call_model.rowCount(), window.log_display.document().blockCount()))
+                print(f"  {rows[-1][0]:>10,} events  RSS {rows[-1][1]:7.1f} MB  objects {rows[-1][2]:>9,}  "
+                      f"table rows {rows[-1][3]:>5}  log lines {rows[-1][4]:>5}")
+                next_sample += events // samples
+                running.set()
+        elapsed = time.perf_counter() - started
+        
+        # Every thread writing into app_dir must be gone before it is deleted
+        listener.status_writer.stop()
+        listener.status_writer.thread.join(10)
+        listener.enricher.stop()
+        window.loop_monitor.stop()
+        window.watchdog.stop()
+        journal.stop()
+        dropped = main.metrics.counters.get("journal.dropped", 0)
+        window.call_store.close()
+        window.deleteLater()
+    
+    quarter = max(len(rows) // 4, 1)
+    second = rows[quarter:2 * quarter] or rows[:1]
+    last = rows[-quarter:]
+    rss_growth = min(r[1] for r in last) - min(r[1] for r in second)
+    object_growth = min(r[2] for r in last) / min(r[2] for r in second) - 1
+    
+    print(f"\n  {events / elapsed:,.0f} events/s; caps: {config['ui']['max_table_rows']} table rows, "
+          f"{config['logging']['max_display_lines']} log lines")
+    print(f"  RSS growth after warm-up      {rss_growth:+.1f} MB (limit {rss_tolerance_mb} MB)")
+    print(f"  Object growth after warm-up   {object_growth:+.1%} (limit {object_tolerance:.0%})")
+    
+    print(f"  Journal events dropped        {dropped}")
+    
+    passed = rss_growth <= rss_tolerance_mb and object_growth <= object_tolerance and not dropped
+    print("✅ Memory stays within budget" if passed else "❌ Memory keeps growing past the configured caps")
+    return passed
 
 def main():
     """Main development tools menu"""
@@ -227,10 +945,19 @@ def main():
         print("   5. Clean development files")
         print("   6. Run quick test")
         print("   7. Run full check (all tests)")
+        print("   8. Benchmark call history search")
+        print("   9. Benchmark number classification")
+        print("  10. Benchmark call status outputs")
+        print("  11. Benchmark call event replay")
+        print("  12. Soak test (memory over 1M events)")
+        print("  13. Benchmark event journal")
+        print("  14. Benchmark call restore from journal (1 GB)")
+        print("  15. Replay real AMI events")
+        print("  16. Check repeat caller counting")
         print("   0. Exit")
         
         try:
-            choice = input("\nSelect option (0-7): ").strip()
+            choice = input("\nSelect option (0-16): ").strip()
             
             if choice == '0':
                 print("👋 Goodbye!")
@@ -259,6 +986,24 @@ def main():
                     print("\n🎉 All checks passed! Ready for development.")
                 else:
                     print("\n❌ Some checks failed. Please review the issues above.")
+            elif choice == '8':
+                benchmark_history_search()
+            elif choice == '9':
+                benchmark_prefix_classifier()
+            elif choice == '10':
+                benchmark_status_outputs()
+            elif choice == '11':
+                benchmark_event_replay()
+            elif choice == '12':
+                soak_test()
+            elif choice == '13':
+                benchmark_journal()
+            elif choice == '14':
+                benchmark_journal_restore()
+            elif choice == '15':
+                test_ami_replay()
+            elif choice == '16':
+                test_repeat_callers()
             else:
                 print("❌ Invalid option. Please try again.")
                 
@@ -269,4 +1014,10 @@ def main():
             print(f"❌ Error: {e}")
 
 if __name__ == "__main__":
+    # Non-interactive entries for CI: dev_tools.py soak [events]
+    # and dev_tools.py replay [events] [src_dir]
+    if sys.argv[1:2] == ['soak']:
+        sys.exit(0 if soak_test(*map(int, sys.argv[2:3])) else 1)
+    if sys.argv[1:2] == ['replay']:
+        sys.exit(0 if benchmark_event_replay(*map(int, sys.argv[2:3]), *sys.argv[3:4]) else 1)
     main()
\ No newline at end of file
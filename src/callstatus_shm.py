@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Listener Professional v4.0 - Shared Memory Call Status
+Memory-mapped call status region with a sequence-lock header.
+
+The region is a fixed-size file that the listener maps and rewrites in
+place. Readers map the same file and poll the sequence number, which the
+writer makes odd while a record is being written and even once it is
+complete, so a reader can detect a change with a single memory read and
+take a consistent copy without any locking.
+
+Layout (little-endian):
+    0   4s   magic b"LCS1"
+    4   I    layout version
+    8   Q    sequence (odd while a write is in progress)
+    16  Q    time of the last update in ns since the epoch
+    24  I    payload length in bytes
+    28  I    payload capacity in bytes
+    32  ...  UTF-8 payload (the same XML record as CaCallstatus.dat, empty when idle)
+
+This module only uses the standard library so CRM integrations can copy it.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+
+MAGIC = b"LCS1"
+VERSION = 1
+HEADER = struct.Struct("<4sIQQII")
+SEQUENCE = struct.Struct("<Q")
+RECORD_INFO = struct.Struct("<QI")
+SEQUENCE_OFFSET = 8
+RECORD_INFO_OFFSET = 16
+PAYLOAD_OFFSET = HEADER.size
+DEFAULT_CAPACITY = 16 * 1024
+
+class StatusRegionWriter:
+    """Single writer that publishes call records into the shared region"""
+    
+    def __init__(self, path, capacity=DEFAULT_CAPACITY):
+        self.path = str(path)
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        size = PAYLOAD_OFFSET + capacity
+        
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, 'O_BINARY', 0), 0o644)
+        try:
+            if os.fstat(fd).st_size != size:
+                os.ftruncate(fd, size)
+            self.map = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        
+        magic, version, sequence, _, _, _ = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            sequence = 0
+        # Keep counting from an existing region so readers never see the sequence go back
+        self.sequence = sequence + (sequence & 1)
+        HEADER.pack_into(self.map, 0, MAGIC, VERSION, self.sequence, 0, 0, capacity)
+    
+    def publish(self, text):
+        """Replace the current record; an empty string means no active call"""
+        payload = text.encode('utf-8')
+        if len(payload) > self.capacity:
+            raise ValueError(f"call record is {len(payload)} bytes, region holds {self.capacity}")
+        
+        with self.lock:
+            SEQUENCE.pack_into(self.map, SEQUENCE_OFFSET, self.sequence + 1)
+            self.map[PAYLOAD_OFFSET:PAYLOAD_OFFSET + len(payload)] = payload
+            RECORD_INFO.pack_into(self.map, RECORD_INFO_OFFSET, time.time_ns(), len(payload))
+            # The even sequence goes last so it only appears once the record is complete
+            self.sequence += 2
+            SEQUENCE.pack_into(self.map, SEQUENCE_OFFSET, self.sequence)
+        return self.sequence
+    
+    def close(self):
+        self.map.close()
+
+class StatusRegionReader:
+    """Lock-free reader for a region published by StatusRegionWriter"""
+    
+    def __init__(self, path):
+        self.path = str(path)
+        with open(self.path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        
+        magic, version, _, _, _, _ = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.map.close()
+            raise ValueError(f"{self.path} is not a call status region")
+        self.last_sequence = None
+    
+    def sequence(self):
+        """Current sequence number; one memory read, suitable for tight polling"""
+        return SEQUENCE.unpack_from(self.map, SEQUENCE_OFFSET)[0]
+    
+    def changed(self):
+        """Whether a new record was published since the last read()"""
+        return self.sequence() != self.last_sequence
+    
+    def read(self, max_attempts=1000):
+        """Return a consistent (sequence, updated_ns, text) snapshot"""
+        for _ in range(max_attempts):
+            before = self.sequence()
+            if before & 1:
+                continue
+            
+            _, _, _, updated_ns, length, capacity = HEADER.unpack_from(self.map, 0)
+            payload = self.map[PAYLOAD_OFFSET:PAYLOAD_OFFSET + min(length, capacity)]
+            
+            if self.sequence() == before:
+                self.last_sequence = before
+                return before, updated_ns, payload.decode('utf-8')
+        raise TimeoutError("call status region is being rewritten continuously")
+    
+    def wait_for_change(self, timeout=None, poll_interval=0.01):
+        """Poll until a new record is published, returning it or None on timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.changed():
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            time.sleep(poll_interval)
+        return self.read()
+    
+    def close(self):
+        self.map.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+if __name__ == "__main__":
+    # Print records as they are published: python callstatus_shm.py <region file>
+    import sys
+    
+    with StatusRegionReader(sys.argv[1]) as reader:
+        while True:
+            sequence, updated_ns, text = reader.wait_for_change()
+            print(f"--- #{sequence} at {time.strftime('%H:%M:%S', time.localtime(updated_ns / 1e9))}")
+            print(text or "(no active call)")
@@ -8,12 +8,30 @@ Developed by MiniMax Agent
 import sys
 import os
 import json
+import math
+import queue
+import random
 import base64
+import copy
+import csv
+import gzip
+import heapq
+import inspect
+import cProfile
+import pstats
+import tracemalloc
 import socket
+import hmac
+import hashlib
+import ipaddress
+import secrets
+import sqlite3
 import threading
 import time
+from collections import OrderedDict, deque, namedtuple
 from datetime import datetime
 from pathlib import Path
+from xml.sax.saxutils import escape
 
 # PyQt6 imports
 from PyQt6.QtWidgets import (
@@ -21,23 +39,39 @@ from PyQt6.QtWidgets import (
     QTabWidget, QLabel, QLineEdit, QPushButton, QTextEdit, QTableWidget,
     QTableWidgetItem, QFileDialog, QMessageBox, QProgressBar, QStatusBar,
     QFrame, QGroupBox, QGridLayout, QCheckBox, QSpinBox, QSplitter,
-    QScrollArea, QComboBox, QSystemTrayIcon, QMenu
+    QScrollArea, QComboBox, QSystemTrayIcon, QMenu, QTableView, QDateTimeEdit,
+    QAbstractItemView, QProgressDialog
 )
 from PyQt6.QtCore import (
-    QThread, pyqtSignal, QTimer, QSettings, Qt, QSize, QRect
+    QThread, pyqtSignal, QTimer, QSettings, Qt, QSize, QRect,
+    QAbstractTableModel, QModelIndex, QDateTime, QFileSystemWatcher, QObject
 )
 from PyQt6.QtGui import (
     QIcon, QFont, QPixmap, QPalette, QColor, QAction
 )
 
+from callstatus_shm import StatusRegionWriter
+
 # Configuration manager
 class ConfigManager:
     """Manages application configuration and security"""
     
+    LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR")
+    
+    # String settings restricted to a fixed set of values
+    CHOICES = {
+        ('logging', 'level'): LOG_LEVELS,
+        ('broker', 'mode'): ("direct", "broker", "client"),
+        ('journal', 'fsync'): ("always", "interval", "os"),
+        ('demo', 'hold_distribution'): ("lognormal", "exponential", "uniform", "fixed"),
+    }
+    
     def __init__(self, app_dir):
         self.app_dir = Path(app_dir)
         self.config_dir = self.app_dir / "config"
         self.config_file = self.config_dir / "config.json"
+        self.last_saved_text = None
+        self.problems = []
         self.ensure_directories()
         self.default_config = {
             "pbx": {
@@ -45,23 +79,90 @@ class ConfigManager:
                 "port": 5038,
                 "username": "",
                 "password": "",
-                "enabled": False
+                "enabled": False,
+                "endpoints": []
             },
             "agent": {
                 "extension": "",
                 "callstatus_file": str(self.app_dir / "data" / "CaCallstatus.dat"),
-                "auto_clear_delay": 3
+                "auto_clear_delay": 3,
+                "shared_status_file": ""
             },
             "ui": {
                 "theme": "light",
                 "window_geometry": "800x600",
                 "auto_start": False,
-                "minimize_to_tray": True
+                "minimize_to_tray": True,
+                "ring_notification": False,
+                "max_table_rows": 1000
+            },
+            "diagnostics": {
+                "control_port": 0
+            },
+            "watchdog": {
+                "enabled": True,
+                "reader_deadline_seconds": 30,
+                "writer_deadline_seconds": 10,
+                "gui_deadline_seconds": 5
             },
             "logging": {
                 "level": "INFO",
                 "max_files": 30,
-                "max_size_mb": 10
+                "max_size_mb": 10,
+                "max_display_lines": 5000
+            },
+            "journal": {
+                "enabled": True,
+                "fsync": "interval",
+                "fsync_interval_ms": 1000,
+                "max_size_mb": 50,
+                "max_files": 60,
+                "restore_records": 1000
+            },
+            "export": {
+                "enabled": False,
+                "folder": str(self.app_dir / "exports"),
+                "interval_hours": 24,
+                "compress": False
+            },
+            "enrichment": {
+                "phonebook_file": "",
+                "country_code": "964",
+                "cache_size": 4096,
+                "cache_ttl": 300,
+                "reload_interval": 5
+            },
+            "classification": {
+                "rules_file": "",
+                "suppress_categories": ["blocked"]
+            },
+            "repeat_caller": {
+                "window_minutes": 60,
+                "threshold": 3,
+                "buckets": 12,
+                "max_tracked": 50000
+            },
+            "broker": {
+                "mode": "direct",
+                "host": "127.0.0.1",
+                "port": 5039,
+                "secret": "",
+                "key": ""
+            },
+            "demo": {
+                "seed": 0,
+                "calls_per_minute": 2.0,
+                "speed": 1.0,
+                "extensions": ["100", "101", "102", "103"],
+                "caller_pool": 2000,
+                "ring_all_ratio": 0.2,
+                "answer_ratio": 0.85,
+                "transfer_ratio": 0.1,
+                "ring_min_seconds": 2.0,
+                "ring_max_seconds": 15.0,
+                "hold_distribution": "lognormal",
+                "hold_mean_seconds": 180.0,
+                "hold_sigma": 0.8
             }
         }
     
@@ -77,100 +178,2475 @@ class ConfigManager:
             return ""
         return base64.b64encode(password.encode()).decode()
     
-    def decrypt_password(self, encrypted_password):
-        """Decrypt password"""
-        if not encrypted_password:
-            return ""
+    def decrypt_password(self, encrypted_password):
+        """Decrypt password"""
+        if not encrypted_password:
+            return ""
+        try:
+            return base64.b64decode(encrypted_password.encode()).decode()
+        except:
+            return ""
+    
+    def defaults(self):
+        """Return an independent copy of the default configuration"""
+        return copy.deepcopy(self.default_config)
+    
+    @staticmethod
+    def deep_merge(base, overrides):
+        """Recursively merge overrides into a copy of base"""
+        result = copy.deepcopy(base)
+        for key, value in overrides.items():
+            if isinstance(value, dict) and isinstance(result.get(key), dict):
+                result[key] = ConfigManager.deep_merge(result[key], value)
+            else:
+                result[key] = copy.deepcopy(value)
+        return result
+    
+    def validate(self, config, defaults=None, path=""):
+        """Coerce values to the type of their default, returning a list of problems"""
+        if defaults is None:
+            defaults = self.default_config
+        problems = []
+        
+        for key, default in defaults.items():
+            name = f"{path}{key}"
+            value = config.get(key)
+            
+            if isinstance(default, dict):
+                if isinstance(value, dict):
+                    problems.extend(self.validate(value, default, f"{name}."))
+                else:
+                    config[key] = copy.deepcopy(default)
+                    problems.append(f"{name} must be a section, using defaults")
+                continue
+            
+            coerced = self.coerce(value, default)
+            if coerced is None:
+                config[key] = copy.deepcopy(default)
+                problems.append(f"{name} has invalid value {value!r}, using {default!r}")
+            else:
+                config[key] = coerced
+        
+        return problems
+    
+    @staticmethod
+    def coerce(value, default):
+        """Convert value to the type of default, or return None if it cannot be"""
+        if isinstance(default, bool):
+            if isinstance(value, bool):
+                return value
+            if isinstance(value, str) and value.lower() in ("true", "false"):
+                return value.lower() == "true"
+            return None
+        if isinstance(default, (int, float)):
+            if isinstance(value, bool):
+                return None
+            try:
+                return type(default)(value)
+            except (TypeError, ValueError):
+                return None
+        if isinstance(default, str):
+            return value if isinstance(value, str) else None
+        if isinstance(default, list):
+            return list(value) if isinstance(value, (list, tuple)) else None
+        return value
+    
+    def read_config_text(self):
+        """Return the raw config file contents, or None if it is missing"""
+        try:
+            with open(self.config_file, 'r', encoding='utf-8') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+    
+    def parse_config(self, text):
+        """Deep-merge config text over the defaults and validate it"""
+        overrides = json.loads(text)
+        if not isinstance(overrides, dict):
+            raise ValueError("config root must be an object")
+        
+        result = self.deep_merge(self.default_config, overrides)
+        self.problems = self.validate(result)
+        
+        for (section, key), choices in self.CHOICES.items():
+            value = result[section][key]
+            match = next((choice for choice in choices if choice.lower() == value.lower()), None)
+            if match is None:
+                match = self.default_config[section][key]
+                self.problems.append(f"{section}.{key} has invalid value {value!r}, using {match!r}")
+            result[section][key] = match
+        
+        # Decrypt password
+        if result['pbx']['password']:
+            result['pbx']['password'] = self.decrypt_password(result['pbx']['password'])
+        
+        return result
+    
+    def load_config(self):
+        """Load configuration from file"""
+        self.problems = []
+        try:
+            text = self.read_config_text()
+            if text is None:
+                return self.defaults()
+            self.last_saved_text = text
+            return self.parse_config(text)
+        except Exception as e:
+            print(f"Error loading config: {e}")
+            return self.defaults()
+    
+    def save_config(self, config):
+        """Save configuration to file if it differs from what was last written"""
+        try:
+            # Encrypt password before saving
+            config_to_save = copy.deepcopy(config)
+            if config_to_save['pbx']['password']:
+                config_to_save['pbx']['password'] = self.encrypt_password(config_to_save['pbx']['password'])
+            
+            text = json.dumps(config_to_save, indent=4, ensure_ascii=False)
+            if text == self.last_saved_text:
+                return True
+            
+            atomic_write_text(self.config_file, text)
+            self.last_saved_text = text
+            return True
+        except Exception as e:
+            print(f"Error saving config: {e}")
+            return False
+
+def atomic_write_text(path, text):
+    """Write text through a temp file so readers never see a partial file"""
+    path = Path(path)
+    temp_file = path.with_name(path.name + ".tmp")
+    
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
+
+def atomic_write_json(path, data, **dump_options):
+    """Write JSON through a temp file so readers never see a partial file"""
+    atomic_write_text(path, json.dumps(data, **dump_options))
+
+def file_signature(stat):
+    """Identify one version of a file from its stat result
+    
+    The inode changes when another program replaces the file, and
+    mtime_ns plus size change when it rewrites it in place.
+    """
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+def write_status_text(path, text):
+    """Write the call status file and return the signature of this write
+    
+    The signature comes from the open handle, so a change another program
+    makes right after us is never mistaken for our own write.
+    """
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        return file_signature(os.fstat(f.fileno()))
+
+# Call events
+def format_timestamp(ts):
+    """Format an epoch time the way call history displays it"""
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S")
+
+class CallEvent(namedtuple('CallEvent', [
+    'event', 'caller_id', 'destination', 'channel', 'uniqueid', 'linkedid', 'queue',
+    'extension', 'wall_time', 'mono_time',
+    'caller_name', 'account', 'category', 'label', 'repeat_count',
+], defaults=('', '', '', '', 0))):
+    """Immutable call event passed from the listener to the GUI
+    
+    wall_time is the epoch time the event was received and mono_time the
+    matching time.monotonic() reading; the display string is only built
+    when something asks for timestamp.
+    """
+    
+    __slots__ = ()
+    
+    @property
+    def timestamp(self):
+        return format_timestamp(self.wall_time)
+    
+    def to_record(self):
+        """Row for the call history store"""
+        return {
+            'ts': self.wall_time,
+            'event': self.event,
+            'caller_id': self.caller_id,
+            'destination': self.destination,
+            'channel': self.channel,
+            'uniqueid': self.uniqueid,
+            'extension': self.extension,
+            'caller_name': self.caller_name,
+            'account': self.account,
+            'category': self.category,
+            'label': self.label,
+            'repeat_count': self.repeat_count,
+        }
+    
+    @classmethod
+    def from_dict(cls, data, **overrides):
+        """Rebuild an event sent as JSON, ignoring unknown keys"""
+        fields = {name: data[name] for name in cls._fields if name in data}
+        fields.update(overrides)
+        return cls(**fields)
+
+# Call history store
+class CallHistoryStore:
+    """SQLite-backed call history with indexed filtering"""
+    
+    COLUMNS = [
+        ('ts', 'REAL'),
+        ('timestamp', 'TEXT'),
+        ('event', 'TEXT'),
+        ('caller_id', 'TEXT'),
+        ('destination', 'TEXT'),
+        ('channel', 'TEXT'),
+        ('uniqueid', 'TEXT'),
+        ('extension', 'TEXT'),
+        ('caller_name', 'TEXT'),
+        ('account', 'TEXT'),
+        ('category', 'TEXT'),
+        ('label', 'TEXT'),
+        ('repeat_count', 'INTEGER'),
+    ]
+    
+    # Every index ends in ts (plus the implicit rowid) so filtered pages
+    # come back already in display order without a sort step
+    INDEXES = {
+        'idx_calls_ts': 'ts',
+        'idx_calls_caller_id': 'caller_id, ts',
+        'idx_calls_event': 'event, ts',
+        'idx_calls_extension': 'extension, ts',
+        'idx_calls_category': 'category, ts',
+    }
+    
+    # Rows stored without a formatted timestamp get one from ts when read
+    SELECT_COLUMNS = ", ".join(["id"] + [
+        "COALESCE(NULLIF(timestamp, ''), strftime('%Y-%m-%d %H:%M:%S', ts, 'unixepoch', 'localtime')) "
+        "AS timestamp" if name == 'timestamp' else name
+        for name, _ in COLUMNS
+    ])
+    
+    COMMIT_INTERVAL = 1.0   # seconds between batched commits
+    COMMIT_BATCH = 500      # rows that force an early commit
+    DENSE_PREFIX_ROWS = 2000  # prefix matches above which a ts-ordered scan wins
+    
+    def __init__(self, db_file):
+        self.db_file = str(db_file)
+        self.conn = self.connect()
+        self.pending = 0
+        self.last_commit = time.monotonic()
+        self.create_schema()
+    
+    def connect(self):
+        """Open a new connection; each thread must use its own"""
+        conn = sqlite3.connect(self.db_file)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+    
+    def create_schema(self):
+        """Create the calls table, add missing columns and indexes"""
+        columns = ", ".join(f"{name} {kind}" for name, kind in self.COLUMNS)
+        # AUTOINCREMENT keeps ids unique after a clear, which incremental
+        # exports rely on for their high-water mark
+        self.conn.execute(f"CREATE TABLE IF NOT EXISTS calls (id INTEGER PRIMARY KEY AUTOINCREMENT, {columns})")
+        
+        existing = {row['name'] for row in self.conn.execute("PRAGMA table_info(calls)")}
+        for name, kind in self.COLUMNS:
+            if name not in existing:
+                self.conn.execute(f"ALTER TABLE calls ADD COLUMN {name} {kind}")
+        self.conn.commit()
+        
+        table_sql = self.conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'calls'").fetchone()[0]
+        if 'AUTOINCREMENT' not in table_sql.upper():
+            self.migrate_autoincrement(columns)
+        
+        for index_name, index_columns in self.INDEXES.items():
+            self.conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON calls ({index_columns})")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value)")
+        self.conn.commit()
+    
+    def migrate_autoincrement(self, columns):
+        """Rebuild a calls table created before ids were AUTOINCREMENT
+        
+        Copies the rows with their ids into a new table in one transaction;
+        the indexes go with the old table and are recreated by the caller.
+        """
+        names = ", ".join(["id"] + [name for name, _ in self.COLUMNS])
+        self.conn.executescript(f"""
+            BEGIN;
+            CREATE TABLE calls_migrated (id INTEGER PRIMARY KEY AUTOINCREMENT, {columns});
+            INSERT INTO calls_migrated ({names}) SELECT {names} FROM calls;
+            DROP TABLE calls;
+            ALTER TABLE calls_migrated RENAME TO calls;
+            COMMIT;
+        """)
+    
+    def add(self, call_info):
+        """Insert a call record and return its row id"""
+        values = [call_info.get('ts') or time.time()]
+        values += [call_info.get(name, '') for name, _ in self.COLUMNS[1:]]
+        placeholders = ", ".join("?" for _ in self.COLUMNS)
+        names = ", ".join(name for name, _ in self.COLUMNS)
+        
+        cursor = self.conn.execute(f"INSERT INTO calls ({names}) VALUES ({placeholders})", values)
+        self.pending += 1
+        
+        if (self.pending >= self.COMMIT_BATCH or
+                time.monotonic() - self.last_commit >= self.COMMIT_INTERVAL):
+            self.commit()
+        return cursor.lastrowid
+    
+    def commit(self):
+        """Commit pending inserts"""
+        if self.pending:
+            self.conn.commit()
+            self.pending = 0
+        self.last_commit = time.monotonic()
+    
+    @staticmethod
+    def prefix_bounds(prefix):
+        """Return the caller_id range that covers a prefix"""
+        return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+    
+    def is_dense_prefix(self, prefix, conn=None):
+        """Check whether a caller prefix matches too many rows to sort"""
+        conn = conn or self.conn
+        row = conn.execute(
+            "SELECT count(*) FROM (SELECT 1 FROM calls WHERE caller_id >= ? AND caller_id < ? LIMIT ?)",
+            [*self.prefix_bounds(prefix), self.DENSE_PREFIX_ROWS]
+        ).fetchone()
+        return row[0] >= self.DENSE_PREFIX_ROWS
+    
+    def build_where(self, filters, conn=None):
+        """Build a WHERE clause that the indexes can serve"""
+        clauses = []
+        params = []
+        
+        prefix = filters.get('caller_prefix')
+        if prefix:
+            # Range scan instead of LIKE so the caller_id index is used.
+            # A short prefix like "07" matches most rows; sorting all of them
+            # is slower than walking the ts order until a page is full, so
+            # the unary + keeps the planner off the caller_id index.
+            column = "+caller_id" if self.is_dense_prefix(prefix, conn) else "caller_id"
+            clauses.append(f"{column} >= ? AND {column} < ?")
+            params += list(self.prefix_bounds(prefix))
+        
+        if filters.get('date_from') is not None:
+            clauses.append("ts >= ?")
+            params.append(filters['date_from'])
+        
+        if filters.get('date_to') is not None:
+            clauses.append("ts < ?")
+            params.append(filters['date_to'])
+        
+        if filters.get('event'):
+            clauses.append("event = ?")
+            params.append(filters['event'])
+        
+        if filters.get('extension'):
+            clauses.append("extension = ?")
+            params.append(filters['extension'])
+        
+        if filters.get('category'):
+            clauses.append("category = ?")
+            params.append(filters['category'])
+        
+        if filters.get('after_id') is not None:
+            clauses.append("id > ?")
+            params.append(filters['after_id'])
+        
+        where = (" WHERE " + " AND ".join(clauses)) if clauses else ""
+        return where, params
+    
+    @staticmethod
+    def matches(call_info, filters):
+        """Check a single record against filters without touching the database"""
+        prefix = filters.get('caller_prefix')
+        if prefix and not call_info.get('caller_id', '').startswith(prefix):
+            return False
+        
+        ts = call_info.get('ts') or time.time()
+        if filters.get('date_from') is not None and ts < filters['date_from']:
+            return False
+        if filters.get('date_to') is not None and ts >= filters['date_to']:
+            return False
+        
+        if filters.get('event') and call_info.get('event') != filters['event']:
+            return False
+        if filters.get('extension') and call_info.get('extension') != filters['extension']:
+            return False
+        if filters.get('category') and call_info.get('category') != filters['category']:
+            return False
+        return True
+    
+    def query(self, filters, before=None, limit=200):
+        """Return one page of matching records, newest first
+        
+        before is the (ts, id) of the last row of the previous page.
+        """
+        where, params = self.build_where(filters)
+        
+        if before is not None:
+            where += (" AND " if where else " WHERE ") + "(ts, id) < (?, ?)"
+            params += list(before)
+        
+        sql = f"SELECT {self.SELECT_COLUMNS} FROM calls{where} ORDER BY ts DESC, id DESC LIMIT ?"
+        params.append(limit)
+        return [dict(row) for row in self.conn.execute(sql, params)]
+    
+    def count(self, filters, conn=None):
+        """Count matching records"""
+        conn = conn or self.conn
+        where, params = self.build_where(filters, conn)
+        return conn.execute(f"SELECT count(*) FROM calls{where}", params).fetchone()[0]
+    
+    def iter_chunks(self, filters, chunk_size=5000, conn=None, by_id=False):
+        """Yield matching records oldest first, one chunk at a time
+        
+        Uses keyset paging so memory stays at one chunk regardless of
+        history size. Pass a thread-local connection from connect() when
+        iterating outside the GUI thread. by_id orders by insertion, which
+        lets an after_id filter seek straight to new rows.
+        """
+        conn = conn or self.conn
+        where, params = self.build_where(filters, conn)
+        after = None
+        
+        while True:
+            page_where = where
+            page_params = list(params)
+            if after is not None:
+                if by_id:
+                    page_where += (" AND " if page_where else " WHERE ") + "id > ?"
+                    page_params.append(after)
+                else:
+                    page_where += (" AND " if page_where else " WHERE ") + "(ts, id) > (?, ?)"
+                    page_params += list(after)
+            
+            order = "id" if by_id else "ts, id"
+            sql = f"SELECT {self.SELECT_COLUMNS} FROM calls{page_where} ORDER BY {order} LIMIT ?"
+            page_params.append(chunk_size)
+            chunk = conn.execute(sql, page_params).fetchall()
+            
+            if not chunk:
+                return
+            yield chunk
+            
+            if len(chunk) < chunk_size:
+                return
+            last = chunk[-1]
+            after = last['id'] if by_id else (last['ts'], last['id'])
+    
+    def restore_point(self):
+        """Wall time up to which the store is complete: its newest row or the last clear"""
+        newest = self.conn.execute("SELECT max(ts) FROM calls").fetchone()[0]
+        cleared = self.conn.execute("SELECT value FROM meta WHERE key = 'cleared_at'").fetchone()
+        return max(newest or 0, cleared[0] if cleared else 0)
+    
+    def restore_from_journal(self, journal, limit):
+        """Re-add journal records newer than the store, e.g. inserts lost in a crash
+        
+        Only the tail of the journal past restore_point() is read, so the
+        cost does not grow with journal size. Returns the number added.
+        """
+        added = 0
+        for record in journal.recent(limit, after=self.restore_point()):
+            try:
+                call = CallEvent.from_dict(record, mono_time=0.0)
+            except TypeError:
+                continue
+            self.add(call.to_record())
+            added += 1
+        self.commit()
+        return added
+    
+    def clear(self):
+        """Delete all stored call records"""
+        self.conn.execute("DELETE FROM calls")
+        # Keeps restore_from_journal from bringing the cleared calls back
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('cleared_at', ?)", [time.time()])
+        self.conn.commit()
+        self.pending = 0
+    
+    def close(self):
+        """Commit and close the connection"""
+        try:
+            self.commit()
+            self.conn.close()
+        except sqlite3.Error:
+            pass
+
+# Caller ID enrichment
+def normalize_number(number, country_code="", partial=False):
+    """Reduce a phone number to national form (0770...), keeping 00 for foreign numbers
+    
+    With partial=True the input is a number prefix, so the international
+    form (+964 or 00964) is converted however short it is; a bare country
+    code still needs a full-length number to be told apart.
+    """
+    raw = str(number).strip()
+    digits = "".join(ch for ch in raw if ch.isdigit())
+    
+    if raw.startswith("+"):
+        digits = "00" + digits
+    
+    if country_code:
+        for prefix in ("00" + country_code, country_code):
+            if not digits.startswith(prefix):
+                continue
+            if len(digits) > len(prefix) + 6 or (partial and prefix.startswith("00") and len(digits) > len(prefix)):
+                return "0" + digits[len(prefix):]
+    return digits
+
+class LRUCache:
+    """Bounded least-recently-used cache with per-entry expiry"""
+    
+    MISSING = object()
+    
+    def __init__(self, max_size=4096, ttl=300):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def get(self, key):
+        """Return a cached value or LRUCache.MISSING"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return self.MISSING
+            
+            value, expires = entry
+            if expires < time.monotonic():
+                del self.entries[key]
+                return self.MISSING
+            
+            self.entries.move_to_end(key)
+            return value
+    
+    def put(self, key, value):
+        """Store a value, evicting the least recently used entry if full"""
+        with self.lock:
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+    
+    def clear(self):
+        """Drop all entries"""
+        with self.lock:
+            self.entries.clear()
+
+class Phonebook:
+    """In-memory index of a CSV or SQLite phonebook
+    
+    CSV files need a header with number, name and account columns.
+    SQLite files need a phonebook table with the same columns.
+    """
+    
+    NUMBER_COLUMNS = ('number', 'phone', 'caller_id', 'callerid')
+    NAME_COLUMNS = ('name', 'customer', 'customer_name')
+    ACCOUNT_COLUMNS = ('account', 'account_id', 'customer_id')
+    
+    def __init__(self, path, country_code=""):
+        self.path = str(path)
+        self.country_code = country_code
+        self.index = {}
+        self.mtime = None
+    
+    def normalize(self, number):
+        """Reduce a number to the form used as index key"""
+        return normalize_number(number, self.country_code)
+    
+    @staticmethod
+    def pick(row, names):
+        """Return the first present column value from a row"""
+        for name in names:
+            if row.get(name):
+                return str(row[name]).strip()
+        return ""
+    
+    def read_rows(self):
+        """Yield phonebook rows as dicts with lower-case keys"""
+        if self.path.lower().endswith(('.db', '.sqlite', '.sqlite3')):
+            conn = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+            conn.row_factory = sqlite3.Row
+            try:
+                for row in conn.execute("SELECT * FROM phonebook"):
+                    yield {key.lower(): row[key] for key in row.keys()}
+            finally:
+                conn.close()
+        else:
+            with open(self.path, 'r', newline='', encoding='utf-8-sig') as f:
+                for row in csv.DictReader(f):
+                    yield {(key or '').strip().lower(): value for key, value in row.items()}
+    
+    def load(self):
+        """Build a fresh index; the old one stays in use until this succeeds"""
+        mtime = os.path.getmtime(self.path)
+        index = {}
+        
+        for row in self.read_rows():
+            number = self.normalize(self.pick(row, self.NUMBER_COLUMNS))
+            if number:
+                index[number] = {
+                    'caller_name': self.pick(row, self.NAME_COLUMNS),
+                    'account': self.pick(row, self.ACCOUNT_COLUMNS)
+                }
+        
+        self.index = index
+        self.mtime = mtime
+        return len(index)
+    
+    def is_modified(self):
+        """Check whether the file changed since the last load"""
+        try:
+            return os.path.getmtime(self.path) != self.mtime
+        except OSError:
+            return False
+
+class CallerEnricher:
+    """Resolves caller IDs to names and accounts from a local phonebook"""
+    
+    EMPTY = {'caller_name': '', 'account': ''}
+    
+    def __init__(self, config, on_error=None, on_reload=None):
+        settings = config['enrichment']
+        self.on_error = on_error
+        self.on_reload = on_reload
+        self.cache = LRUCache(settings['cache_size'], settings['cache_ttl'])
+        self.reload_interval = settings['reload_interval']
+        self.phonebook = None
+        self.stop_event = threading.Event()
+        self.watcher = None
+        
+        if settings['phonebook_file']:
+            self.phonebook = Phonebook(settings['phonebook_file'], settings['country_code'])
+    
+    def start(self):
+        """Load the phonebook and watch it for changes in the background"""
+        if self.phonebook and not self.watcher:
+            self.watcher = threading.Thread(target=self.watch, daemon=True)
+            self.watcher.start()
+    
+    def reload(self):
+        """Load the phonebook and invalidate cached lookups"""
+        try:
+            count = self.phonebook.load()
+            self.cache.clear()
+            if self.on_reload:
+                self.on_reload(count)
+        except Exception as e:
+            # Keep the previous index and don't retry until the file changes again
+            try:
+                self.phonebook.mtime = os.path.getmtime(self.phonebook.path)
+            except OSError:
+                pass
+            if self.on_error:
+                self.on_error(f"Error loading phonebook: {str(e)}")
+    
+    def watch(self):
+        """Reload the phonebook in the background when the file changes"""
+        self.reload()
+        while not self.stop_event.wait(self.reload_interval):
+            if self.phonebook.is_modified():
+                self.reload()
+    
+    def lookup(self, caller_id):
+        """Return caller_name and account for a caller ID"""
+        if not self.phonebook or not caller_id:
+            return self.EMPTY
+        
+        result = self.cache.get(caller_id)
+        if result is LRUCache.MISSING:
+            result = self.phonebook.index.get(self.phonebook.normalize(caller_id), self.EMPTY)
+            self.cache.put(caller_id, result)
+        return result
+    
+    def stop(self):
+        """Stop the background reload watcher"""
+        self.stop_event.set()
+
+# Number classification
+class PrefixClassifier:
+    """Longest-prefix-match trie mapping caller numbers to categories
+    
+    Rules come from a CSV file with a prefix,category,label header, e.g.
+    0770,mobile,Asiacell or 040,landline,Basra. Lookup walks one trie node
+    per digit, so its cost depends on the number length only.
+    """
+    
+    EMPTY = {'category': '', 'label': ''}
+    
+    def __init__(self, country_code=""):
+        self.country_code = country_code
+        self.root = {}
+        self.rule_count = 0
+    
+    def add_rule(self, prefix, category, label=""):
+        """Insert a rule; a later rule for the same prefix replaces it"""
+        node = self.root
+        for digit in prefix:
+            node = node.setdefault(digit, {})
+        
+        if None not in node:
+            self.rule_count += 1
+        # The None key holds the result for the prefix ending at this node
+        node[None] = {'category': category, 'label': label}
+    
+    def load(self, path):
+        """Build the trie from a rules file"""
+        with open(path, 'r', newline='', encoding='utf-8-sig') as f:
+            for row in csv.DictReader(f):
+                row = {(key or '').strip().lower(): (value or '').strip() for key, value in row.items()}
+                prefix = row.get('prefix', '')
+                if not prefix or prefix.startswith('#'):
+                    continue
+                
+                self.add_rule(
+                    normalize_number(prefix, self.country_code, partial=True),
+                    row.get('category', ''),
+                    row.get('label', '')
+                )
+        return self.rule_count
+    
+    def classify(self, number):
+        """Return the category and label of the longest matching prefix"""
+        node = self.root
+        result = node.get(None, self.EMPTY)
+        
+        for digit in normalize_number(number, self.country_code):
+            node = node.get(digit)
+            if node is None:
+                break
+            result = node.get(None, result)
+        return result
+
+# Repeat caller detection
+class SlidingWindowCounter:
+    """Per-key event counts over a sliding time window
+    
+    Each key holds a small ring of time buckets; advancing the ring drops
+    the buckets that fell out of the window, so update and query touch at
+    most a fixed number of buckets. Keys are kept in last-touched order so
+    idle ones can be evicted from the front, and max_keys hard-caps memory.
+    """
+    
+    def __init__(self, window_seconds=3600, buckets=12, max_keys=50000):
+        self.bucket_seconds = window_seconds / buckets
+        self.buckets = buckets
+        self.max_keys = max_keys
+        # key -> [last_bucket, total, counts]
+        self.entries = OrderedDict()
+    
+    def current_bucket(self, now=None):
+        """Index of the time bucket containing now"""
+        return int((now if now is not None else time.time()) // self.bucket_seconds)
+    
+    def advance(self, entry, bucket):
+        """Expire the buckets of an entry that left the window"""
+        last_bucket, total, counts = entry
+        steps = bucket - last_bucket
+        
+        if steps >= self.buckets:
+            counts[:] = [0] * self.buckets
+            total = 0
+        else:
+            for step in range(1, steps + 1):
+                slot = (last_bucket + step) % self.buckets
+                total -= counts[slot]
+                counts[slot] = 0
+        
+        entry[0] = max(bucket, last_bucket)
+        entry[1] = total
+    
+    def evict(self, bucket):
+        """Drop keys that have had no events for a whole window"""
+        while self.entries:
+            key, entry = next(iter(self.entries.items()))
+            if entry[0] > bucket - self.buckets and len(self.entries) <= self.max_keys:
+                break
+            self.entries.popitem(last=False)
+    
+    def add(self, key, now=None):
+        """Count one event for key and return the count in the window"""
+        bucket = self.current_bucket(now)
+        entry = self.entries.get(key)
+        
+        if entry is None:
+            entry = [bucket, 0, [0] * self.buckets]
+            self.entries[key] = entry
+        else:
+            self.advance(entry, bucket)
+            self.entries.move_to_end(key)
+        
+        entry[2][bucket % self.buckets] += 1
+        entry[1] += 1
+        
+        self.evict(bucket)
+        return entry[1]
+    
+    def count(self, key, now=None):
+        """Return the number of events for key in the window"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return 0
+        
+        # Computed without advancing, so a query never rewrites the ring
+        last_bucket, total, counts = entry
+        steps = self.current_bucket(now) - last_bucket
+        if steps >= self.buckets:
+            return 0
+        for step in range(1, steps + 1):
+            total -= counts[(last_bucket + step) % self.buckets]
+        return total
+
+# Call statistics
+class CallTracker:
+    """Follows calls from ringing to hangup and reports completed calls"""
+    
+    def __init__(self, max_age=4 * 3600):
+        self.max_age = max_age
+        # call key -> [ring_started, answered_at, extension, queue]
+        self.active = OrderedDict()
+    
+    @staticmethod
+    def call_key(call):
+        """Key that ties the events of one call together"""
+        return call.linkedid or call.uniqueid
+    
+    def observe(self, call, now=None):
+        """Apply one call event; return a summary when a call completes"""
+        now = now if now is not None else call.wall_time
+        key = self.call_key(call)
+        event = call.event
+        
+        # Forget calls whose hangup we never saw
+        while self.active:
+            oldest_key, oldest = next(iter(self.active.items()))
+            if now - oldest[0] < self.max_age:
+                break
+            self.active.popitem(last=False)
+        
+        if not key:
+            return None
+        
+        if event == "DialBegin":
+            if key not in self.active:
+                self.active[key] = [now, None, call.extension, call.queue]
+        elif event == "Bridge":
+            entry = self.active.get(key)
+            if entry and entry[1] is None:
+                entry[1] = now
+        elif event == "Hangup":
+            entry = self.active.pop(key, None)
+            if entry:
+                ring_started, answered_at, extension, queue = entry
+                answered = answered_at is not None
+                return {
+                    'extension': extension,
+                    'queue': queue or call.queue,
+                    'answered': answered,
+                    'ring_time': (answered_at if answered else now) - ring_started,
+                    'talk_time': now - answered_at if answered else None,
+                }
+        return None
+
+class CallStatistics:
+    """Incremental call aggregates for today and a rolling window
+    
+    Every counter is updated in O(1) as calls arrive and complete; the
+    rolling window is a ring of one-minute buckets that is only summed
+    when the panel refreshes.
+    """
+    
+    FIELDS = ('calls', 'answered', 'missed', 'ring_sum', 'ring_count', 'talk_sum', 'talk_count')
+    
+    def __init__(self, window_minutes=60):
+        self.window_minutes = window_minutes
+        self.rolling = [[-1] + [0] * len(self.FIELDS) for _ in range(window_minutes)]
+        self.reset_today(datetime.now().date())
+    
+    def reset_today(self, day):
+        """Start fresh daily counters"""
+        self.day = day
+        self.today = dict.fromkeys(self.FIELDS, 0)
+        self.hourly = [0] * 24
+    
+    def bucket(self, now):
+        """Return the rolling bucket for now, clearing it if stale
+        
+        Returns None for a moment whose slot already holds a newer minute.
+        """
+        minute = int(now // 60)
+        bucket = self.rolling[minute % self.window_minutes]
+        if bucket[0] > minute:
+            return None
+        if bucket[0] != minute:
+            bucket[:] = [minute] + [0] * len(self.FIELDS)
+        return bucket
+    
+    def add(self, field, value, now):
+        """Add to one counter in both the daily and rolling aggregates"""
+        day = datetime.fromtimestamp(now).date()
+        if day > self.day:
+            self.reset_today(day)
+        if day == self.day:
+            self.today[field] += value
+        
+        bucket = self.bucket(now)
+        if bucket:
+            bucket[1 + self.FIELDS.index(field)] += value
+    
+    def record_arrival(self, now=None):
+        """Count a new incoming call"""
+        now = now if now is not None else time.time()
+        self.add('calls', 1, now)
+        
+        moment = datetime.fromtimestamp(now)
+        if moment.date() == self.day:
+            self.hourly[moment.hour] += 1
+    
+    def record_completion(self, summary, now=None):
+        """Count an answered or missed call and its durations"""
+        now = now if now is not None else time.time()
+        
+        if summary['answered']:
+            self.add('answered', 1, now)
+            self.add('ring_sum', summary['ring_time'], now)
+            self.add('ring_count', 1, now)
+            self.add('talk_sum', summary['talk_time'], now)
+            self.add('talk_count', 1, now)
+        else:
+            self.add('missed', 1, now)
+    
+    def rolling_totals(self, now=None):
+        """Sum the buckets that are still inside the window"""
+        now = now if now is not None else time.time()
+        oldest = int(now // 60) - self.window_minutes
+        totals = dict.fromkeys(self.FIELDS, 0)
+        
+        for bucket in self.rolling:
+            if bucket[0] > oldest:
+                for i, field in enumerate(self.FIELDS):
+                    totals[field] += bucket[1 + i]
+        return totals
+    
+    def today_totals(self, now=None):
+        """Return today's counters, rolling over at midnight"""
+        now = now if now is not None else time.time()
+        day = datetime.fromtimestamp(now).date()
+        if day > self.day:
+            self.reset_today(day)
+        return dict(self.today)
+
+# Duration percentiles
+class QuantileSketch:
+    """Mergeable log-bucket histogram for streaming percentiles
+    
+    Values land in buckets whose bounds grow by a constant factor, giving
+    every quantile a relative error of at most `accuracy`. Memory depends
+    on the value range, not the number of values, and two sketches merge
+    by adding bucket counts.
+    """
+    
+    MIN_VALUE = 0.01  # seconds; smaller durations count as zero
+    
+    def __init__(self, accuracy=0.01):
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+    
+    def add(self, value):
+        """Record one value"""
+        self.count += 1
+        if value < self.MIN_VALUE:
+            self.zero_count += 1
+            return
+        
+        index = math.ceil(math.log(value) / self.log_gamma)
+        self.bins[index] = self.bins.get(index, 0) + 1
+    
+    def quantile(self, q):
+        """Estimate the value at quantile q (0..1), or None if empty"""
+        if not self.count:
+            return None
+        
+        rank = q * (self.count - 1)
+        if rank < self.zero_count:
+            return 0.0
+        
+        seen = self.zero_count
+        for index in sorted(self.bins):
+            seen += self.bins[index]
+            if seen > rank:
+                # Midpoint of the bucket in relative terms
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+    
+    def merge(self, other):
+        """Add another sketch with the same accuracy into this one"""
+        if other.accuracy != self.accuracy:
+            raise ValueError("Cannot merge sketches with different accuracy")
+        
+        for index, count in other.bins.items():
+            self.bins[index] = self.bins.get(index, 0) + count
+        self.zero_count += other.zero_count
+        self.count += other.count
+    
+    def to_dict(self):
+        """Serialize for saving"""
+        return {
+            'accuracy': self.accuracy,
+            'count': self.count,
+            'zero_count': self.zero_count,
+            'bins': {str(index): count for index, count in self.bins.items()}
+        }
+    
+    @classmethod
+    def from_dict(cls, data):
+        """Restore a saved sketch"""
+        sketch = cls(data['accuracy'])
+        sketch.count = data['count']
+        sketch.zero_count = data['zero_count']
+        sketch.bins = {int(index): count for index, count in data['bins'].items()}
+        return sketch
+
+class DurationSketches:
+    """Ring and talk time sketches per extension, per queue and overall"""
+    
+    ALL = "all"
+    
+    def __init__(self, accuracy=0.01):
+        self.accuracy = accuracy
+        # "all", "extension:<ext>" or "queue:<name>" -> {"ring": ..., "talk": ...}
+        self.groups = {}
+    
+    def group(self, key):
+        """Return the sketches for a group, creating them on first use"""
+        if key not in self.groups:
+            self.groups[key] = {
+                'ring': QuantileSketch(self.accuracy),
+                'talk': QuantileSketch(self.accuracy)
+            }
+        return self.groups[key]
+    
+    def record(self, summary):
+        """Add a completed call from the call tracker"""
+        keys = [self.ALL]
+        if summary.get('extension'):
+            keys.append(f"extension:{summary['extension']}")
+        if summary.get('queue'):
+            keys.append(f"queue:{summary['queue']}")
+        
+        for key in keys:
+            sketches = self.group(key)
+            # Missed calls rang too; only answered calls have talk time
+            sketches['ring'].add(summary['ring_time'])
+            if summary['talk_time'] is not None:
+                sketches['talk'].add(summary['talk_time'])
+    
+    def merge(self, other):
+        """Fold another agent's sketches into these"""
+        for key, sketches in other.groups.items():
+            target = self.group(key)
+            target['ring'].merge(sketches['ring'])
+            target['talk'].merge(sketches['talk'])
+    
+    def save(self, path):
+        """Persist the sketches atomically"""
+        data = {
+            'version': 1,
+            'groups': {
+                key: {kind: sketch.to_dict() for kind, sketch in sketches.items()}
+                for key, sketches in self.groups.items()
+            }
+        }
+        atomic_write_json(path, data)
+    
+    @classmethod
+    def load(cls, path, accuracy=0.01):
+        """Load saved sketches"""
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        
+        result = cls(accuracy)
+        for key, sketches in data.get('groups', {}).items():
+            result.groups[key] = {
+                kind: QuantileSketch.from_dict(sketch) for kind, sketch in sketches.items()
+            }
+        return result
+    
+    def percentiles(self, key=ALL, quantiles=(0.5, 0.9, 0.99)):
+        """Return {'ring': [...], 'talk': [...]} percentile values for a group"""
+        sketches = self.groups.get(key)
+        if not sketches:
+            return {'ring': [None] * len(quantiles), 'talk': [None] * len(quantiles)}
+        return {
+            kind: [sketch.quantile(q) for q in quantiles]
+            for kind, sketch in sketches.items()
+        }
+
+# Runtime metrics
+class MetricsRegistry:
+    """Thread-safe counters, gauges and latency sketches for diagnostics"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+    
+    def increment(self, name, amount=1):
+        """Add to a monotonically increasing counter"""
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+    
+    def set_gauge(self, name, value):
+        """Record the current value of a gauge"""
+        with self.lock:
+            self.gauges[name] = value
+    
+    def observe(self, name, value):
+        """Add a sample to a latency distribution"""
+        with self.lock:
+            sketch = self.histograms.get(name)
+            if sketch is None:
+                sketch = self.histograms[name] = QuantileSketch()
+            sketch.add(value)
+    
+    def quantile(self, name, q):
+        """Quantile of a latency distribution, or None before the first sample"""
+        with self.lock:
+            sketch = self.histograms.get(name)
+            return sketch.quantile(q) if sketch and sketch.count else None
+    
+    def snapshot(self):
+        """Return sorted (name, text) pairs for display"""
+        with self.lock:
+            rows = [(name, str(value)) for name, value in self.counters.items()]
+            rows += [(name, f"{value:.2f}" if isinstance(value, float) else str(value))
+                     for name, value in self.gauges.items()]
+            for name, sketch in self.histograms.items():
+                rows.append((name, (
+                    f"n={sketch.count} p50={sketch.quantile(0.5):.1f} "
+                    f"p99={sketch.quantile(0.99):.1f}"
+                )))
+        return sorted(rows)
+
+metrics = MetricsRegistry()
+
+# Stall detection
+class Watchdog(QThread):
+    """Flags pipeline stages whose heartbeat stops for longer than their deadline"""
+    
+    stalled = pyqtSignal(str, float)    # stage, seconds since its last heartbeat
+    recovered = pyqtSignal(str, float)  # stage, seconds it was stalled for
+    
+    CHECK_INTERVAL = 1.0
+    
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.stages = {}  # name -> [deadline, last heartbeat, stalled since]
+        self.stop_event = threading.Event()
+    
+    def watch(self, stage, deadline):
+        """Start expecting heartbeats from a stage"""
+        with self.lock:
+            self.stages[stage] = [deadline, time.monotonic(), None]
+    
+    def unwatch(self, stage):
+        with self.lock:
+            self.stages.pop(stage, None)
+    
+    def set_deadline(self, stage, deadline):
+        with self.lock:
+            if stage in self.stages:
+                self.stages[stage][0] = deadline
+    
+    def beat(self, stage):
+        """Record progress; cheap enough to call per event"""
+        entry = self.stages.get(stage)
+        if entry is not None:
+            entry[1] = time.monotonic()
+    
+    def run(self):
+        while not self.stop_event.wait(self.CHECK_INTERVAL):
+            self.check()
+    
+    def check(self):
+        """Compare every stage's heartbeat age with its deadline"""
+        now = time.monotonic()
+        with self.lock:
+            stages = list(self.stages.items())
+        
+        for stage, entry in stages:
+            deadline, last_beat, stalled_since = entry
+            age = now - last_beat
+            metrics.set_gauge(f"watchdog.heartbeat_age_s.{stage}", round(age, 1))
+            
+            if stalled_since is None and age > deadline:
+                entry[2] = now
+                metrics.increment(f"watchdog.stalls.{stage}")
+                self.stalled.emit(stage, age)
+            elif stalled_since is not None and age <= deadline:
+                entry[2] = None
+                self.recovered.emit(stage, now - stalled_since)
+    
+    def stop(self):
+        self.stop_event.set()
+        self.wait()
+
+# On-demand diagnostics
+class Diagnostics(QObject):
+    """cProfile and tracemalloc captures that can be taken from a running instance
+    
+    Before Python 3.12 cProfile only sees the thread that enabled it, so each
+    thread calls sync() from its periodic heartbeat and starts or stops its
+    own profiler there; stats are written when the thread notices the stop.
+    From 3.12 a profiler covers every thread and only one may be active, so
+    a single process-wide profiler is used instead.
+    """
+    
+    message = pyqtSignal(str)  # emitted from whichever thread produced it
+    
+    SHARED_PROFILER = sys.version_info >= (3, 12)
+    TRACE_FRAMES = 10
+    TOP_ENTRIES = 30
+    COMMANDS = ('status', 'profile-start', 'profile-stop',
+                'memory-start', 'memory-snapshot', 'memory-stop')
+    
+    def __init__(self):
+        super().__init__()
+        self.output_dir = Path("logs")
+        self.profiling = False
+        self.session = None
+        self.profilers = {}  # (thread name, ident) -> (profiler or None if it failed, session)
+        self.shared_profiler = None
+        self.last_snapshot = None
+    
+    def sync(self, thread):
+        """Start or stop the calling thread's profiler to match the requested state"""
+        if self.SHARED_PROFILER:
+            return
+        key = (thread, threading.get_ident())
+        if self.profiling == (key in self.profilers):
+            return
+        if self.profiling:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError as e:
+                # Another profiler owns the hooks; never let that stop the worker
+                self.profilers[key] = (None, self.session)
+                self.message.emit(f"ERROR: Could not profile the {thread} thread: {e}")
+                return
+            self.profilers[key] = (profiler, self.session)
+        else:
+            self.release(thread)
+    
+    def release(self, thread):
+        """Stop and write the calling thread's profiler; call before the thread exits"""
+        entry = self.profilers.pop((thread, threading.get_ident()), None)
+        if entry and entry[0]:
+            profiler, session = entry
+            profiler.disable()
+            self.write_profile(thread, profiler, session)
+    
+    def write_profile(self, thread, profiler, session):
+        """Dump raw stats for snakeviz/pstats plus a readable top list"""
+        path = self.output_dir / f"profile-{session}-{thread}.prof"
+        if path.exists():
+            # A restarted thread of the same kind in one session
+            path = path.with_name(f"profile-{session}-{thread}-{threading.get_ident()}.prof")
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(path)
+            with open(path.with_suffix(".txt"), 'w', encoding='utf-8') as f:
+                stats = pstats.Stats(profiler, stream=f)
+                stats.sort_stats('cumulative').print_stats(self.TOP_ENTRIES)
+        except Exception as e:
+            self.message.emit(f"ERROR: Could not write {thread} profile: {e}")
+            return
+        metrics.increment("diagnostics.profiles_written")
+        covered = "all threads" if thread == "all" else f"the {thread} thread"
+        self.message.emit(f"Profile of {covered} written to {path}")
+    
+    def start_profiling(self):
+        if self.profiling:
+            return "Profiling is already running"
+        self.session = datetime.now().strftime("%Y%m%d_%H%M%S")
+        if self.SHARED_PROFILER:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError as e:
+                return f"ERROR: Could not start profiling: {e}"
+            self.shared_profiler = profiler
+        self.profiling = True
+        return "Profiling started on the reader, writer and GUI threads"
+    
+    def stop_profiling(self):
+        if not self.profiling:
+            return "Profiling is not running"
+        self.profiling = False
+        if self.SHARED_PROFILER:
+            profiler, self.shared_profiler = self.shared_profiler, None
+            profiler.disable()
+            self.write_profile("all", profiler, self.session)
+            return f"Profiling stopped; stats for all threads written to {self.output_dir}"
+        return f"Profiling stopped; each thread writes its stats to {self.output_dir} when it next wakes"
+    
+    def start_memory_tracing(self):
+        if tracemalloc.is_tracing():
+            return "Memory tracing is already running"
+        tracemalloc.start(self.TRACE_FRAMES)
+        self.last_snapshot = self.take_snapshot()
+        return "Memory tracing started; take a snapshot later to see what grew"
+    
+    def snapshot_memory(self):
+        """Diff a new snapshot against the previous one and write the report"""
+        if not tracemalloc.is_tracing():
+            return self.start_memory_tracing()
+        
+        snapshot = self.take_snapshot()
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = self.output_dir / f"memory-{stamp}.txt"
+        current, peak = tracemalloc.get_traced_memory()
+        
+        changes = snapshot.compare_to(self.last_snapshot, 'traceback')
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            snapshot.dump(str(path.with_suffix(".snapshot")))
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(f"Traced memory: {current / 1024 / 1024:.1f} MiB (peak {peak / 1024 / 1024:.1f} MiB)\n")
+                f.write(f"Top {self.TOP_ENTRIES} changes since the previous snapshot:\n\n")
+                for change in changes[:self.TOP_ENTRIES]:
+                    f.write(f"{change.size_diff / 1024:+.1f} KiB, {change.count_diff:+d} blocks "
+                            f"(now {change.size / 1024:.1f} KiB in {change.count} blocks)\n")
+                    for line in change.traceback.format(most_recent_first=True):
+                        f.write(f"    {line}\n")
+                    f.write("\n")
+        except Exception as e:
+            return f"ERROR: Could not write memory report: {e}"
+        
+        self.last_snapshot = snapshot
+        metrics.increment("diagnostics.memory_snapshots")
+        metrics.set_gauge("diagnostics.traced_mb", round(current / 1024 / 1024, 1))
+        grown = changes[0] if changes and changes[0].size_diff > 0 else None
+        top = f"; largest growth {grown.size_diff / 1024:+.1f} KiB at {grown.traceback[-1]}" if grown else ""
+        return f"Memory report written to {path}{top}"
+    
+    @staticmethod
+    def take_snapshot():
+        # Leave out the bookkeeping of tracemalloc and the import system
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+    
+    def stop_memory_tracing(self):
+        if not tracemalloc.is_tracing():
+            return "Memory tracing is not running"
+        tracemalloc.stop()
+        self.last_snapshot = None
+        return "Memory tracing stopped"
+    
+    def status(self):
+        profiling = f"running since {self.session}" if self.profiling else "off"
+        tracing = "on" if tracemalloc.is_tracing() else "off"
+        return f"Profiling {profiling}; memory tracing {tracing}; output in {self.output_dir}"
+    
+    def run_command(self, command):
+        """Run one control command and return its reply"""
+        handlers = {
+            'status': self.status,
+            'profile-start': self.start_profiling,
+            'profile-stop': self.stop_profiling,
+            'memory-start': self.start_memory_tracing,
+            'memory-snapshot': self.snapshot_memory,
+            'memory-stop': self.stop_memory_tracing,
+        }
+        handler = handlers.get(command.strip())
+        if handler is None:
+            return f"Unknown command {command.strip()!r}; expected one of: {', '.join(self.COMMANDS)}"
+        reply = handler()
+        if command.strip() != 'status':
+            self.message.emit(reply)
+        return reply
+
+diagnostics = Diagnostics()
+
+class ControlServer:
+    """Local TCP socket that accepts one diagnostics command per connection
+    
+    It listens on loopback only, and each command must start with a token
+    that is regenerated on every start and written to a file only the
+    current user can read, so other users on a shared host cannot use it.
+    """
+    
+    HOST = "127.0.0.1"
+    
+    def __init__(self, port, token_file, on_error):
+        self.port = port
+        self.token_file = Path(token_file)
+        self.on_error = on_error
+        self.token = None
+        self.server = None
+    
+    def start(self):
+        self.server = socket.create_server((self.HOST, self.port))
+        self.token = secrets.token_hex(16)
+        try:
+            write_private_text(self.token_file, self.token)
+        except OSError:
+            self.stop()
+            raise
+        threading.Thread(target=self.accept_loop, name="ControlServer", daemon=True).start()
+    
+    def accept_loop(self):
+        while self.server:
+            try:
+                conn, address = self.server.accept()
+            except OSError:
+                break
+            with conn:
+                try:
+                    if address[0] != self.HOST:
+                        continue
+                    conn.settimeout(5)
+                    token, _, command = conn.makefile('r', encoding='utf-8').readline().strip().partition(" ")
+                    if not hmac.compare_digest(token.encode('utf-8'), self.token.encode('utf-8')):
+                        metrics.increment("diagnostics.rejected_commands")
+                        conn.sendall(b"ERROR: Invalid control token\n")
+                        self.on_error("Rejected a control command with an invalid token")
+                        continue
+                    conn.sendall((diagnostics.run_command(command) + "\n").encode('utf-8'))
+                except Exception as e:
+                    self.on_error(f"Control command failed: {e}")
+    
+    def stop(self):
+        server, self.server = self.server, None
+        if server:
+            close_listening_socket(server)
+            try:
+                self.token_file.unlink()
+            except OSError:
+                pass
+
+def write_private_text(path, text):
+    """Write a file readable by the current user only"""
+    path = Path(path)
+    try:
+        path.unlink()
+    except FileNotFoundError:
+        pass
+    # O_EXCL: never write through a file or link someone else created
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+def send_control_command(port, token_file, command):
+    """Send a command to a running instance's control socket and return the reply"""
+    token = Path(token_file).read_text(encoding='utf-8').strip()
+    with socket.create_connection((ControlServer.HOST, port), timeout=30) as conn:
+        conn.sendall(f"{token} {command}\n".encode('utf-8'))
+        return conn.makefile('r', encoding='utf-8').readline().strip()
+
+# AMI endpoints
+class AMIEndpoint:
+    """One AMI server with its failover priority and observed health"""
+    
+    RETRY_BACKOFF = (5, 15, 60, 300)  # seconds before retrying a failing endpoint
+    
+    def __init__(self, host, port, priority=0):
+        self.host = host
+        self.port = port
+        self.priority = priority
+        self.healthy = True
+        self.failures = 0
+        self.last_latency = None
+        self.retry_at = 0.0
+    
+    @property
+    def name(self):
+        return f"{self.host}:{self.port}"
+    
+    def mark_success(self, latency):
+        """Record a successful connect and login"""
+        self.healthy = True
+        self.failures = 0
+        self.last_latency = latency
+        self.retry_at = 0.0
+        metrics.observe(f"ami.connect_ms.{self.name}", latency * 1000)
+        metrics.set_gauge(f"ami.healthy.{self.name}", 1)
+    
+    def mark_failure(self, now=None):
+        """Record a failed attempt and back off before the next one"""
+        now = time.monotonic() if now is None else now
+        self.healthy = False
+        backoff = self.RETRY_BACKOFF[min(self.failures, len(self.RETRY_BACKOFF) - 1)]
+        self.failures += 1
+        self.retry_at = now + backoff
+        metrics.increment(f"ami.connect_failures.{self.name}")
+        metrics.set_gauge(f"ami.healthy.{self.name}", 0)
+    
+    def sort_key(self):
+        """Priority first, then the fastest recently observed connect"""
+        latency = self.last_latency if self.last_latency is not None else float('inf')
+        return (self.priority, latency)
+    
+    @staticmethod
+    def from_config(pbx_config):
+        """Build the endpoint list from pbx.ip plus any pbx.endpoints entries"""
+        endpoints = []
+        if pbx_config['ip']:
+            endpoints.append(AMIEndpoint(pbx_config['ip'], pbx_config['port'], 0))
+        
+        for entry in pbx_config.get('endpoints', []):
+            try:
+                host = str(entry['ip']).strip()
+                port = int(entry.get('port', pbx_config['port']))
+                priority = int(entry.get('priority', len(endpoints)))
+            except (KeyError, TypeError, ValueError, AttributeError):
+                continue
+            if host and all(e.name != f"{host}:{port}" for e in endpoints):
+                endpoints.append(AMIEndpoint(host, port, priority))
+        
+        return endpoints
+
+# Local event broker
+def close_listening_socket(server):
+    """Close a server socket and wake the thread blocked in accept() on it"""
+    try:
+        # On Linux close() alone leaves accept() blocked and the port bound
+        server.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    server.close()
+
+def is_loopback(host):
+    """Whether a host name or address only reaches this machine"""
+    if host == "localhost":
+        return True
+    try:
+        address = ipaddress.ip_address(host.split('%', 1)[0])
+    except ValueError:
+        return False
+    return address.is_loopback or bool(getattr(address, 'ipv4_mapped', None) and address.ipv4_mapped.is_loopback)
+
+def broker_key(secret, extension):
+    """Subscription key for one extension, derived from the broker's secret"""
+    return hmac.new(secret.encode('utf-8'), extension.encode('utf-8'), hashlib.sha256).hexdigest()[:32]
+
+def concerns_extension(call, extension):
+    """Whether a parsed call event involves the given agent extension"""
+    return bool(extension) and (
+        call.destination == extension or
+        call.caller_id == extension or
+        extension in call.channel
+    )
+
+def is_inbound(call):
+    """Whether a call event is a leg ringing the agent, not one the agent dialled"""
+    return bool(call.extension) and call.destination == call.extension
+
+class BrokerClient:
+    """One subscribed desktop client with its own bounded send queue"""
+    
+    def __init__(self, conn, extension, on_closed):
+        self.conn = conn
+        self.extension = extension
+        self.on_closed = on_closed
+        self.pending = queue.Queue(maxsize=EventBroker.MAX_PENDING)
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+    
+    def send(self, line):
+        """Queue a message, dropping the client if it has fallen too far behind"""
+        try:
+            self.pending.put_nowait(line)
+        except queue.Full:
+            metrics.increment("broker.slow_clients_dropped")
+            self.close()
+    
+    def write_loop(self):
+        """Deliver queued messages until the client goes away"""
+        while True:
+            line = self.pending.get()
+            if line is None:
+                break
+            try:
+                self.conn.sendall(line)
+            except OSError:
+                break
+        self.close()
+    
+    def close(self):
+        """Disconnect and unregister the client"""
+        try:
+            # Shutdown first so a writer blocked in sendall returns
+            self.conn.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.conn.close()
+        try:
+            self.pending.put_nowait(None)
+        except queue.Full:
+            pass
+        self.on_closed(self)
+
+class EventBroker:
+    """Publishes parsed AMI events to local clients, filtered per extension
+    
+    Other users' sessions on the same host can reach the socket, so it only
+    binds to and accepts loopback, and a subscription needs the key that
+    broker_key derives for that extension from the broker's secret. An agent
+    holding their own key cannot subscribe to anyone else's calls.
+    """
+    
+    MAX_PENDING = 1000  # queued messages before a client counts as stalled
+    
+    def __init__(self, host, port, secret, on_error=None):
+        self.host = host
+        self.port = port
+        self.secret = secret
+        self.on_error = on_error
+        self.clients = []
+        self.lock = threading.Lock()
+        self.server = None
+    
+    def start(self):
+        """Bind the local socket and start accepting subscribers"""
+        if not is_loopback(self.host):
+            raise ValueError(f"broker.host must be a loopback address, not {self.host}")
+        if not self.secret:
+            raise ValueError("broker.secret is not set")
+        self.server = socket.create_server((self.host, self.port))
+        threading.Thread(target=self.accept_loop, daemon=True).start()
+    
+    def accept_loop(self):
+        """Accept clients until the broker is stopped"""
+        while self.server:
+            try:
+                conn, address = self.server.accept()
+            except OSError:
+                break
+            if not is_loopback(address[0]):
+                conn.close()
+                metrics.increment("broker.rejected_clients")
+                continue
+            threading.Thread(target=self.handle_subscribe, args=(conn,), daemon=True).start()
+    
+    def handle_subscribe(self, conn):
+        """Read a client's subscription line and register it"""
+        try:
+            conn.settimeout(5)
+            request = b""
+            while b"\n" not in request and len(request) < 4096:
+                data = conn.recv(1024)
+                if not data:
+                    raise ConnectionError("client closed before subscribing")
+                request += data
+            subscription = json.loads(request.split(b"\n", 1)[0])
+            extension = str(subscription['subscribe']).strip()
+            key = str(subscription.get('key', ''))
+            if not hmac.compare_digest(key.encode('utf-8'), broker_key(self.secret, extension).encode('utf-8')):
+                metrics.increment("broker.rejected_clients")
+                conn.sendall(json.dumps({'type': 'error', 'error': f"invalid key for extension {extension}"}).encode() + b"\n")
+                raise ValueError(f"invalid key for extension {extension}")
+            conn.settimeout(None)
+        except Exception as e:
+            conn.close()
+            if self.on_error:
+                self.on_error(f"Rejected broker client: {e}")
+            return
+        
+        client = BrokerClient(conn, extension, self.remove_client)
+        with self.lock:
+            self.clients.append(client)
+            metrics.set_gauge("broker.clients", len(self.clients))
+        client.writer.start()
+        
+        # Clients send nothing more; reading only detects disconnects promptly
+        try:
+            while conn.recv(1024):
+                pass
+        except OSError:
+            pass
+        client.close()
+    
+    def remove_client(self, client):
+        with self.lock:
+            if client in self.clients:
+                self.clients.remove(client)
+            metrics.set_gauge("broker.clients", len(self.clients))
+    
+    def publish(self, call):
+        """Send an event to every client whose extension it concerns"""
+        with self.lock:
+            targets = [c for c in self.clients if concerns_extension(call, c.extension)]
+        if not targets:
+            return
+        
+        # Serialize once however many clients receive it
+        line = json.dumps({'type': 'event', 'call': call._asdict()}).encode() + b"\n"
+        for client in targets:
+            client.send(line)
+        metrics.increment("broker.events_published")
+    
+    def stop(self):
+        """Close the listening socket and disconnect all clients"""
+        server, self.server = self.server, None
+        if server:
+            close_listening_socket(server)
+        with self.lock:
+            clients = list(self.clients)
+        for client in clients:
+            client.close()
+
+# Synthetic call traffic
+class SyntheticTraffic:
+    """Seeded generator of AMI-shaped call lifecycles for demos and load tests"""
+    
+    def __init__(self, settings, extensions, seed):
+        self.settings = settings
+        self.extensions = list(extensions)
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.pending = []  # heap of (time, order, AMI event fields)
+        self.order = 0
+        self.next_id = 0
+        self.callers = [f"07{self.rng.randint(100000000, 999999999)}"
+                        for _ in range(max(1, settings['caller_pool']))]
+        self.next_arrival = self.interarrival()
+    
+    def interarrival(self):
+        """Exponential gap between Poisson arrivals"""
+        rate = self.settings['calls_per_minute'] / 60
+        return self.rng.expovariate(rate) if rate > 0 else float('inf')
+    
+    def ring_time(self):
+        return self.rng.uniform(self.settings['ring_min_seconds'], self.settings['ring_max_seconds'])
+    
+    def hold_time(self):
+        """Draw a talk time from the configured distribution"""
+        mean = self.settings['hold_mean_seconds']
+        distribution = self.settings['hold_distribution']
+        if distribution == "exponential":
+            return self.rng.expovariate(1 / mean)
+        if distribution == "uniform":
+            return self.rng.uniform(0, 2 * mean)
+        if distribution == "fixed":
+            return mean
+        sigma = self.settings['hold_sigma']
+        return self.rng.lognormvariate(math.log(mean) - sigma * sigma / 2, sigma)
+    
+    def new_id(self):
+        self.next_id += 1
+        return self.next_id
+    
+    def schedule(self, at, event, caller, extension, leg, linkedid, queue):
+        """Queue one AMI event for a call leg"""
+        self.order += 1
+        heapq.heappush(self.pending, (at, self.order, {
+            'Event': event,
+            'CallerIDNum': caller,
+            'DestCallerIDNum': extension,
+            'Channel': f"SIP/{extension}-{leg:08x}",
+            'Uniqueid': f"{self.seed}.{leg}",
+            'Linkedid': linkedid,
+            'Queue': queue,
+        }))
+    
+    def start_call(self, at):
+        """Ring one extension, or all of them, and schedule the outcome"""
+        caller = self.rng.choice(self.callers)
+        linkedid = f"{self.seed}.{self.new_id()}"
+        
+        if self.rng.random() < self.settings['ring_all_ratio']:
+            targets, queue = self.extensions, "ringall"
+        else:
+            targets, queue = [self.rng.choice(self.extensions)], ""
+        legs = {extension: self.new_id() for extension in targets}
+        
+        for extension, leg in legs.items():
+            self.schedule(at, "DialBegin", caller, extension, leg, linkedid, queue)
+        
+        ring_end = at + self.ring_time()
+        if self.rng.random() < self.settings['answer_ratio']:
+            winner = self.rng.choice(targets)
+            for extension, leg in legs.items():
+                if extension != winner:
+                    self.schedule(ring_end, "Hangup", caller, extension, leg, linkedid, queue)
+            self.schedule(ring_end, "Bridge", caller, winner, legs[winner], linkedid, queue)
+            self.schedule_talk(ring_end, caller, winner, legs[winner], linkedid, queue)
+        else:
+            for extension, leg in legs.items():
+                self.schedule(ring_end, "Hangup", caller, extension, leg, linkedid, queue)
+    
+    def schedule_talk(self, at, caller, extension, leg, linkedid, queue):
+        """Talk, then either hang up or blind-transfer to another extension"""
+        end = at + self.hold_time()
+        self.schedule(end, "Hangup", caller, extension, leg, linkedid, queue)
+        
+        others = [e for e in self.extensions if e != extension]
+        if others and self.rng.random() < self.settings['transfer_ratio']:
+            target = self.rng.choice(others)
+            target_leg = self.new_id()
+            answered = end + self.ring_time()
+            self.schedule(end, "DialBegin", caller, target, target_leg, linkedid, queue)
+            self.schedule(answered, "Bridge", caller, target, target_leg, linkedid, queue)
+            self.schedule_talk(answered, caller, target, target_leg, linkedid, queue)
+    
+    def events_until(self, until):
+        """Yield (time, fields) for every event due by the given simulated time"""
+        while self.next_arrival <= until:
+            self.start_call(self.next_arrival)
+            self.next_arrival += self.interarrival()
+        
+        while self.pending and self.pending[0][0] <= until:
+            at, _, fields = heapq.heappop(self.pending)
+            yield at, fields
+    
+    def next_event_time(self):
+        return min(self.next_arrival, self.pending[0][0]) if self.pending else self.next_arrival
+
+# Event journal
+def read_lines_backwards(path, chunk_size=64 * 1024):
+    """Yield the non-empty lines of a file last first, reading fixed-size chunks from the end"""
+    with open(path, 'rb') as f:
+        position = f.seek(0, os.SEEK_END)
+        partial = b""
+        while position > 0:
+            size = min(chunk_size, position)
+            position -= size
+            f.seek(position)
+            lines = (f.read(size) + partial).split(b"\n")
+            # The first piece may continue in the chunk before it
+            partial = lines.pop(0)
+            for line in reversed(lines):
+                if line:
+                    yield line
+        if partial:
+            yield partial
+
+class EventJournal:
+    """Append-only JSONL record of every call transition, written on its own thread
+    
+    Each line is a CallEvent plus a sequence number that keeps counting
+    across restarts. Files are named events-<date>-<time>-<first seq>.jsonl
+    so they sort in write order; a new file starts at midnight or once
+    max_size_mb is reached, and the oldest beyond max_files are deleted.
+    
+    fsync policies: "always" syncs after every event, "interval" at most
+    every fsync_interval_ms, "os" only flushes and leaves syncing to the OS.
+    """
+    
+    FILE_PATTERN = "events-*.jsonl"
+    MAX_BATCH = 1000        # events per flush, so a backlog still gets timely fsyncs
+    MAX_QUEUED = 20000      # backlog kept when the disk stalls; later events are dropped
+    
+    def __init__(self, directory, config, on_error):
+        self.directory = Path(directory)
+        self.config = config
+        self.on_error = on_error
+        self.pending = queue.Queue(maxsize=self.MAX_QUEUED)
+        # Numbers are taken when an event is queued, so a dropped event
+        # leaves a gap exactly where it was lost
+        self.sequence = 0
+        self.sequence_lock = threading.Lock()
+        self.dropping = False
+        self.file = None
+        self.file_date = None
+        self.file_size = 0
+        self.dirty = False
+        self.last_fsync = time.monotonic()
+        self.thread = threading.Thread(target=self.run, name="EventJournal", daemon=True)
+    
+    def start(self):
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self.sequence = self.last_sequence()
+        except OSError as e:
+            self.on_error(f"Event journal unavailable: {e}")
+        self.thread.start()
+    
+    def append(self, call):
+        """Queue a call transition; never blocks the caller"""
+        if not self.config['journal']['enabled']:
+            return
+        with self.sequence_lock:
+            self.sequence += 1
+            try:
+                self.pending.put_nowait((self.sequence, call))
+                self.dropping = False
+                return
+            except queue.Full:
+                first_drop = not self.dropping
+                self.dropping = True
+        
+        metrics.increment("journal.dropped")
+        if first_drop:
+            self.on_error(f"Event journal is {self.MAX_QUEUED} events behind; dropping events until it catches up")
+    
+    def files(self):
+        """Journal files, oldest first"""
+        return sorted(self.directory.glob(self.FILE_PATTERN))
+    
+    def iter_reverse(self):
+        """Yield records newest first, reading each file backwards from its end"""
+        for path in reversed(self.files()):
+            for line in read_lines_backwards(path):
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # A line torn by a crash
+                    continue
+                if isinstance(record, dict) and 'seq' in record:
+                    yield record
+    
+    def recent(self, limit, after=None):
+        """Up to limit newest records with a wall time later than after, oldest first"""
+        records = []
+        for record in self.iter_reverse():
+            if len(records) >= limit or (after is not None and record.get('wall_time', 0) <= after):
+                break
+            records.append(record)
+        records.reverse()
+        return records
+    
+    def last_sequence(self):
+        """Sequence number of the newest intact line"""
+        return next((record['seq'] for record in self.iter_reverse()), 0)
+    
+    def run(self):
+        while True:
+            journal_config = self.config['journal']
+            timeout = None
+            if self.dirty:
+                due = self.last_fsync + journal_config['fsync_interval_ms'] / 1000
+                timeout = max(due - time.monotonic(), 0)
+            try:
+                entry = self.pending.get(timeout=timeout)
+            except queue.Empty:
+                self.guarded(self.sync)
+                continue
+            
+            # Take everything queued meanwhile so one flush covers the batch
+            entries = [entry]
+            while len(entries) < self.MAX_BATCH:
+                try:
+                    entries.append(self.pending.get_nowait())
+                except queue.Empty:
+                    break
+            metrics.set_gauge("journal.queue_depth", self.pending.qsize())
+            
+            stopping = None in entries
+            self.guarded(self.write, [entry for entry in entries if entry is not None])
+            if stopping:
+                self.guarded(self.close_file)
+                return
+    
+    def guarded(self, action, *args):
+        try:
+            action(*args)
+        except OSError as e:
+            metrics.increment("journal.errors")
+            self.on_error(f"Event journal write failed: {e}")
+            # Start over with a fresh file on the next event
+            file, self.file = self.file, None
+            self.dirty = False
+            if file:
+                try:
+                    file.close()
+                except OSError:
+                    pass
+    
+    def write(self, entries):
+        """Append a batch of (sequence, call) entries and sync per the configured policy"""
+        if not entries:
+            return
+        policy = self.config['journal']['fsync']
+        started = time.perf_counter()
+        written = 0
+        
+        for sequence, call in entries:
+            record = call._asdict()
+            del record['mono_time']  # meaningless once the process has exited
+            line = json.dumps({'seq': sequence, **record}, ensure_ascii=False, separators=(',', ':'))
+            data = (line + "\n").encode('utf-8')
+            
+            self.rotate_if_needed(len(data), sequence)
+            self.file.write(data)
+            self.file_size += len(data)
+            written += len(data)
+            self.dirty = policy != "os"
+            if policy == "always":
+                self.sync()
+        
+        # Flushed per batch even under "os" so a crash of this process loses nothing
+        self.file.flush()
+        if policy == "interval":
+            interval = self.config['journal']['fsync_interval_ms'] / 1000
+            if time.monotonic() - self.last_fsync >= interval:
+                self.sync()
+        
+        metrics.increment("journal.events", len(entries))
+        metrics.increment("journal.bytes", written)
+        metrics.observe("journal.batch_write_ms", (time.perf_counter() - started) * 1000)
+    
+    def sync(self):
+        """Flush and fsync the current file if it has unsynced writes"""
+        if self.file is None or not self.dirty:
+            return
+        started = time.perf_counter()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        metrics.observe("journal.fsync_ms", (time.perf_counter() - started) * 1000)
+        self.dirty = False
+        self.last_fsync = time.monotonic()
+    
+    def rotate_if_needed(self, size, sequence):
+        """Start a new file at midnight or when the next line would exceed the size cap"""
+        today = datetime.now().date()
+        max_bytes = self.config['journal']['max_size_mb'] * 1024 * 1024
+        if self.file and self.file_date == today and (self.file_size == 0 or self.file_size + size <= max_bytes):
+            return
+        
+        if self.file:
+            self.close_file()
+            metrics.increment("journal.rotations")
+        
+        path = self.directory / f"events-{datetime.now():%Y%m%d-%H%M%S}-{sequence:012d}.jsonl"
+        self.file = open(path, 'ab')
+        self.file_date = today
+        self.file_size = self.file.tell()
+        if self.file_size:
+            # Same name as a file whose only line was torn by a crash; keep lines separate
+            self.file.write(b"\n")
+            self.file_size += 1
+        self.prune()
+    
+    def prune(self):
+        """Delete the oldest files beyond max_files"""
+        files = self.files()
+        for path in files[:max(len(files) - max(self.config['journal']['max_files'], 1), 0)]:
+            try:
+                path.unlink()
+            except OSError as e:
+                self.on_error(f"Could not remove old journal file {path.name}: {e}")
+    
+    def close_file(self):
+        if self.file is None:
+            return
+        if self.config['journal']['fsync'] == "os":
+            self.file.flush()
+        else:
+            self.sync()
+        self.file.close()
+        self.file = None
+        self.dirty = False
+    
+    def stop(self, timeout=5):
+        """Write what is queued, close the file and wait for the thread"""
+        try:
+            self.pending.put(None, timeout=timeout)
+        except queue.Full:
+            # The disk is stuck; the daemon thread is left behind
+            return
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+
+# AMI Listener Thread
+def ami_call_fields(event_data, dialed_legs):
+    """Map AMI call events onto (event, caller_id, destination, channel, uniqueid, linkedid)
+    
+    DialBegin names both parties. BridgeEnter and Hangup arrive once per
+    channel with the other party in ConnectedLineNum; only the dialed leg
+    (Uniqueid differs from Linkedid) is used, so each call yields one event
+    and the caller is always the party that placed it.
+    
+    Asterisk 11 sends Dial with SubEvent Begin instead of DialBegin, one
+    Bridge event naming both channels (Channel1 placed the call, Channel2
+    was dialed), and no Linkedid at all. The placing channel's Uniqueid
+    stands in for it: dialed_legs, an LRUCache, maps each dialed Uniqueid
+    to it, so a Hangup is kept only for a dialed leg. Returns None for
+    events to ignore.
+    """
+    event = event_data.get("Event", "")
+    
+    if event == "Dial":
+        if event_data.get('SubEvent') != "Begin":
+            return None
+        uniqueid = event_data.get('UniqueID', '')
+        linkedid = dialed_legs.get(uniqueid)
+        linkedid = uniqueid if linkedid is LRUCache.MISSING else linkedid
+        if event_data.get('DestUniqueID'):
+            dialed_legs.put(event_data['DestUniqueID'], linkedid)
+        # No DestCallerIDNum yet; the dial strings 100, trunk/0790... and
+        # 100@from-queue/n (a Local channel) all name the number dialed
+        destination = event_data.get('Dialstring', '').split('@', 1)[0].rsplit('/', 1)[-1]
+        return ("DialBegin", event_data.get('CallerIDNum', ''), destination,
+                event_data.get('Channel', ''), uniqueid, linkedid)
+    
+    if event == "Bridge" and "Channel1" in event_data:
+        if event_data.get('Bridgestate', "Link") != "Link":
+            return None
+        # The placing channel's Uniqueid is the Linkedid later versions report
+        return (event, event_data.get('CallerID1', ''), event_data.get('CallerID2', ''),
+                event_data.get('Channel2', ''), event_data.get('Uniqueid2', ''),
+                event_data.get('Uniqueid1', ''))
+    
+    if event == "BridgeEnter" or (event == "Hangup" and "DestCallerIDNum" not in event_data):
+        uniqueid = event_data.get('Uniqueid', '')
+        linkedid = event_data.get('Linkedid', '')
+        if not linkedid:
+            linkedid = dialed_legs.get(uniqueid)
+            if linkedid is LRUCache.MISSING:
+                return None
+        if uniqueid == linkedid:
+            return None
+        return ("Bridge" if event == "BridgeEnter" else event,
+                event_data.get('ConnectedLineNum', ''), event_data.get('CallerIDNum', ''),
+                event_data.get('Channel', ''), uniqueid, linkedid)
+    
+    if event in ("DialBegin", "Hangup", "Bridge"):
+        return (event, event_data.get('CallerIDNum', ''), event_data.get('DestCallerIDNum', ''),
+                event_data.get('Channel', ''), event_data.get('Uniqueid', ''),
+                event_data.get('Linkedid', ''))
+    return None
+
+# Call status writer
+class CallStatusWriter:
+    """Writes the call status file on its own thread so slow storage never blocks the reader"""
+    
+    def __init__(self, listener, heartbeat):
+        self.listener = listener
+        self.heartbeat = heartbeat
+        self.pending = queue.Queue()
+        self.abandoned = False
+        self.thread = threading.Thread(target=self.run, name="CallStatusWriter", daemon=True)
+    
+    def start(self):
+        self.thread.start()
+    
+    def submit(self, call):
+        self.pending.put(call)
+    
+    def run(self):
         try:
-            return base64.b64decode(encrypted_password.encode()).decode()
-        except:
-            return ""
+            self.write_loop()
+        finally:
+            diagnostics.release("writer")
     
-    def load_config(self):
-        """Load configuration from file"""
-        if not self.config_file.exists():
-            return self.default_config.copy()
-        
-        try:
-            with open(self.config_file, 'r', encoding='utf-8') as f:
-                config = json.load(f)
-            
-            # Merge with defaults to ensure all keys exist
-            result = self.default_config.copy()
-            result.update(config)
-            
-            # Decrypt password
-            if result['pbx']['password']:
-                result['pbx']['password'] = self.decrypt_password(result['pbx']['password'])
+    def write_loop(self):
+        """Write records in order and clear the file once the configured delay has passed"""
+        clear_at = None
+        while not self.abandoned:
+            self.heartbeat("writer")
+            timeout = 1.0 if clear_at is None else min(max(clear_at - time.monotonic(), 0), 1.0)
+            try:
+                call = self.pending.get(timeout=timeout)
+            except queue.Empty:
+                if clear_at is not None and time.monotonic() >= clear_at:
+                    clear_at = None
+                    self.listener.clear_call_status_file()
+                continue
             
-            return result
-        except Exception as e:
-            print(f"Error loading config: {e}")
-            return self.default_config.copy()
+            if call is None:
+                break
+            if call.event == "DialBegin":
+                self.listener.write_call_status(call)
+                clear_at = time.monotonic() + self.listener.config['agent']['auto_clear_delay']
+            elif call.event == "Hangup":
+                # Call ended - clear immediately
+                clear_at = None
+                self.listener.clear_call_status_file()
     
-    def save_config(self, config):
-        """Save configuration to file"""
-        try:
-            # Encrypt password before saving
-            config_to_save = config.copy()
-            if config_to_save['pbx']['password']:
-                config_to_save['pbx']['password'] = self.encrypt_password(config_to_save['pbx']['password'])
-            
-            with open(self.config_file, 'w', encoding='utf-8') as f:
-                json.dump(config_to_save, f, indent=4, ensure_ascii=False)
-            return True
-        except Exception as e:
-            print(f"Error saving config: {e}")
-            return False
+    def abandon(self):
+        """Give up on a stuck writer; returns records it had not started on"""
+        self.abandoned = True
+        calls = []
+        while True:
+            try:
+                call = self.pending.get_nowait()
+            except queue.Empty:
+                break
+            if call is not None:
+                calls.append(call)
+        self.pending.put(None)
+        return calls
+    
+    def stop(self):
+        """Finish queued records, then exit"""
+        self.pending.put(None)
 
-# AMI Listener Thread
 class AMIListenerThread(QThread):
     """AMI Listener running in separate thread"""
     
     status_changed = pyqtSignal(str)
-    call_event = pyqtSignal(dict)
+    call_event = pyqtSignal(object)  # CallEvent
+    ringing = pyqtSignal(object)  # CallEvent, ahead of call_event for the tray toast
     error_occurred = pyqtSignal(str)
+    status_written = pyqtSignal(dict)
     
-    def __init__(self, config):
+    CONNECT_TIMEOUT = 10      # seconds per connect and login attempt
+    CONNECT_STAGGER = 0.25    # head start given to each preferred endpoint
+    FAILBACK_INTERVAL = 30    # seconds between probes of preferred endpoints
+    STOP_TIMEOUT = 5          # seconds to wait for the thread before abandoning it
+    MAX_ABANDONED_WRITERS = 3 # stuck status writers kept before restarts stop
+    CALLS_TRACKED = 10000        # calls whose queue and repeat count are remembered
+    CALL_STATE_TTL = 4 * 3600    # seconds; matches CallTracker's max call age
+    
+    def __init__(self, config, watchdog=None, journal=None):
         super().__init__()
         self.config = config
+        self.watchdog = watchdog
+        self.journal = journal
         self.running = False
         self.socket = None
-        self.clear_timer = None
+        self.endpoints = AMIEndpoint.from_config(config['pbx'])
+        self.active_endpoint = None
+        self.failback_pending = threading.Event()
+        self.next_failback_probe = 0.0
+        self.broker = None
+        self.status_region = None
+        # An abandoned writer can wake up next to its replacement, and stop()
+        # closes the region from the GUI thread; nothing reopens it after stop
+        self.status_region_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.demo_active = False
+        self.detached = False
+        self.status_writer = CallStatusWriter(self, self.heartbeat)
+        # Held while submitting and while swapping writers, so no record can
+        # land on a stuck writer after its queue was carried over
+        self.status_writer_lock = threading.Lock()
+        self.abandoned_writers = []
+        self.enricher = self.create_enricher()
+        self.classifier = PrefixClassifier(config['enrichment']['country_code'])
+        self.repeat_counter = self.create_repeat_counter()
+        # Linkedid -> queue name, from the Queue*/Agent* events of that call
+        self.call_queues = LRUCache(self.CALLS_TRACKED, self.CALL_STATE_TTL)
+        # Asterisk 11 dialed Uniqueid -> Uniqueid of the channel that placed the call
+        self.dialed_legs = LRUCache(self.CALLS_TRACKED, self.CALL_STATE_TTL)
+        # Linkedid of inbound calls already counted as a repeat-caller attempt
+        self.counted_calls = LRUCache(self.CALLS_TRACKED, self.CALL_STATE_TTL)
+    
+    def create_enricher(self):
+        """Build a caller enricher from the current config"""
+        return CallerEnricher(
+            self.config,
+            on_error=self.error_occurred.emit,
+            on_reload=lambda count: self.status_changed.emit(f"Phonebook loaded ({count} numbers)")
+        )
+    
+    def create_repeat_counter(self):
+        """Build a repeat-caller counter from the current config"""
+        repeat_config = self.config['repeat_caller']
+        return SlidingWindowCounter(
+            repeat_config['window_minutes'] * 60,
+            repeat_config['buckets'],
+            repeat_config['max_tracked']
+        )
+    
+    def load_classification_rules(self):
+        """Compile the number classification rules, if configured"""
+        classifier = PrefixClassifier(self.config['enrichment']['country_code'])
+        rules_file = self.config['classification']['rules_file']
+        
+        if rules_file:
+            try:
+                count = classifier.load(rules_file)
+                self.status_changed.emit(f"Classification rules loaded ({count} prefixes)")
+            except Exception as e:
+                self.error_occurred.emit(f"Error loading classification rules: {str(e)}")
+                return
+        
+        # Swap in the finished trie so lookups never see a partial build
+        self.classifier = classifier
+    
+    def heartbeat(self, stage):
+        if self.watchdog:
+            self.watchdog.beat(stage)
+        diagnostics.sync(stage)
+    
+    def watch_stages(self):
+        """Register the reader and writer with the watchdog per the current config"""
+        if not self.watchdog:
+            return
+        watchdog_config = self.config['watchdog']
+        for stage in ("reader", "writer"):
+            if watchdog_config['enabled']:
+                self.watchdog.watch(stage, watchdog_config[f'{stage}_deadline_seconds'])
+            else:
+                self.watchdog.unwatch(stage)
+    
+    def apply_config_changes(self, sections, previous):
+        """Pick up changed config sections without dropping the AMI connection"""
+        # Agent (extension filter, status file, clear delay), logging and
+        # suppression settings are read per event and need no action here
+        if 'enrichment' in sections:
+            old_enricher = self.enricher
+            self.enricher = self.create_enricher()
+            old_enricher.stop()
+            if self.running:
+                self.enricher.start()
+        
+        if 'enrichment' in sections or 'classification' in sections:
+            threading.Thread(target=self.load_classification_rules, daemon=True).start()
+        
+        # Broker subscriptions are per extension, so resubscribe
+        if 'agent' in sections and self.config['broker']['mode'] == "client" and self.socket:
+            try:
+                self.socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        
+        if 'repeat_caller' in sections:
+            counter_keys = ('window_minutes', 'buckets', 'max_tracked')
+            old = previous.get('repeat_caller', {})
+            if any(old.get(key) != self.config['repeat_caller'][key] for key in counter_keys):
+                self.repeat_counter = self.create_repeat_counter()
+        
+        if 'watchdog' in sections and self.running:
+            self.watch_stages()
     
     def run(self):
         """Main listening loop"""
         self.running = True
         self.status_changed.emit("Connecting...")
+        self.watch_stages()
+        self.status_writer.start()
+        self.enricher.start()
+        self.load_classification_rules()
+        
+        mode = self.config['broker']['mode']
+        if mode == "broker":
+            self.start_broker()
         
         while self.running:
+            self.heartbeat("reader")
             try:
+                if mode == "client":
+                    self.listen_to_broker()
+                    if self.running:
+                        self.status_changed.emit("Broker connection lost - Retrying...")
+                        self.stop_event.wait(5)
+                    continue
+                
+                if not self.config['pbx']['enabled'] or not self.endpoints:
+                    self.run_synthetic_traffic()
+                    continue
+                
                 if not self.connect_ami():
                     self.status_changed.emit("Connection Failed - Retrying...")
-                    time.sleep(5)
+                    self.stop_event.wait(5)
                     continue
                 
-                self.status_changed.emit("Connected - Listening for calls...")
+                self.status_changed.emit(f"Connected to {self.active_endpoint.name} - Listening for calls...")
                 self.listen_for_events()
                 
             except Exception as e:
                 self.error_occurred.emit(f"Listening error: {str(e)}")
-                time.sleep(5)
+                self.stop_event.wait(5)
+        
+        diagnostics.release("reader")
+    
+    def start_broker(self):
+        """Publish parsed events to local clients alongside our own handling"""
+        broker_config = self.config['broker']
+        broker = EventBroker(broker_config['host'], broker_config['port'], broker_config['secret'],
+                             on_error=self.error_occurred.emit)
+        try:
+            broker.start()
+        except (OSError, ValueError) as e:
+            self.error_occurred.emit(f"Cannot start event broker on port {broker_config['port']}: {e}")
+            return
+        self.broker = broker
+        self.status_changed.emit(f"Event broker listening on {broker_config['host']}:{broker_config['port']}")
+    
+    def listen_to_broker(self):
+        """Receive pre-filtered events from the local broker instead of the PBX"""
+        broker_config = self.config['broker']
+        address = f"{broker_config['host']}:{broker_config['port']}"
+        try:
+            self.socket = socket.create_connection(
+                (broker_config['host'], broker_config['port']), timeout=self.CONNECT_TIMEOUT
+            )
+            subscribe = {'subscribe': self.config['agent']['extension'], 'key': broker_config['key']}
+            self.socket.sendall(json.dumps(subscribe).encode() + b"\n")
+        except OSError as e:
+            self.error_occurred.emit(f"Broker at {address} unavailable: {e}")
+            return
+        
+        self.status_changed.emit(f"Subscribed to broker at {address} - Listening for calls...")
+        buffer = b""
+        
+        while self.running and self.socket:
+            self.heartbeat("reader")
+            try:
+                data = self.socket.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if not data:
+                break
+            
+            buffer += data
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                try:
+                    message = json.loads(line)
+                except ValueError:
+                    continue
+                if message.get('type') == 'error':
+                    self.error_occurred.emit(f"Broker at {address} refused the subscription: {message.get('error')}")
+                elif message.get('type') == 'event':
+                    call = CallEvent.from_dict(
+                        message['call'],
+                        extension=self.config['agent']['extension'],
+                        mono_time=time.monotonic()
+                    )
+                    self.dispatch_call(call)
     
     def connect_ami(self):
-        """Connect to AMI interface"""
+        """Connect to the best reachable AMI endpoint"""
         try:
-            if not self.config['pbx']['enabled'] or not self.config['pbx']['ip']:
-                self.status_changed.emit("PBX not configured - Running in demo mode")
-                time.sleep(2)
-                # Generate demo events for testing
-                self.generate_demo_events()
+            endpoint, sock = self.race_endpoints()
+            if sock is None:
                 return False
             
-            self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.socket.settimeout(10)
-            self.socket.connect((self.config['pbx']['ip'], self.config['pbx']['port']))
-            
+            self.socket = sock
+            self.active_endpoint = endpoint
+            self.failback_pending.clear()
+            self.next_failback_probe = time.monotonic() + self.FAILBACK_INTERVAL
+            metrics.increment("ami.connects")
+            metrics.set_gauge("ami.active_endpoint", endpoint.name)
+            return True
+                
+        except Exception as e:
+            self.error_occurred.emit(f"Connection failed: {str(e)}")
+            return False
+    
+    def open_ami_session(self, endpoint):
+        """Connect and log in to one endpoint, returning the socket"""
+        sock = socket.create_connection((endpoint.host, endpoint.port), timeout=self.CONNECT_TIMEOUT)
+        try:
             # Login to AMI
             login_cmd = (
                 f"Action: Login\\r\\n"
@@ -178,35 +2654,132 @@ class AMIListenerThread(QThread):
                 f"Secret: {self.config['pbx']['password']}\\r\\n"
                 f"Events: on\\r\\n\\r\\n"
             )
-            self.socket.send(login_cmd.encode())
+            sock.send(login_cmd.encode())
             
-            response = self.socket.recv(1024).decode()
-            if "Authentication accepted" in response:
-                return True
-            else:
-                self.error_occurred.emit("AMI Authentication failed")
-                return False
-                
+            response = sock.recv(1024).decode()
+            if "Authentication accepted" not in response:
+                raise ConnectionError("AMI Authentication failed")
+            return sock
+        except Exception:
+            sock.close()
+            raise
+    
+    def attempt_endpoint(self, endpoint, results):
+        """Run one timed connection attempt and report the outcome"""
+        started = time.perf_counter()
+        try:
+            sock = self.open_ami_session(endpoint)
         except Exception as e:
-            self.error_occurred.emit(f"Connection failed: {str(e)}")
-            return False
+            endpoint.mark_failure()
+            results.put((endpoint, None, e))
+            return
+        
+        endpoint.mark_success(time.perf_counter() - started)
+        results.put((endpoint, sock, None))
+    
+    def race_endpoints(self):
+        """Start attempts in preference order, each after a short head start for the last"""
+        now = time.monotonic()
+        candidates = [e for e in self.endpoints if e.retry_at <= now] or list(self.endpoints)
+        candidates.sort(key=AMIEndpoint.sort_key)
+        
+        results = queue.Queue()
+        pending = 0
+        winner = (None, None)
+        
+        while self.running and (candidates or pending):
+            self.heartbeat("reader")
+            if candidates:
+                threading.Thread(
+                    target=self.attempt_endpoint, args=(candidates.pop(0), results), daemon=True
+                ).start()
+                pending += 1
+                wait = self.CONNECT_STAGGER
+            else:
+                wait = 1.0
+            
+            # A failure starts the next candidate immediately
+            try:
+                endpoint, sock, error = results.get(timeout=wait)
+            except queue.Empty:
+                continue
+            pending -= 1
+            
+            if sock is not None:
+                winner = (endpoint, sock)
+                break
+            self.error_occurred.emit(f"Connection to {endpoint.name} failed: {error}")
+        
+        if pending:
+            threading.Thread(target=self.close_late_sessions, args=(results, pending), daemon=True).start()
+        
+        if not self.running and winner[1] is not None:
+            winner[1].close()
+            winner = (None, None)
+        return winner
+    
+    @staticmethod
+    def close_late_sessions(results, pending):
+        """Close sessions from attempts that finished after the race was won"""
+        for _ in range(pending):
+            _, sock, _ = results.get()
+            if sock is not None:
+                sock.close()
+    
+    def check_failback(self):
+        """Periodically probe endpoints preferred over the active one"""
+        now = time.monotonic()
+        if now < self.next_failback_probe or self.failback_pending.is_set():
+            return
+        self.next_failback_probe = now + self.FAILBACK_INTERVAL
+        
+        preferred = [e for e in self.endpoints if e.priority < self.active_endpoint.priority]
+        if preferred:
+            threading.Thread(target=self.probe_endpoints, args=(preferred,), daemon=True).start()
+    
+    def probe_endpoints(self, endpoints):
+        """Probe preferred endpoints concurrently and flag a failback on the first login"""
+        results = queue.Queue()
+        for endpoint in endpoints:
+            threading.Thread(target=self.attempt_endpoint, args=(endpoint, results), daemon=True).start()
+        
+        # Dead hosts cost one connect timeout in total, not one each
+        for pending in range(len(endpoints), 0, -1):
+            _, sock, _ = results.get()
+            if sock is not None:
+                sock.close()
+                self.failback_pending.set()
+                if pending > 1:
+                    threading.Thread(target=self.close_late_sessions, args=(results, pending - 1),
+                                     daemon=True).start()
+                return
     
     def listen_for_events(self):
         """Listen for AMI events"""
         buffer = ""
         
         while self.running and self.socket:
+            self.heartbeat("reader")
+            self.check_failback()
+            if self.failback_pending.is_set():
+                self.status_changed.emit("Preferred PBX endpoint is back - failing back")
+                metrics.increment("ami.failbacks")
+                self.socket.close()
+                self.socket = None
+                break
+            
             try:
                 data = self.socket.recv(4096).decode(errors='ignore')
                 if not data:
                     break
+                received = time.monotonic()
                 
                 buffer += data
                 
                 # Process complete events
                 while "\\r\\n\\r\\n" in buffer:
                     event, buffer = buffer.split("\\r\\n\\r\\n", 1)
-                    self.process_event(event)
+                    self.process_event(event, received)
                     
             except socket.timeout:
                 continue
@@ -214,7 +2787,7 @@ class AMIListenerThread(QThread):
                 self.error_occurred.emit(f"Event processing error: {str(e)}")
                 break
     
-    def process_event(self, event_text):
+    def process_event(self, event_text, received=None):
         """Process AMI event"""
         lines = event_text.strip().split("\\r\\n")
         event_data = {}
@@ -224,106 +2797,236 @@ class AMIListenerThread(QThread):
                 key, value = line.split(": ", 1)
                 event_data[key.strip()] = value.strip()
         
-        event_type = event_data.get("Event", "")
+        self.handle_event(event_data, received)
+    
+    def handle_event(self, event_data, received=None):
+        """Turn parsed AMI event fields into a call event for the pipeline"""
+        if self.detached:
+            return
+        fields = ami_call_fields(event_data, self.dialed_legs)
+        
+        # Dial, bridge and hangup events carry no Queue header; the queue
+        # application's own events (QueueCallerJoin, AgentCalled, AgentConnect,
+        # or Join in Asterisk 11) name it, so remember it for the whole call
+        queue = event_data.get('Queue', '')
+        if queue and not fields:
+            call_key = event_data.get('Linkedid') or event_data.get('Uniqueid')
+            if call_key:
+                self.call_queues.put(call_key, queue)
         
         # Handle specific events
-        if event_type in ["DialBegin", "Hangup", "Bridge"]:
-            call_info = {
-                'event': event_type,
-                'caller_id': event_data.get('CallerIDNum', ''),
-                'destination': event_data.get('DestCallerIDNum', ''),
-                'channel': event_data.get('Channel', ''),
-                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'uniqueid': event_data.get('Uniqueid', '')
-            }
+        if fields:
+            if not queue:
+                queue = self.call_queues.get(fields[5] or fields[4])
+                queue = '' if queue is LRUCache.MISSING else queue
+            extension = self.config['agent']['extension']
+            call = CallEvent(
+                *fields,
+                queue,
+                extension,
+                time.time(),
+                received or time.monotonic(),
+            )
+            
+            if self.broker:
+                self.broker.publish(call)
             
             # Check if this concerns our extension
-            target_ext = self.config['agent']['extension']
-            if target_ext and (
-                call_info['destination'] == target_ext or
-                call_info['caller_id'] == target_ext or
-                target_ext in call_info['channel']
-            ):
-                self.call_event.emit(call_info)
-                self.update_call_status_file(call_info)
-    
-    def generate_demo_events(self):
-        """Generate demo events for testing when PBX is not configured"""
-        import random
+            if concerns_extension(call, extension):
+                self.dispatch_call(call)
+    
+    def dispatch_call(self, call):
+        """Enrich a call event and hand it to the sinks"""
+        call = call._replace(
+            repeat_count=self.count_repeat(call),
+            **self.enricher.lookup(call.caller_id),
+            **self.classifier.classify(call.caller_id)
+        )
+        suppressed = call.category in self.config['classification']['suppress_categories']
         
-        while self.running:
-            time.sleep(random.randint(10, 30))  # Random interval
-            
-            if not self.running:
-                break
-            
-            # Generate random call event
-            events = ["DialBegin", "Hangup"]
-            event_type = random.choice(events)
-            
-            call_info = {
-                'event': event_type,
-                'caller_id': f"0{random.randint(100000000, 999999999)}",
-                'destination': self.config['agent']['extension'] or "100",
-                'channel': f"SIP/trunk-{random.randint(1000, 9999)}",
-                'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                'uniqueid': str(random.randint(1000000, 9999999))
-            }
-            
-            self.call_event.emit(call_info)
-            self.update_call_status_file(call_info)
+        if self.journal:
+            self.journal.append(call)
+        
+        # The toast gets its own signal so it is not queued behind the table update
+        if (call.event == "DialBegin" and not suppressed and self.config['ui']['ring_notification']
+                and is_inbound(call)):
+            self.ringing.emit(call)
+        self.call_event.emit(call)
+        
+        # Suppressed categories (e.g. blocked ranges) never reach the CRM
+        if not suppressed:
+            self.update_call_status_file(call)
+    
+    def count_repeat(self, call):
+        """Return how often the caller of an inbound call called recently
+        
+        Only calls ringing the agent count: on an outbound call caller_id is
+        the agent's own extension. A queue that dials the agent again on the
+        same call starts a new leg with the same Linkedid, so each call is
+        counted once, on its first DialBegin.
+        """
+        if not is_inbound(call):
+            return 0
+        
+        call_key = call.linkedid or call.uniqueid
+        if call.event == "DialBegin" and self.counted_calls.get(call_key) is LRUCache.MISSING:
+            if call_key:
+                self.counted_calls.put(call_key, True)
+            return self.repeat_counter.add(call.caller_id)
+        return self.repeat_counter.count(call.caller_id)
+    
+    def run_synthetic_traffic(self):
+        """Feed generated call traffic through the normal event pipeline in real time"""
+        demo = self.config['demo']
+        seed = demo['seed'] or random.SystemRandom().randint(1, 2 ** 31 - 1)
+        speed = max(demo['speed'], 0.001)
+        
+        extensions = [str(e) for e in demo['extensions']]
+        own_extension = self.config['agent']['extension']
+        if own_extension and own_extension not in extensions:
+            extensions.append(own_extension)
+        traffic = SyntheticTraffic(demo, extensions or ["100"], seed)
+        
+        self.demo_active = True
+        self.status_changed.emit(f"PBX not configured - Running demo traffic (seed {seed})")
+        started = time.monotonic()
+        
+        try:
+            while self.running:
+                self.heartbeat("reader")
+                now = (time.monotonic() - started) * speed
+                for _, event_data in traffic.events_until(now):
+                    self.handle_event(event_data)
+                
+                wait = (traffic.next_event_time() - now) / speed
+                self.stop_event.wait(min(max(wait, 0.001), 1.0))
+        finally:
+            self.demo_active = False
+    
+    def update_call_status_file(self, call):
+        """Queue a call transition for the status file writer"""
+        with self.status_writer_lock:
+            self.status_writer.submit(call)
     
-    def update_call_status_file(self, call_info):
-        """Update CaCallstatus.dat file"""
+    def write_call_status(self, call):
+        """Write an incoming call to CaCallstatus.dat"""
         try:
             callstatus_file = self.config['agent']['callstatus_file']
             
-            if call_info['event'] == "DialBegin":
-                # Incoming call - write call data
-                xml_content = f"""<CRM>
+            enrichment = ""
+            if call.caller_name:
+                enrichment += f"\n        <CallerName>{escape(call.caller_name)}</CallerName>"
+            if call.account:
+                enrichment += f"\n        <Account>{escape(call.account)}</Account>"
+            if call.category:
+                enrichment += f"\n        <Category>{escape(call.category)}</Category>"
+            if call.label:
+                enrichment += f"\n        <Label>{escape(call.label)}</Label>"
+            if call.repeat_count > 1:
+                enrichment += f"\n        <RepeatCount>{call.repeat_count}</RepeatCount>"
+            
+            received = datetime.fromtimestamp(call.wall_time)
+            xml_content = f"""<CRM>
     <callRecord>
-        <CallerID>{call_info['caller_id']}</CallerID>
-        <DDI>{call_info['destination']}</DDI>
-        <Date>{datetime.now().strftime('%d-%m-%Y')}</Date>
-        <Time>{datetime.now().strftime('%H:%M:%S')}</Time>
+        <CallerID>{call.caller_id}</CallerID>
+        <DDI>{call.destination}</DDI>
+        <Date>{received.strftime('%d-%m-%Y')}</Date>
+        <Time>{received.strftime('%H:%M:%S')}</Time>{enrichment}
     </callRecord>
 </CRM>"""
-                
-                with open(callstatus_file, 'w', encoding='utf-8') as f:
-                    f.write(xml_content)
-                
-                # Set timer to clear file after delay
-                if self.clear_timer:
-                    self.clear_timer.cancel()
-                
-                self.clear_timer = threading.Timer(
-                    self.config['agent']['auto_clear_delay'],
-                    self.clear_call_status_file
-                )
-                self.clear_timer.start()
-                
-            elif call_info['event'] == "Hangup":
-                # Call ended - clear immediately
-                self.clear_call_status_file()
-                
+            
+            signature = write_status_text(callstatus_file, xml_content)
+            self.report_status_written(callstatus_file, xml_content, signature)
+            self.publish_shared_status(xml_content)
+            
         except Exception as e:
             self.error_occurred.emit(f"Error updating call status file: {str(e)}")
     
+    def detach(self):
+        """Cut off a thread that did not stop in time
+        
+        A replacement listener is already handling calls, so if this one
+        recovers it must not deliver duplicates to the window, history or journal.
+        """
+        self.detached = True
+        for signal in (self.status_changed, self.call_event, self.ringing,
+                       self.error_occurred, self.status_written):
+            try:
+                signal.disconnect()
+            except TypeError:
+                pass
+    
+    def restart_status_writer(self):
+        """Replace a stalled status writer, carrying over the records it had queued"""
+        self.abandoned_writers = [w for w in self.abandoned_writers if w.thread.is_alive()]
+        if len(self.abandoned_writers) >= self.MAX_ABANDONED_WRITERS:
+            return False
+        
+        with self.status_writer_lock:
+            stuck = self.status_writer
+            self.abandoned_writers.append(stuck)
+            self.status_writer = CallStatusWriter(self, self.heartbeat)
+            for call in stuck.abandon():
+                self.status_writer.submit(call)
+            self.status_writer.start()
+        return True
+    
     def clear_call_status_file(self):
         """Clear call status file"""
         try:
             callstatus_file = self.config['agent']['callstatus_file']
-            with open(callstatus_file, 'w', encoding='utf-8') as f:
-                f.write("")  # Clear file
+            signature = write_status_text(callstatus_file, "")  # Clear file
+            self.report_status_written(callstatus_file, "", signature)
         except Exception as e:
             self.error_occurred.emit(f"Error clearing call status file: {str(e)}")
+        self.publish_shared_status("")
     
-    def stop(self):
+    def report_status_written(self, path, content, signature):
+        """Tell the UI what was written to the status file and when"""
+        self.status_written.emit({
+            'path': path,
+            'content': content,
+            'written_at': time.time(),
+            'signature': signature,
+        })
+    
+    def publish_shared_status(self, content):
+        """Mirror the status record into the shared memory region, if configured"""
+        path = self.config['agent']['shared_status_file']
+        try:
+            with self.status_region_lock:
+                if self.status_region and self.status_region.path != path:
+                    self.status_region.close()
+                    self.status_region = None
+                if not path or not self.running:
+                    return
+                if self.status_region is None:
+                    self.status_region = StatusRegionWriter(path)
+                self.status_region.publish(content)
+        except Exception as e:
+            self.error_occurred.emit(f"Error updating shared call status: {str(e)}")
+    
+    def stop(self, timeout=STOP_TIMEOUT):
         """Stop the listener"""
         self.running = False
+        self.stop_event.set()
+        
+        if self.watchdog:
+            self.watchdog.unwatch("reader")
+            self.watchdog.unwatch("writer")
+        with self.status_writer_lock:
+            self.status_writer.stop()
         
-        if self.clear_timer:
-            self.clear_timer.cancel()
+        self.enricher.stop()
+        
+        if self.broker:
+            self.broker.stop()
+            self.broker = None
+        
+        with self.status_region_lock:
+            if self.status_region:
+                self.status_region.close()
+                self.status_region = None
         
         if self.socket:
             try:
@@ -332,30 +3035,387 @@ class AMIListenerThread(QThread):
                 pass
         
         self.quit()
-        self.wait()
+        # A hung thread is left behind rather than freezing the caller; returns False then
+        return self.wait(int(timeout * 1000))
+
+# Call history export worker
+class CallExportWorker(QThread):
+    """Streams call history from the store to a CSV file"""
+    
+    HEADER = ['Timestamp', 'Event', 'Caller ID', 'Destination', 'Channel', 'Unique ID',
+              'Caller Name', 'Account', 'Category', 'Label', 'Repeat Count']
+    FIELDS = ['timestamp', 'event', 'caller_id', 'destination', 'channel', 'uniqueid',
+              'caller_name', 'account', 'category', 'label', 'repeat_count']
+    
+    progress = pyqtSignal(int, int)
+    export_finished = pyqtSignal(str, int)
+    export_failed = pyqtSignal(str)
+    export_cancelled = pyqtSignal()
+    
+    def __init__(self, store, filters, filename, compress=False, chunk_size=5000, incremental=False):
+        super().__init__()
+        self.store = store
+        self.filters = filters
+        self.filename = str(filename)
+        self.compress = compress
+        self.chunk_size = chunk_size
+        self.incremental = incremental
+        self.cancelled = False
+        self.last_id = filters.get('after_id')
+    
+    def cancel(self):
+        """Request cancellation; the partial file is removed"""
+        self.cancelled = True
+    
+    def open_output(self, path):
+        """Open a buffered text writer, gzip-compressed if requested"""
+        if self.compress:
+            return gzip.open(path, 'wt', newline='', encoding='utf-8', compresslevel=6)
+        return open(path, 'w', newline='', encoding='utf-8', buffering=1024 * 1024)
+    
+    def run(self):
+        """Write the export to a temporary file and move it into place"""
+        temp_file = self.filename + ".part"
+        conn = None
+        
+        try:
+            conn = self.store.connect()
+            total = self.store.count(self.filters, conn)
+            written = 0
+            self.progress.emit(written, total)
+            
+            if self.incremental and not total:
+                # Nothing new since the last checkpoint; don't create a file
+                self.export_finished.emit("", 0)
+                return
+            
+            with self.open_output(temp_file) as f:
+                writer = csv.writer(f)
+                writer.writerow(self.HEADER)
+                
+                chunks = self.store.iter_chunks(
+                    self.filters, self.chunk_size, conn, by_id=self.incremental
+                )
+                for chunk in chunks:
+                    if self.cancelled:
+                        break
+                    
+                    writer.writerows([row[field] for field in self.FIELDS] for row in chunk)
+                    written += len(chunk)
+                    self.last_id = max(self.last_id or 0, max(row['id'] for row in chunk))
+                    self.progress.emit(written, total)
+            
+            if self.cancelled:
+                os.remove(temp_file)
+                self.export_cancelled.emit()
+                return
+            
+            os.replace(temp_file, self.filename)
+            self.export_finished.emit(self.filename, written)
+            
+        except Exception as e:
+            if os.path.exists(temp_file):
+                try:
+                    os.remove(temp_file)
+                except OSError:
+                    pass
+            self.export_failed.emit(str(e))
+        finally:
+            if conn:
+                conn.close()
+
+# Call history table model
+class CallHistoryModel(QAbstractTableModel):
+    """Table model that pages filtered call history in from the store"""
+    
+    HEADERS = ["Time", "Event", "Caller ID", "Name", "Category", "Repeat", "Destination", "Channel"]
+    FIELDS = ['timestamp', 'event', 'caller_id', 'caller_name', 'category', 'repeat_count',
+              'destination', 'channel']
+    
+    REPEAT_COLOR = QColor("#ffe0b2")
+    
+    def __init__(self, store, page_size=200, repeat_threshold=3, max_rows=1000):
+        super().__init__()
+        self.store = store
+        self.page_size = page_size
+        self.max_rows = max_rows
+        self.repeat_threshold = repeat_threshold
+        self.filters = {}
+        self.rows = []
+        self.exhausted = False
+        # While the window is hidden new records wait here instead of touching the view
+        self.suspended = False
+        self.pending = []
+        self.reload_on_resume = False
+    
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+    
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+    
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        
+        row = self.rows[index.row()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            field = self.FIELDS[index.column()]
+            value = row.get(field)
+            # Live rows carry only ts; format it when the cell is shown
+            if field == 'timestamp' and not value:
+                return format_timestamp(row['ts'])
+            return '' if value is None else str(value)
+        
+        # Highlight callers who keep calling back
+        if role == Qt.ItemDataRole.BackgroundRole:
+            if (row.get('repeat_count') or 0) >= self.repeat_threshold:
+                return self.REPEAT_COLOR
+        return None
+    
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.HEADERS[section]
+        return None
+    
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self.exhausted
+    
+    def fetchMore(self, parent=QModelIndex()):
+        """Load the next page of older matching records"""
+        if parent.isValid() or self.exhausted:
+            return
+        
+        before = (self.rows[-1]['ts'], self.rows[-1]['id']) if self.rows else None
+        page = self.store.query(self.filters, before=before, limit=self.page_size)
+        
+        if len(page) < self.page_size:
+            self.exhausted = True
+        
+        if page:
+            first = len(self.rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(page) - 1)
+            self.rows.extend(page)
+            self.endInsertRows()
+    
+    def set_filters(self, filters):
+        """Replace the active filters and load the first page"""
+        self.beginResetModel()
+        self.filters = filters
+        self.rows = []
+        self.exhausted = False
+        self.endResetModel()
+        self.fetchMore()
+    
+    def add_call(self, record):
+        """Show a newly stored record at the top if it matches the filters"""
+        if not self.store.matches(record, self.filters):
+            return False
+        
+        if self.suspended:
+            # More than a page is cheaper to reload from the store than to keep in memory
+            if self.reload_on_resume or len(self.pending) >= self.page_size:
+                self.pending = []
+                self.reload_on_resume = True
+            else:
+                self.pending.append(record)
+            return False
+        
+        self.beginInsertRows(QModelIndex(), 0, 0)
+        self.rows.insert(0, record)
+        self.endInsertRows()
+        self.trim()
+        return True
+    
+    def trim(self):
+        """Drop the oldest loaded rows beyond max_rows; scrolling pages them back in"""
+        if len(self.rows) <= self.max_rows:
+            return
+        self.beginRemoveRows(QModelIndex(), self.max_rows, len(self.rows) - 1)
+        del self.rows[self.max_rows:]
+        self.endRemoveRows()
+        self.exhausted = False
+    
+    def set_max_rows(self, max_rows):
+        self.max_rows = max_rows
+        self.trim()
+    
+    def suspend(self):
+        """Hold back new records until resume()"""
+        self.suspended = True
+    
+    def resume(self):
+        """Insert the records that arrived while suspended in one batch"""
+        self.suspended = False
+        pending, self.pending = self.pending, []
+        
+        if self.reload_on_resume:
+            self.reload_on_resume = False
+            self.set_filters(self.filters)
+        elif pending:
+            self.beginInsertRows(QModelIndex(), 0, len(pending) - 1)
+            self.rows[:0] = reversed(pending)
+            self.endInsertRows()
+            self.trim()
+    
+    def set_repeat_threshold(self, threshold):
+        """Change the repeat-caller highlight threshold and repaint loaded rows"""
+        self.repeat_threshold = threshold
+        if self.rows:
+            self.dataChanged.emit(
+                self.index(0, 0), self.index(len(self.rows) - 1, len(self.HEADERS) - 1)
+            )
+    
+    def clear(self):
+        """Drop all loaded rows"""
+        self.beginResetModel()
+        self.rows = []
+        self.exhausted = True
+        self.endResetModel()
+
+# Event loop lag monitor
+class EventLoopMonitor:
+    """Measures GUI event loop lag from the drift of a short timer and names the slow slot"""
+    
+    INTERVAL_MS = 50
+    SLOW_THRESHOLD_MS = 200
+    RECENT_WINDOWS = 30  # windows kept by recent(); 30 x 2 s status refreshes = 1 minute
+    
+    def __init__(self, on_slow):
+        self.on_slow = on_slow
+        self.expected = None
+        self.slowest = (0.0, None)  # longest tracked slot since the last tick
+        self.max_lag_ms = 0.0
+        self.window_max_ms = 0.0
+        self.window_slot = None
+        self.windows = deque(maxlen=self.RECENT_WINDOWS)
+        self.timer = QTimer()
+        self.timer.setTimerType(Qt.TimerType.PreciseTimer)
+        self.timer.timeout.connect(self.tick)
+    
+    def start(self):
+        self.expected = time.perf_counter() + self.INTERVAL_MS / 1000
+        self.timer.start(self.INTERVAL_MS)
+    
+    def stop(self):
+        """Stop sampling, e.g. while the window is hidden and the CPU should stay idle"""
+        self.timer.stop()
+    
+    def track(self, name, slot):
+        """Wrap a slot so its run time is attributed to it when the loop lags"""
+        try:
+            parameters = inspect.signature(slot).parameters.values()
+            accepted = None if any(p.kind == p.VAR_POSITIONAL for p in parameters) else len(parameters)
+        except (TypeError, ValueError):
+            accepted = None
+        
+        def timed(*args):
+            # Qt passes every signal argument; drop those the slot does not take
+            if accepted is not None:
+                args = args[:accepted]
+            started = time.perf_counter()
+            try:
+                return slot(*args)
+            finally:
+                elapsed = time.perf_counter() - started
+                if elapsed > self.slowest[0]:
+                    self.slowest = (elapsed, name)
+        return timed
+    
+    def tick(self):
+        now = time.perf_counter()
+        lag_ms = max(now - self.expected, 0.0) * 1000
+        self.expected = now + self.INTERVAL_MS / 1000
+        
+        metrics.observe("gui.loop_lag_ms", lag_ms)
+        if lag_ms > self.max_lag_ms:
+            self.max_lag_ms = lag_ms
+            metrics.set_gauge("gui.loop_lag_max_ms", round(lag_ms, 1))
+        
+        name = None
+        if lag_ms >= self.SLOW_THRESHOLD_MS:
+            elapsed, name = self.slowest
+            # Blame a tracked slot only if it accounts for most of the delay
+            if name is None or elapsed * 1000 < lag_ms / 2:
+                name = "untracked"
+            metrics.increment(f"gui.slow_slots.{name}")
+            self.on_slow(name, lag_ms, elapsed * 1000)
+        
+        if lag_ms > self.window_max_ms:
+            self.window_max_ms = lag_ms
+            self.window_slot = name
+        self.slowest = (0.0, None)
+    
+    def recent(self):
+        """Close the current window and return the worst (lag, slot) of the recent ones"""
+        self.windows.append((self.window_max_ms, self.window_slot))
+        self.window_max_ms = 0.0
+        self.window_slot = None
+        return max(self.windows, key=lambda window: window[0])
 
 # Main Application Window
 class ListenerMainWindow(QMainWindow):
     """Main application window"""
     
-    def __init__(self):
+    EXPORT_RETRY_DELAY_MS = 5 * 60 * 1000
+    HIDDEN_LOG_LINES = 1000
+    RING_TOAST_MS = 10000
+    journal_error = pyqtSignal(str)  # from the journal thread
+    STAGE_NAMES = {'reader': "AMI reader", 'writer': "Call status writer", 'gui': "GUI event loop"}
+    # Slots whose run time the lag monitor attributes; wrapped before any signal is connected
+    TRACKED_SLOTS = (
+        'on_call_event', 'on_ringing', 'on_status_written', 'on_status_file_changed',
+        'on_listener_status_changed', 'refresh_statistics', 'refresh_metrics', 'save_config',
+        'save_duration_sketches', 'apply_history_filters', 'export_call_history',
+        'on_export_progress', 'run_scheduled_export', 'reload_config_file', 'resume_rendering',
+    )
+    
+    def __init__(self, app_dir=None):
         super().__init__()
         
         # Get application directory
-        if getattr(sys, 'frozen', False):
-            # Running as compiled executable
-            self.app_dir = Path(sys.executable).parent
-        else:
-            # Running as script
-            self.app_dir = Path(__file__).parent.parent
+        self.app_dir = Path(app_dir) if app_dir else application_dir()
         
         # Initialize config manager
         self.config_manager = ConfigManager(self.app_dir)
         self.config = self.config_manager.load_config()
+        diagnostics.output_dir = self.app_dir / "logs"
+        
+        # Time the busy slots so event loop lag can be blamed on one of them
+        self.loop_monitor = EventLoopMonitor(self.on_loop_lag)
+        for name in self.TRACKED_SLOTS:
+            setattr(self, name, self.loop_monitor.track(name, getattr(self, name)))
         
         # Initialize variables
         self.ami_thread = None
-        self.call_history = []
+        self.call_store = CallHistoryStore(self.app_dir / "data" / "call_history.db")
+        self.call_model = CallHistoryModel(
+            self.call_store, repeat_threshold=self.config['repeat_caller']['threshold'],
+            max_rows=self.config['ui']['max_table_rows']
+        )
+        self.export_worker = None
+        self.export_progress = None
+        self.scheduled_export_worker = None
+        self.call_tracker = CallTracker()
+        self.call_stats = CallStatistics()
+        self.duration_sketches = self.load_duration_sketches()
+        
+        # Durable record of every call transition, written off the GUI thread
+        self.journal_error.connect(lambda message: self.add_log_entry(f"ERROR: {message}", level="ERROR"))
+        self.journal = EventJournal(self.app_dir / "data" / "journal", self.config, self.journal_error.emit)
+        
+        # Widget updates are skipped while the window sits in the tray
+        self.rendering_suspended = False
+        self.hidden_log_lines = deque(maxlen=self.HIDDEN_LOG_LINES)
+        self.hidden_log_dropped = 0
+        self.status_text = None
+        
+        # Commit batched history inserts shortly after the last event
+        self.history_commit_timer = QTimer()
+        self.history_commit_timer.setSingleShot(True)
+        self.history_commit_timer.timeout.connect(
+            self.loop_monitor.track("history_commit", self.call_store.commit)
+        )
         
         # Setup UI
         self.init_ui()
@@ -364,10 +3424,69 @@ class ListenerMainWindow(QMainWindow):
         # Setup system tray
         self.setup_system_tray()
         
-        # Setup auto-save timer
-        self.auto_save_timer = QTimer()
-        self.auto_save_timer.timeout.connect(self.save_config)
-        self.auto_save_timer.start(30000)  # Save every 30 seconds
+        # Setup scheduled export timer
+        self.scheduled_export_timer = QTimer()
+        self.scheduled_export_timer.setSingleShot(True)
+        self.scheduled_export_timer.timeout.connect(self.run_scheduled_export)
+        self.schedule_next_export()
+        
+        # Save percentile sketches periodically so a crash loses little
+        self.sketch_save_timer = QTimer()
+        self.sketch_save_timer.timeout.connect(self.save_duration_sketches)
+        self.sketch_save_timer.start(5 * 60 * 1000)
+        
+        # Watch the reader, the status writer and this event loop for stalls
+        self.abandoned_listeners = []
+        self.listener_status = None
+        self.stalled_stages = set()
+        self.status_before_stall = None
+        self.watchdog = Watchdog()
+        self.watchdog.stalled.connect(self.on_stage_stalled)
+        self.watchdog.recovered.connect(self.on_stage_recovered)
+        self.gui_heartbeat_timer = QTimer()
+        self.gui_heartbeat_timer.timeout.connect(self.on_gui_heartbeat)
+        self.gui_heartbeat_timer.start(1000)
+        self.configure_gui_watch()
+        self.watchdog.start()
+        self.restore_from_journal()
+        self.journal.start()
+        
+        self.loop_monitor.start()
+        self.loop_lag_timer = QTimer()
+        self.loop_lag_timer.timeout.connect(self.refresh_loop_lag)
+        self.loop_lag_timer.start(2000)
+        
+        # Profiling and memory snapshots on demand, also over a local control socket
+        diagnostics.message.connect(self.on_diagnostics_message)
+        self.control_server = None
+        self.start_control_server()
+        
+        # Apply edits to config.json while running
+        self.config_watcher = QFileSystemWatcher(self)
+        self.config_watcher.fileChanged.connect(self.on_config_file_changed)
+        self.config_watcher.directoryChanged.connect(self.on_config_file_changed)
+        self.config_watcher.addPath(str(self.config_manager.config_dir))
+        self.watch_config_file()
+        self.config_reload_timer = QTimer()
+        self.config_reload_timer.setSingleShot(True)
+        self.config_reload_timer.timeout.connect(self.reload_config_file)
+        
+        for problem in self.config_manager.problems:
+            self.add_log_entry(f"Config: {problem}", level="WARNING")
+        if self.duration_sketches_error:
+            self.add_log_entry(f"ERROR: {self.duration_sketches_error}", level="ERROR")
+        
+        # Persist PBX and agent edits shortly after the user stops typing
+        self.config_save_timer = QTimer()
+        self.config_save_timer.setSingleShot(True)
+        self.config_save_timer.timeout.connect(self.save_config)
+        for edit in (self.pbx_ip_edit, self.pbx_username_edit, self.pbx_password_edit,
+                     self.extension_edit, self.callstatus_path_edit,
+                     self.phonebook_path_edit, self.rules_path_edit):
+            edit.textChanged.connect(self.schedule_config_save)
+        for spin in (self.pbx_port_spin, self.auto_clear_spin):
+            spin.valueChanged.connect(self.schedule_config_save)
+        self.pbx_enabled_cb.toggled.connect(self.schedule_config_save)
     
     def init_ui(self):
         """Initialize user interface"""
@@ -394,11 +3513,14 @@ class ListenerMainWindow(QMainWindow):
         self.create_control_tab()
         self.create_logs_tab()
         self.create_settings_tab()
+        self.create_metrics_tab()
         
         # Status bar
         self.status_bar = QStatusBar()
         self.setStatusBar(self.status_bar)
         self.status_bar.showMessage("Ready")
+        self.loop_lag_label = QLabel()
+        self.status_bar.addPermanentWidget(self.loop_lag_label)
         
         # Apply styling
         self.apply_styling()
@@ -487,6 +3609,7 @@ class ListenerMainWindow(QMainWindow):
     def create_agent_tab(self):
         """Create agent settings tab"""
         tab = QWidget()
+        self.agent_tab = tab
         self.tab_widget.addTab(tab, "👤 Agent Settings")
         
         layout = QVBoxLayout(tab)
@@ -522,6 +3645,34 @@ class ListenerMainWindow(QMainWindow):
         self.auto_clear_spin.setValue(self.config['agent']['auto_clear_delay'])
         agent_layout.addWidget(self.auto_clear_spin, 2, 1)
         
+        # Phonebook for caller ID enrichment
+        agent_layout.addWidget(QLabel("Phonebook (CSV/SQLite):"), 3, 0)
+        phonebook_layout = QHBoxLayout()
+        
+        self.phonebook_path_edit = QLineEdit(self.config['enrichment']['phonebook_file'])
+        self.phonebook_path_edit.setPlaceholderText("Optional - number,name,account")
+        phonebook_layout.addWidget(self.phonebook_path_edit)
+        
+        phonebook_browse_btn = QPushButton("📁 Browse")
+        phonebook_browse_btn.clicked.connect(self.browse_phonebook_file)
+        phonebook_layout.addWidget(phonebook_browse_btn)
+        
+        agent_layout.addLayout(phonebook_layout, 3, 1)
+        
+        # Number classification rules
+        agent_layout.addWidget(QLabel("Number rules (CSV):"), 4, 0)
+        rules_layout = QHBoxLayout()
+        
+        self.rules_path_edit = QLineEdit(self.config['classification']['rules_file'])
+        self.rules_path_edit.setPlaceholderText("Optional - prefix,category,label")
+        rules_layout.addWidget(self.rules_path_edit)
+        
+        rules_browse_btn = QPushButton("📁 Browse")
+        rules_browse_btn.clicked.connect(self.browse_rules_file)
+        rules_layout.addWidget(rules_browse_btn)
+        
+        agent_layout.addLayout(rules_layout, 4, 1)
+        
         layout.addWidget(agent_group)
         
         # File Preview Group
@@ -557,6 +3708,12 @@ class ListenerMainWindow(QMainWindow):
         
         layout.addStretch()
         
+        # Preview follows the listener's writes; the watcher catches outside edits
+        self.status_preview = None
+        self.status_file_watcher = QFileSystemWatcher(self)
+        self.status_file_watcher.fileChanged.connect(self.on_status_file_changed)
+        self.tab_widget.currentChanged.connect(self.on_tab_changed)
+        
         # Load initial preview
         self.refresh_file_preview()
     
@@ -584,25 +3741,111 @@ class ListenerMainWindow(QMainWindow):
         self.stop_btn.setMinimumHeight(50)
         btn_layout.addWidget(self.stop_btn)
         
-        control_layout.addLayout(btn_layout)
+        control_layout.addLayout(btn_layout)
+        
+        # Status display
+        self.status_label = QLabel("Status: Ready to start")
+        self.status_label.setStyleSheet("font-weight: bold; font-size: 14px; color: blue;")
+        control_layout.addWidget(self.status_label)
+        
+        layout.addWidget(control_group)
+        
+        # Statistics panel
+        stats_group = QGroupBox("Statistics")
+        stats_layout = QGridLayout(stats_group)
+        
+        stats_columns = ["Calls", "Answered", "Missed", "Avg Ring", "Avg Talk"]
+        for column, title in enumerate(stats_columns, start=1):
+            stats_layout.addWidget(QLabel(f"<b>{title}</b>"), 0, column)
+        
+        self.stats_labels = {}
+        for row, period in enumerate(["Today", "Last 60 min"], start=1):
+            stats_layout.addWidget(QLabel(f"<b>{period}</b>"), row, 0)
+            self.stats_labels[period] = []
+            for column in range(1, len(stats_columns) + 1):
+                label = QLabel("-")
+                stats_layout.addWidget(label, row, column)
+                self.stats_labels[period].append(label)
+        
+        self.hourly_stats_label = QLabel()
+        self.hourly_stats_label.setWordWrap(True)
+        stats_layout.addWidget(self.hourly_stats_label, 3, 0, 1, len(stats_columns) + 1)
+        
+        self.percentile_stats_label = QLabel()
+        self.percentile_stats_label.setWordWrap(True)
+        stats_layout.addWidget(self.percentile_stats_label, 4, 0, 1, len(stats_columns))
         
-        # Status display
-        self.status_label = QLabel("Status: Ready to start")
-        self.status_label.setStyleSheet("font-weight: bold; font-size: 14px; color: blue;")
-        control_layout.addWidget(self.status_label)
+        merge_sketches_btn = QPushButton("📊 Floor View")
+        merge_sketches_btn.setToolTip("Merge percentile data saved by several agents")
+        merge_sketches_btn.clicked.connect(self.show_floor_percentiles)
+        stats_layout.addWidget(merge_sketches_btn, 4, len(stats_columns))
         
-        layout.addWidget(control_group)
+        layout.addWidget(stats_group)
+        
+        # Refresh at a fixed low rate so bursts of events cost nothing extra
+        self.stats_timer = QTimer()
+        self.stats_timer.timeout.connect(self.refresh_statistics)
+        self.stats_timer.start(5000)
+        self.refresh_statistics()
         
         # Call History Table
         history_group = QGroupBox("Call History")
         history_layout = QVBoxLayout(history_group)
         
+        # Filter bar
+        filter_layout = QHBoxLayout()
+        
+        self.filter_caller_edit = QLineEdit()
+        self.filter_caller_edit.setPlaceholderText("Caller ID prefix")
+        self.filter_caller_edit.returnPressed.connect(self.apply_history_filters)
+        filter_layout.addWidget(self.filter_caller_edit)
+        
+        self.filter_from_cb = QCheckBox("From")
+        filter_layout.addWidget(self.filter_from_cb)
+        self.filter_from_edit = QDateTimeEdit(QDateTime.currentDateTime().addDays(-7))
+        self.filter_from_edit.setCalendarPopup(True)
+        self.filter_from_edit.setDisplayFormat("yyyy-MM-dd HH:mm")
+        filter_layout.addWidget(self.filter_from_edit)
+        
+        self.filter_to_cb = QCheckBox("To")
+        filter_layout.addWidget(self.filter_to_cb)
+        self.filter_to_edit = QDateTimeEdit(QDateTime.currentDateTime())
+        self.filter_to_edit.setCalendarPopup(True)
+        self.filter_to_edit.setDisplayFormat("yyyy-MM-dd HH:mm")
+        filter_layout.addWidget(self.filter_to_edit)
+        
+        self.filter_event_combo = QComboBox()
+        self.filter_event_combo.addItems(["All Events", "DialBegin", "Bridge", "Hangup"])
+        filter_layout.addWidget(self.filter_event_combo)
+        
+        self.filter_category_combo = QComboBox()
+        self.filter_category_combo.setEditable(True)
+        self.filter_category_combo.addItems(
+            ["All Categories", "mobile", "landline", "international", "vip", "blocked"]
+        )
+        filter_layout.addWidget(self.filter_category_combo)
+        
+        self.filter_extension_edit = QLineEdit()
+        self.filter_extension_edit.setPlaceholderText("Extension")
+        self.filter_extension_edit.setMaximumWidth(90)
+        self.filter_extension_edit.returnPressed.connect(self.apply_history_filters)
+        filter_layout.addWidget(self.filter_extension_edit)
+        
+        search_btn = QPushButton("🔍 Search")
+        search_btn.clicked.connect(self.apply_history_filters)
+        filter_layout.addWidget(search_btn)
+        
+        reset_filter_btn = QPushButton("✖ Reset")
+        reset_filter_btn.clicked.connect(self.reset_history_filters)
+        filter_layout.addWidget(reset_filter_btn)
+        
+        history_layout.addLayout(filter_layout)
+        
         # Table
-        self.call_table = QTableWidget()
-        self.call_table.setColumnCount(5)
-        self.call_table.setHorizontalHeaderLabels([
-            "Time", "Event", "Caller ID", "Destination", "Channel"
-        ])
+        self.call_table = QTableView()
+        self.call_table.setModel(self.call_model)
+        self.call_table.setSelectionBehavior(QAbstractItemView.SelectionBehavior.SelectRows)
+        self.call_table.verticalHeader().setVisible(False)
         
         # Set column widths
         header = self.call_table.horizontalHeader()
@@ -610,6 +3853,12 @@ class ListenerMainWindow(QMainWindow):
         
         history_layout.addWidget(self.call_table)
         
+        self.search_result_label = QLabel()
+        history_layout.addWidget(self.search_result_label)
+        
+        # Load the most recent page of history
+        self.apply_history_filters()
+        
         # Table controls
         table_btn_layout = QHBoxLayout()
         
@@ -636,6 +3885,8 @@ class ListenerMainWindow(QMainWindow):
         # Log display
         self.log_display = QTextEdit()
         self.log_display.setReadOnly(True)
+        # Oldest lines are dropped so weeks in the tray do not grow the document
+        self.log_display.document().setMaximumBlockCount(self.config['logging']['max_display_lines'])
         self.log_display.setFont(QFont("Consolas", 9))
         layout.addWidget(self.log_display)
         
@@ -662,6 +3913,39 @@ class ListenerMainWindow(QMainWindow):
         # Add initial log entry
         self.add_log_entry("Application started")
     
+    def create_metrics_tab(self):
+        """Create runtime metrics tab"""
+        tab = QWidget()
+        self.metrics_tab = tab
+        self.tab_widget.addTab(tab, "📈 Metrics")
+        
+        layout = QVBoxLayout(tab)
+        
+        self.metrics_table = QTableWidget(0, 2)
+        self.metrics_table.setHorizontalHeaderLabels(["Metric", "Value"])
+        self.metrics_table.horizontalHeader().setStretchLastSection(True)
+        self.metrics_table.verticalHeader().setVisible(False)
+        self.metrics_table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        layout.addWidget(self.metrics_table)
+        
+        # Only refresh while the tab is on screen
+        self.metrics_timer = QTimer()
+        self.metrics_timer.timeout.connect(self.refresh_metrics)
+        self.metrics_timer.start(2000)
+        self.tab_widget.currentChanged.connect(lambda index: self.refresh_metrics())
+    
+    def refresh_metrics(self):
+        """Show the current metrics snapshot"""
+        if self.tab_widget.currentWidget() is not self.metrics_tab or not self.isVisible():
+            return
+        
+        rows = metrics.snapshot()
+        self.metrics_table.setRowCount(len(rows))
+        for row, (name, value) in enumerate(rows):
+            self.metrics_table.setItem(row, 0, QTableWidgetItem(name))
+            self.metrics_table.setItem(row, 1, QTableWidgetItem(value))
+        self.metrics_table.resizeColumnToContents(0)
+    
     def create_settings_tab(self):
         """Create general settings tab"""
         tab = QWidget()
@@ -690,6 +3974,11 @@ class ListenerMainWindow(QMainWindow):
         self.minimize_tray_cb.setChecked(self.config['ui']['minimize_to_tray'])
         ui_layout.addWidget(self.minimize_tray_cb, 2, 0, 1, 2)
         
+        # Incoming call toast
+        self.ring_notification_cb = QCheckBox("Show a tray notification when a call rings")
+        self.ring_notification_cb.setChecked(self.config['ui']['ring_notification'])
+        ui_layout.addWidget(self.ring_notification_cb, 3, 0, 1, 2)
+        
         layout.addWidget(ui_group)
         
         # Logging Settings
@@ -710,8 +3999,89 @@ class ListenerMainWindow(QMainWindow):
         self.max_files_spin.setValue(self.config['logging']['max_files'])
         logging_layout.addWidget(self.max_files_spin, 1, 1)
         
+        # Event journal
+        self.journal_enabled_cb = QCheckBox("Journal every call event to data/journal")
+        self.journal_enabled_cb.setChecked(self.config['journal']['enabled'])
+        logging_layout.addWidget(self.journal_enabled_cb, 2, 0, 1, 2)
+        
+        logging_layout.addWidget(QLabel("Journal fsync:"), 3, 0)
+        self.journal_fsync_combo = QComboBox()
+        self.journal_fsync_combo.addItems(["always", "interval", "os"])
+        self.journal_fsync_combo.setCurrentText(self.config['journal']['fsync'])
+        logging_layout.addWidget(self.journal_fsync_combo, 3, 1)
+        
+        logging_layout.addWidget(QLabel("Fsync interval (ms):"), 4, 0)
+        self.journal_interval_spin = QSpinBox()
+        self.journal_interval_spin.setRange(10, 60000)
+        self.journal_interval_spin.setValue(self.config['journal']['fsync_interval_ms'])
+        logging_layout.addWidget(self.journal_interval_spin, 4, 1)
+        
         layout.addWidget(logging_group)
         
+        # Scheduled export settings
+        export_group = QGroupBox("Scheduled Export")
+        export_layout = QGridLayout(export_group)
+        
+        self.export_enabled_cb = QCheckBox("Export new calls automatically")
+        self.export_enabled_cb.setChecked(self.config['export']['enabled'])
+        export_layout.addWidget(self.export_enabled_cb, 0, 0, 1, 2)
+        
+        export_layout.addWidget(QLabel("Export folder:"), 1, 0)
+        export_folder_layout = QHBoxLayout()
+        self.export_folder_edit = QLineEdit(self.config['export']['folder'])
+        export_folder_layout.addWidget(self.export_folder_edit)
+        export_browse_btn = QPushButton("📁 Browse")
+        export_browse_btn.clicked.connect(self.browse_export_folder)
+        export_folder_layout.addWidget(export_browse_btn)
+        export_layout.addLayout(export_folder_layout, 1, 1)
+        
+        export_layout.addWidget(QLabel("Interval (hours):"), 2, 0)
+        self.export_interval_spin = QSpinBox()
+        self.export_interval_spin.setRange(1, 168)
+        self.export_interval_spin.setValue(self.config['export']['interval_hours'])
+        export_layout.addWidget(self.export_interval_spin, 2, 1)
+        
+        self.export_compress_cb = QCheckBox("Compress exports (.csv.gz)")
+        self.export_compress_cb.setChecked(self.config['export']['compress'])
+        export_layout.addWidget(self.export_compress_cb, 3, 0, 1, 2)
+        
+        export_now_btn = QPushButton("📤 Run Export Now")
+        export_now_btn.clicked.connect(self.run_scheduled_export)
+        export_layout.addWidget(export_now_btn, 4, 0)
+        
+        self.export_status_label = QLabel()
+        export_layout.addWidget(self.export_status_label, 4, 1)
+        
+        layout.addWidget(export_group)
+        
+        # Diagnostics
+        diagnostics_group = QGroupBox("Diagnostics")
+        diagnostics_layout = QGridLayout(diagnostics_group)
+        
+        self.profile_btn = QPushButton("⏱️ Start Profiling")
+        self.profile_btn.clicked.connect(self.toggle_profiling)
+        diagnostics_layout.addWidget(self.profile_btn, 0, 0)
+        
+        memory_snapshot_btn = QPushButton("🧠 Memory Snapshot")
+        memory_snapshot_btn.clicked.connect(lambda: diagnostics.run_command('memory-snapshot'))
+        diagnostics_layout.addWidget(memory_snapshot_btn, 0, 1)
+        
+        memory_stop_btn = QPushButton("⏹️ Stop Memory Tracing")
+        memory_stop_btn.clicked.connect(lambda: diagnostics.run_command('memory-stop'))
+        diagnostics_layout.addWidget(memory_stop_btn, 0, 2)
+        
+        diagnostics_layout.addWidget(QLabel("Control port (0 = off):"), 1, 0)
+        self.control_port_spin = QSpinBox()
+        self.control_port_spin.setRange(0, 65535)
+        self.control_port_spin.setValue(self.config['diagnostics']['control_port'])
+        diagnostics_layout.addWidget(self.control_port_spin, 1, 1)
+        
+        self.diagnostics_label = QLabel(diagnostics.status())
+        self.diagnostics_label.setWordWrap(True)
+        diagnostics_layout.addWidget(self.diagnostics_label, 2, 0, 1, 3)
+        
+        layout.addWidget(diagnostics_group)
+        
         # About section
         about_group = QGroupBox("About")
         about_layout = QVBoxLayout(about_group)
@@ -835,12 +4205,56 @@ class ListenerMainWindow(QMainWindow):
         """Handle system tray icon activation"""
         if reason == QSystemTrayIcon.ActivationReason.DoubleClick:
             if self.isVisible():
-                self.hide()
+                self.hide_to_tray()
             else:
                 self.show()
                 self.raise_()
                 self.activateWindow()
     
+    def hide_to_tray(self):
+        """Hide the window and stop updating its widgets"""
+        self.rendering_suspended = True
+        self.call_model.suspend()
+        # The 50 ms lag sampler would keep waking an otherwise idle process
+        self.loop_monitor.stop()
+        self.loop_lag_timer.stop()
+        self.hide()
+    
+    def showEvent(self, event):
+        super().showEvent(event)
+        if self.rendering_suspended:
+            self.resume_rendering()
+    
+    def resume_rendering(self):
+        """Bring every widget up to date in one pass after being hidden"""
+        self.rendering_suspended = False
+        self.loop_monitor.start()
+        self.loop_lag_timer.start(2000)
+        
+        self.call_model.resume()
+        self.call_table.scrollToTop()
+        self.update_search_result_label()
+        
+        lines = list(self.hidden_log_lines)
+        if self.hidden_log_dropped:
+            lines.insert(0, f"... {self.hidden_log_dropped} earlier log lines were not kept while hidden")
+        self.hidden_log_lines.clear()
+        self.hidden_log_dropped = 0
+        if lines:
+            self.log_display.setUpdatesEnabled(False)
+            for line in lines:
+                self.log_display.append(line)
+            self.log_display.setUpdatesEnabled(True)
+            if self.auto_scroll_logs:
+                self.scroll_logs_to_end()
+        
+        if self.status_text:
+            self.show_status(*self.status_text)
+        self.refresh_statistics()
+        self.refresh_metrics()
+        if self.tab_widget.currentWidget() is self.agent_tab:
+            self.show_status_preview()
+    
     # Event handlers
     def on_pbx_enabled_changed(self):
         """Handle PBX enabled checkbox change"""
@@ -951,31 +4365,119 @@ class ListenerMainWindow(QMainWindow):
             self.callstatus_path_edit.setText(filename)
             self.add_log_entry(f"Call status file path set to: {filename}")
     
+    def browse_phonebook_file(self):
+        """Browse for the caller ID phonebook"""
+        filename, _ = QFileDialog.getOpenFileName(
+            self,
+            "Choose Phonebook",
+            self.phonebook_path_edit.text() or str(self.app_dir / "data"),
+            "Phonebooks (*.csv *.db *.sqlite);;All Files (*)"
+        )
+        
+        if filename:
+            self.phonebook_path_edit.setText(filename)
+            self.add_log_entry(f"Phonebook set to: {filename}")
+    
+    def browse_rules_file(self):
+        """Browse for the number classification rules"""
+        filename, _ = QFileDialog.getOpenFileName(
+            self,
+            "Choose Number Rules",
+            self.rules_path_edit.text() or str(self.app_dir / "config"),
+            "CSV Files (*.csv);;All Files (*)"
+        )
+        
+        if filename:
+            self.rules_path_edit.setText(filename)
+            self.add_log_entry(f"Number rules set to: {filename}")
+    
     def refresh_file_preview(self):
-        """Refresh call status file preview"""
+        """Re-read the call status file from disk into the preview"""
         filepath = self.callstatus_path_edit.text()
+        self.watch_status_file(filepath)
         
         if not filepath or not os.path.exists(filepath):
+            self.status_preview = None
             self.file_preview.setText("File does not exist or path not set")
             return
         
         try:
             with open(filepath, 'r', encoding='utf-8') as f:
                 content = f.read()
+                stat = os.fstat(f.fileno())
             
-            if content.strip():
-                self.file_preview.setText(content)
-            else:
-                self.file_preview.setText("File is empty (ready for next call)")
+            self.status_preview = {
+                'path': filepath,
+                'content': content,
+                'written_at': stat.st_mtime,
+                'signature': file_signature(stat),
+            }
+            self.show_status_preview()
                 
         except Exception as e:
+            self.status_preview = None
             self.file_preview.setText(f"Error reading file: {str(e)}")
     
+    def show_status_preview(self):
+        """Show the last known status file content without touching the disk"""
+        preview = self.status_preview
+        if preview is None or preview['path'] != self.callstatus_path_edit.text():
+            self.refresh_file_preview()
+            return
+        
+        if preview['content'].strip():
+            self.file_preview.setText(preview['content'])
+        else:
+            self.file_preview.setText("File is empty (ready for next call)")
+    
+    def watch_status_file(self, path):
+        """Point the file watcher at the current call status file"""
+        watched = self.status_file_watcher.files()
+        if watched == [path]:
+            return
+        if watched:
+            self.status_file_watcher.removePaths(watched)
+        if path and os.path.exists(path):
+            self.status_file_watcher.addPath(path)
+    
+    def on_status_written(self, info):
+        """Cache what the listener wrote and update the preview if it is visible"""
+        self.status_preview = info
+        self.watch_status_file(info['path'])
+        
+        if self.tab_widget.currentWidget() is self.agent_tab and self.isVisible():
+            self.show_status_preview()
+    
+    def on_status_file_changed(self, path):
+        """Re-read the status file only when something other than us changed it"""
+        # Writers that replace the file drop it from the watch list
+        self.watch_status_file(path)
+        
+        preview = self.status_preview
+        if preview is not None and preview['path'] == path:
+            try:
+                stat = os.stat(path)
+                if file_signature(stat) == preview['signature']:
+                    return
+            except OSError:
+                pass
+        
+        if self.tab_widget.currentWidget() is self.agent_tab and self.isVisible():
+            self.refresh_file_preview()
+        else:
+            self.status_preview = None
+    
+    def on_tab_changed(self, index):
+        if self.tab_widget.widget(index) is self.agent_tab:
+            self.show_status_preview()
+    
     def save_agent_settings(self):
         """Save agent settings"""
         self.config['agent']['extension'] = self.extension_edit.text().strip()
         self.config['agent']['callstatus_file'] = self.callstatus_path_edit.text()
         self.config['agent']['auto_clear_delay'] = self.auto_clear_spin.value()
+        self.config['enrichment']['phonebook_file'] = self.phonebook_path_edit.text().strip()
+        self.config['classification']['rules_file'] = self.rules_path_edit.text().strip()
         
         if self.config_manager.save_config(self.config):
             QMessageBox.information(self, "Success", "Agent settings saved successfully!")
@@ -1015,11 +4517,7 @@ class ListenerMainWindow(QMainWindow):
         self.save_config()
         
         # Create and start AMI thread
-        self.ami_thread = AMIListenerThread(self.config)
-        self.ami_thread.status_changed.connect(self.on_listener_status_changed)
-        self.ami_thread.call_event.connect(self.on_call_event)
-        self.ami_thread.error_occurred.connect(self.on_listener_error)
-        
+        self.ami_thread = self.create_listener()
         self.ami_thread.start()
         
         # Update UI
@@ -1028,62 +4526,354 @@ class ListenerMainWindow(QMainWindow):
         
         self.add_log_entry("AMI Listener started")
     
-    def stop_listener(self):
+    def create_listener(self):
+        """Build a listener wired to this window"""
+        listener = AMIListenerThread(self.config, self.watchdog, self.journal)
+        listener.status_changed.connect(self.on_listener_status_changed)
+        listener.ringing.connect(self.on_ringing)
+        listener.call_event.connect(self.on_call_event)
+        listener.status_written.connect(self.on_status_written)
+        listener.error_occurred.connect(self.on_listener_error)
+        return listener
+    
+    def stop_listener(self, timeout=AMIListenerThread.STOP_TIMEOUT):
         """Stop the AMI listener"""
         if self.ami_thread:
-            self.ami_thread.stop()
+            self.abandoned_listeners = [t for t in self.abandoned_listeners if t.isRunning()]
+            if not self.ami_thread.stop(timeout):
+                # Keep a reference: Qt aborts if a running QThread is garbage collected
+                self.ami_thread.detach()
+                self.abandoned_listeners.append(self.ami_thread)
+                self.add_log_entry("WARNING: Listener thread did not stop in time and was abandoned",
+                                   level="WARNING")
             self.ami_thread = None
         
         # Update UI
         self.start_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
-        self.status_label.setText("Status: Stopped")
-        self.status_bar.showMessage("Listener stopped")
+        self.show_status("Status: Stopped", "Listener stopped")
         
         self.add_log_entry("AMI Listener stopped")
     
     def on_listener_status_changed(self, status):
         """Handle listener status change"""
-        self.status_label.setText(f"Status: {status}")
-        self.status_bar.showMessage(status)
+        self.listener_status = status
+        self.show_status(f"Status: {status}", status)
         self.add_log_entry(f"Listener status: {status}")
     
-    def on_call_event(self, call_info):
-        """Handle incoming call event"""
-        # Add to call history table
-        row_position = self.call_table.rowCount()
-        self.call_table.insertRow(row_position)
+    def configure_gui_watch(self):
+        """Apply the watchdog settings to the GUI heartbeat"""
+        watchdog_config = self.config['watchdog']
+        if watchdog_config['enabled']:
+            self.watchdog.watch("gui", watchdog_config['gui_deadline_seconds'])
+        else:
+            self.watchdog.unwatch("gui")
+    
+    def on_stage_stalled(self, stage, age):
+        """Surface a stalled stage and restart it where that is possible"""
+        name = self.STAGE_NAMES.get(stage, stage)
+        self.add_log_entry(f"ERROR: {name} made no progress for {age:.0f} s", level="ERROR")
+        if not self.stalled_stages:
+            self.status_before_stall = self.status_text or (self.status_label.text(),
+                                                             self.status_bar.currentMessage())
+        self.stalled_stages.add(stage)
+        self.show_status(f"Status: Stalled - {name}", f"{name} stalled for {age:.0f} s")
+        
+        # The GUI can only be reported once it is running again
+        if not self.ami_thread:
+            return
+        if stage == "reader":
+            # The new listener re-registers the stage, so no recovery will be reported
+            self.stalled_stages.discard(stage)
+            self.add_log_entry("Restarting the AMI listener")
+            metrics.increment("watchdog.restarts.reader")
+            # A stalled reader will not notice the stop flag, so do not wait for it
+            self.stop_listener(timeout=0)
+            self.start_listener()
+        elif stage == "writer":
+            if self.ami_thread.restart_status_writer():
+                metrics.increment("watchdog.restarts.writer")
+                self.add_log_entry("Started a new call status writer")
+            else:
+                self.add_log_entry("ERROR: Several call status writers are stuck; check the status file location",
+                                   level="ERROR")
+    
+    def on_stage_recovered(self, stage, seconds):
+        """Log the end of a stall and put the previous status back"""
+        name = self.STAGE_NAMES.get(stage, stage)
+        self.add_log_entry(f"WARNING: {name} recovered after {seconds:.1f} s", level="WARNING")
+        
+        self.stalled_stages.discard(stage)
+        if self.stalled_stages:
+            return
+        if self.ami_thread and self.listener_status:
+            self.show_status(f"Status: {self.listener_status}", self.listener_status)
+        elif self.status_before_stall:
+            self.show_status(*self.status_before_stall)
+    
+    def on_gui_heartbeat(self):
+        self.watchdog.beat("gui")
+        diagnostics.sync("gui")
+    
+    def restore_from_journal(self):
+        """Bring back calls that reached the journal but not call history before a crash"""
+        limit = self.config['journal']['restore_records']
+        if limit <= 0:
+            return
+        started = time.perf_counter()
+        try:
+            restored = self.call_store.restore_from_journal(self.journal, limit)
+        except (OSError, sqlite3.Error) as e:
+            self.add_log_entry(f"ERROR: Could not restore calls from the event journal: {e}", level="ERROR")
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        metrics.set_gauge("journal.restore_ms", elapsed_ms)
+        
+        if restored:
+            self.call_model.set_filters(self.call_model.filters)
+            self.add_log_entry(f"Restored {restored} call event(s) from the event journal in {elapsed_ms:.0f} ms")
+    
+    def start_control_server(self):
+        """(Re)open the diagnostics control socket on the configured port"""
+        if self.control_server:
+            self.control_server.stop()
+            self.control_server = None
+        
+        port = self.config['diagnostics']['control_port']
+        if not port:
+            return
+        server = ControlServer(port, self.config_manager.config_dir / "control.token",
+                               on_error=diagnostics.message.emit)
+        try:
+            server.start()
+        except OSError as e:
+            self.add_log_entry(f"ERROR: Could not open control port {port}: {e}", level="ERROR")
+            return
+        self.control_server = server
+        self.add_log_entry(f"Diagnostics control socket listening on 127.0.0.1:{port}")
+    
+    def toggle_profiling(self):
+        diagnostics.run_command('profile-stop' if diagnostics.profiling else 'profile-start')
+    
+    def on_diagnostics_message(self, message):
+        """Show diagnostics results, whether they came from the buttons or the control socket"""
+        level = "ERROR" if message.startswith("ERROR") else "INFO"
+        self.add_log_entry(f"Diagnostics: {message}", level=level)
+        self.diagnostics_label.setText(f"{diagnostics.status()}\nLast: {message}")
+        self.profile_btn.setText("⏹️ Stop Profiling" if diagnostics.profiling else "⏱️ Start Profiling")
+    
+    def on_loop_lag(self, slot, lag_ms, slot_ms):
+        """Log an event loop stall over the lag threshold"""
+        self.add_log_entry(
+            f"WARNING: Window was unresponsive for {lag_ms:.0f} ms ({slot}, {slot_ms:.0f} ms)",
+            level="WARNING"
+        )
+    
+    def refresh_loop_lag(self):
+        """Show the last minute's event loop lag in the status bar"""
+        recent_max, slot = self.loop_monitor.recent()
+        if self.rendering_suspended:
+            return
+        
+        p99 = metrics.quantile("gui.loop_lag_ms", 0.99) or 0.0
+        text = f"UI lag p99 {p99:.0f} ms, 1 min max {recent_max:.0f} ms"
+        if slot:
+            text += f" ({slot})"
+        self.loop_lag_label.setText(text)
+    
+    def show_status(self, label_text, bar_text):
+        """Update the status label and bar, or remember them while hidden"""
+        self.status_text = (label_text, bar_text)
+        if self.rendering_suspended:
+            return
+        self.status_label.setText(label_text)
+        self.status_bar.showMessage(bar_text)
+    
+    def on_ringing(self, call):
+        """Pop a tray notification for a call ringing at this extension"""
+        if not hasattr(self, 'tray_icon'):
+            return
         
-        self.call_table.setItem(row_position, 0, QTableWidgetItem(call_info['timestamp']))
-        self.call_table.setItem(row_position, 1, QTableWidgetItem(call_info['event']))
-        self.call_table.setItem(row_position, 2, QTableWidgetItem(call_info['caller_id']))
-        self.call_table.setItem(row_position, 3, QTableWidgetItem(call_info['destination']))
-        self.call_table.setItem(row_position, 4, QTableWidgetItem(call_info['channel']))
+        lines = [call.caller_id] if call.caller_name else []
+        if call.account:
+            lines.append(f"Account: {call.account}")
+        if call.label or call.category:
+            lines.append(call.label or call.category)
+        if call.repeat_count > 1:
+            lines.append(f"Called {call.repeat_count} times recently")
+        
+        self.tray_icon.showMessage(
+            f"Incoming call: {call.caller_name or call.caller_id or 'unknown'}",
+            "\n".join(lines),
+            QSystemTrayIcon.MessageIcon.Information,
+            self.RING_TOAST_MS
+        )
+        
+        latency_ms = (time.monotonic() - call.mono_time) * 1000
+        metrics.increment("toast.shown")
+        metrics.observe("toast.latency_ms", latency_ms)
+        self.add_log_entry(f"Ring toast for {call.caller_id} shown {latency_ms:.1f} ms after receipt",
+                           level="DEBUG")
+    
+    def on_call_event(self, call):
+        """Handle incoming call event"""
+        # Add to call history store
+        record = call.to_record()
+        record['id'] = self.call_store.add(record)
+        if self.call_store.pending:
+            self.history_commit_timer.start(int(CallHistoryStore.COMMIT_INTERVAL * 1000))
         
-        # Scroll to bottom
-        self.call_table.scrollToBottom()
+        # Add to call history table (newest first)
+        if self.call_model.add_call(record):
+            self.call_table.scrollToTop()
+            self.update_search_result_label()
         
-        # Add to call history list
-        self.call_history.append(call_info)
+        # Update statistics aggregates
+        self.update_call_statistics(call)
         
         # Log the event
         self.add_log_entry(
-            f"Call event: {call_info['event']} | "
-            f"From: {call_info['caller_id']} | "
-            f"To: {call_info['destination']}"
+            f"Call event: {call.event} | "
+            f"From: {call.caller_id} | "
+            f"To: {call.destination}"
         )
         
-        # Refresh file preview if on agent tab
-        if self.tab_widget.currentIndex() == 1:  # Agent tab
-            self.refresh_file_preview()
+        repeat_config = self.config['repeat_caller']
+        if call.event == "DialBegin" and call.repeat_count >= repeat_config['threshold']:
+            self.add_log_entry(
+                f"Repeat caller: {call.caller_id} has called {call.repeat_count} "
+                f"times in the last {repeat_config['window_minutes']} minutes"
+            )
+    
+    def update_call_statistics(self, call):
+        """Feed a call transition into the incremental aggregates"""
+        # The agent's own outbound dials are neither arrivals nor missed calls
+        if not is_inbound(call):
+            return
+        
+        now = call.wall_time
+        
+        if call.event == "DialBegin":
+            self.call_stats.record_arrival(now)
+        
+        summary = self.call_tracker.observe(call, now)
+        if summary:
+            self.call_stats.record_completion(summary, now)
+            self.duration_sketches.record(summary)
+            self.duration_sketches_dirty = True
+    
+    @staticmethod
+    def format_duration(total, count):
+        """Format an average duration as m:ss"""
+        if not count:
+            return "-"
+        seconds = int(round(total / count))
+        return f"{seconds // 60}:{seconds % 60:02d}"
+    
+    def refresh_statistics(self):
+        """Show the current aggregates in the statistics panel"""
+        if self.rendering_suspended:
+            return
+        
+        now = time.time()
+        
+        for period, totals in (("Today", self.call_stats.today_totals(now)),
+                               ("Last 60 min", self.call_stats.rolling_totals(now))):
+            values = [
+                str(totals['calls']),
+                str(totals['answered']),
+                str(totals['missed']),
+                self.format_duration(totals['ring_sum'], totals['ring_count']),
+                self.format_duration(totals['talk_sum'], totals['talk_count']),
+            ]
+            for label, value in zip(self.stats_labels[period], values):
+                label.setText(value)
+        
+        hourly = [f"{hour:02d}h: {count}" for hour, count in enumerate(self.call_stats.hourly) if count]
+        self.hourly_stats_label.setText(
+            "Calls per hour today: " + (" | ".join(hourly) if hourly else "none yet")
+        )
+        
+        self.percentile_stats_label.setText(
+            self.format_percentiles(self.duration_sketches.percentiles())
+        )
+    
+    @classmethod
+    def format_percentiles(cls, percentiles):
+        """Format ring/talk p50/p90/p99 values"""
+        parts = []
+        for kind, title in (('ring', "Ring"), ('talk', "Talk")):
+            values = [cls.format_duration(value, 1) if value is not None else "-"
+                      for value in percentiles[kind]]
+            parts.append(f"{title} p50/p90/p99: {' / '.join(values)}")
+        return "   ".join(parts)
+    
+    def duration_sketches_file(self):
+        """Per-agent file holding the saved percentile sketches"""
+        extension = self.config['agent']['extension'] or "agent"
+        return self.app_dir / "data" / f"duration_sketches_{extension}.json"
+    
+    def load_duration_sketches(self):
+        """Continue the percentile sketches saved by a previous run
+        
+        This runs before the log view exists, so a failure is kept in
+        duration_sketches_error and logged once the UI is up.
+        """
+        self.duration_sketches_dirty = False
+        self.duration_sketches_error = None
+        path = self.duration_sketches_file()
+        
+        if path.exists():
+            try:
+                return DurationSketches.load(path)
+            except Exception as e:
+                self.duration_sketches_error = f"Failed to load duration sketches from {path}: {e}; starting empty"
+        return DurationSketches()
+    
+    def save_duration_sketches(self):
+        """Save the percentile sketches if they changed"""
+        if not self.duration_sketches_dirty:
+            return
+        
+        try:
+            self.duration_sketches.save(self.duration_sketches_file())
+            self.duration_sketches_dirty = False
+        except OSError as e:
+            self.add_log_entry(f"ERROR: Failed to save duration sketches: {e}", level="ERROR")
+    
+    def show_floor_percentiles(self):
+        """Merge sketch files from several agents into a floor-wide view"""
+        filenames, _ = QFileDialog.getOpenFileNames(
+            self,
+            "Select Agent Percentile Files",
+            str(self.app_dir / "data"),
+            "Percentile Files (duration_sketches_*.json);;All Files (*)"
+        )
+        
+        if not filenames:
+            return
+        
+        floor = DurationSketches()
+        for filename in filenames:
+            try:
+                floor.merge(DurationSketches.load(filename))
+            except Exception as e:
+                QMessageBox.warning(self, "Error", f"Failed to read {filename}: {str(e)}")
+                return
+        
+        lines = [f"<b>Floor ({len(filenames)} files)</b>: {self.format_percentiles(floor.percentiles())}"]
+        for key in sorted(floor.groups):
+            if key != DurationSketches.ALL:
+                lines.append(f"<b>{key}</b>: {self.format_percentiles(floor.percentiles(key))}")
+        
+        QMessageBox.information(self, "Floor Percentiles", "<br>".join(lines))
     
     def on_listener_error(self, error_msg):
         """Handle listener error"""
-        self.add_log_entry(f"ERROR: {error_msg}")
+        self.add_log_entry(f"ERROR: {error_msg}", level="ERROR")
         
         # Show error in status
-        self.status_label.setText(f"Status: Error - {error_msg}")
-        self.status_bar.showMessage(f"Error: {error_msg}")
+        self.show_status(f"Status: Error - {error_msg}", f"Error: {error_msg}")
     
     def clear_call_history(self):
         """Clear call history table"""
@@ -1093,60 +4883,276 @@ class ListenerMainWindow(QMainWindow):
             QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
         ) == QMessageBox.StandardButton.Yes:
             
-            self.call_table.setRowCount(0)
-            self.call_history.clear()
+            self.call_store.clear()
+            self.call_model.clear()
+            self.update_search_result_label()
             self.add_log_entry("Call history cleared")
     
+    def history_filters(self):
+        """Collect call history filters from the filter bar"""
+        filters = {}
+        
+        prefix = self.filter_caller_edit.text().strip()
+        if prefix:
+            filters['caller_prefix'] = prefix
+        
+        if self.filter_from_cb.isChecked():
+            filters['date_from'] = self.filter_from_edit.dateTime().toSecsSinceEpoch()
+        if self.filter_to_cb.isChecked():
+            filters['date_to'] = self.filter_to_edit.dateTime().toSecsSinceEpoch()
+        
+        if self.filter_event_combo.currentIndex() > 0:
+            filters['event'] = self.filter_event_combo.currentText()
+        
+        extension = self.filter_extension_edit.text().strip()
+        if extension:
+            filters['extension'] = extension
+        
+        category = self.filter_category_combo.currentText().strip()
+        if category and category != "All Categories":
+            filters['category'] = category
+        
+        return filters
+    
+    def apply_history_filters(self):
+        """Run an indexed query for the current filters"""
+        self.call_store.commit()
+        
+        started = time.perf_counter()
+        self.call_model.set_filters(self.history_filters())
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        
+        self.update_search_result_label(elapsed_ms)
+    
+    def reset_history_filters(self):
+        """Clear the filter bar and show all history"""
+        self.filter_caller_edit.clear()
+        self.filter_from_cb.setChecked(False)
+        self.filter_to_cb.setChecked(False)
+        self.filter_event_combo.setCurrentIndex(0)
+        self.filter_category_combo.setCurrentIndex(0)
+        self.filter_extension_edit.clear()
+        self.apply_history_filters()
+    
+    def update_search_result_label(self, elapsed_ms=None):
+        """Show how many matching calls are loaded"""
+        text = f"{self.call_model.rowCount()} matching calls loaded"
+        if self.call_model.canFetchMore():
+            text += " (scroll for more)"
+        if elapsed_ms is not None:
+            text += f" - query took {elapsed_ms:.1f} ms"
+        self.search_result_label.setText(text)
+    
     def export_call_history(self):
-        """Export call history to CSV"""
-        if not self.call_history:
+        """Export the filtered call history to CSV in the background"""
+        if self.export_worker and self.export_worker.isRunning():
+            QMessageBox.information(self, "Info", "An export is already running")
+            return
+        
+        # The filter bar (including its date range) selects what is exported
+        self.call_store.commit()
+        filters = self.history_filters()
+        
+        if not self.call_store.query(filters, limit=1):
             QMessageBox.information(self, "Info", "No call history to export")
             return
         
-        filename, _ = QFileDialog.getSaveFileName(
+        filename, selected_filter = QFileDialog.getSaveFileName(
             self,
             "Export Call History",
             f"call_history_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
-            "CSV Files (*.csv);;All Files (*)"
+            "CSV Files (*.csv);;Compressed CSV Files (*.csv.gz);;All Files (*)"
         )
         
-        if filename:
-            try:
-                with open(filename, 'w', newline='', encoding='utf-8') as f:
-                    import csv
-                    writer = csv.writer(f)
-                    
-                    # Write header
-                    writer.writerow(['Timestamp', 'Event', 'Caller ID', 'Destination', 'Channel', 'Unique ID'])
-                    
-                    # Write data
-                    for call in self.call_history:
-                        writer.writerow([
-                            call['timestamp'],
-                            call['event'],
-                            call['caller_id'],
-                            call['destination'],
-                            call['channel'],
-                            call['uniqueid']
-                        ])
-                
-                QMessageBox.information(self, "Success", f"Call history exported to: {filename}")
-                self.add_log_entry(f"Call history exported to: {filename}")
-                
-            except Exception as e:
-                QMessageBox.warning(self, "Error", f"Failed to export: {str(e)}")
+        if not filename:
+            return
+        
+        if selected_filter.startswith("Compressed") and not filename.endswith(".gz"):
+            filename += ".gz"
+        
+        self.export_progress = QProgressDialog("Exporting call history...", "Cancel", 0, 0, self)
+        self.export_progress.setWindowTitle("Export Call History")
+        self.export_progress.setWindowModality(Qt.WindowModality.WindowModal)
+        self.export_progress.setMinimumDuration(500)
+        
+        self.export_worker = CallExportWorker(
+            self.call_store, filters, filename, compress=filename.endswith(".gz")
+        )
+        self.export_worker.progress.connect(self.on_export_progress)
+        self.export_worker.export_finished.connect(self.on_export_finished)
+        self.export_worker.export_failed.connect(self.on_export_failed)
+        self.export_worker.export_cancelled.connect(self.on_export_cancelled)
+        self.export_progress.canceled.connect(self.export_worker.cancel)
+        
+        self.export_worker.start()
+        self.add_log_entry(f"Exporting call history to: {filename}")
+    
+    def on_export_progress(self, written, total):
+        """Update the export progress dialog"""
+        if self.export_progress:
+            self.export_progress.setMaximum(max(total, 1))
+            self.export_progress.setValue(written)
+            self.export_progress.setLabelText(f"Exported {written:,} of {total:,} calls...")
+    
+    def close_export_progress(self):
+        """Dismiss the export progress dialog"""
+        if self.export_progress:
+            self.export_progress.canceled.disconnect()
+            self.export_progress.close()
+            self.export_progress = None
+    
+    def on_export_finished(self, filename, written):
+        """Handle a completed export"""
+        self.close_export_progress()
+        QMessageBox.information(self, "Success", f"Exported {written:,} calls to: {filename}")
+        self.add_log_entry(f"Call history exported to: {filename} ({written} calls)")
+    
+    def on_export_failed(self, error_msg):
+        """Handle a failed export"""
+        self.close_export_progress()
+        QMessageBox.warning(self, "Error", f"Failed to export: {error_msg}")
+        self.add_log_entry(f"ERROR: Call history export failed: {error_msg}", level="ERROR")
+    
+    def on_export_cancelled(self):
+        """Handle an export cancelled from the progress dialog"""
+        self.close_export_progress()
+        self.add_log_entry("Call history export cancelled")
+    
+    def browse_export_folder(self):
+        """Browse for the scheduled export folder"""
+        folder = QFileDialog.getExistingDirectory(
+            self, "Choose Export Folder", self.export_folder_edit.text()
+        )
+        
+        if folder:
+            self.export_folder_edit.setText(folder)
+    
+    def export_checkpoint_file(self):
+        """Path of the incremental export checkpoint"""
+        # Kept with the call history whose ids it tracks, not among the exports
+        return self.app_dir / "data" / "export_checkpoint.json"
+    
+    def load_export_checkpoint(self):
+        """Read the last exported row id and run time"""
+        try:
+            with open(self.export_checkpoint_file(), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"last_id": 0, "last_run": 0}
+    
+    def save_export_checkpoint(self, checkpoint):
+        """Write the checkpoint atomically"""
+        atomic_write_json(self.export_checkpoint_file(), checkpoint)
+    
+    def schedule_next_export(self):
+        """Arm the export timer for the next due run"""
+        self.scheduled_export_timer.stop()
+        
+        if not self.config['export']['enabled'] or not self.config['export']['folder']:
+            return
+        
+        interval = self.config['export']['interval_hours'] * 3600
+        last_run = self.load_export_checkpoint().get('last_run', 0)
+        due_in = max(last_run + interval - time.time(), 5)
+        
+        # QTimer intervals are limited to ~24 days; re-check on expiry
+        self.scheduled_export_timer.start(int(min(due_in, 86400) * 1000))
+    
+    def run_scheduled_export(self):
+        """Export calls added since the last checkpoint to a dated file"""
+        if self.scheduled_export_worker and self.scheduled_export_worker.isRunning():
+            return
+        
+        export_config = self.config['export']
+        if not export_config['folder']:
+            self.add_log_entry("ERROR: Scheduled export folder is not set", level="ERROR")
+            return
+        
+        checkpoint = self.load_export_checkpoint()
+        interval = export_config['interval_hours'] * 3600
+        if self.sender() is self.scheduled_export_timer and time.time() < checkpoint.get('last_run', 0) + interval:
+            self.schedule_next_export()
+            return
+        
+        try:
+            os.makedirs(export_config['folder'], exist_ok=True)
+        except OSError as e:
+            self.add_log_entry(f"ERROR: Cannot create export folder: {e}", level="ERROR")
+            self.retry_scheduled_export()
+            return
+        
+        self.call_store.commit()
+        
+        extension = ".csv.gz" if export_config['compress'] else ".csv"
+        filename = Path(export_config['folder']) / f"calls_{datetime.now().strftime('%Y%m%d_%H%M%S')}{extension}"
+        
+        self.scheduled_export_worker = CallExportWorker(
+            self.call_store,
+            {'after_id': checkpoint.get('last_id', 0)},
+            filename,
+            compress=export_config['compress'],
+            incremental=True
+        )
+        self.scheduled_export_worker.export_finished.connect(self.on_scheduled_export_finished)
+        self.scheduled_export_worker.export_failed.connect(self.on_scheduled_export_failed)
+        self.scheduled_export_worker.start()
+    
+    def on_scheduled_export_finished(self, filename, written):
+        """Advance the checkpoint after a successful incremental export"""
+        checkpoint = {
+            "last_id": self.scheduled_export_worker.last_id or 0,
+            "last_run": time.time()
+        }
+        
+        try:
+            self.save_export_checkpoint(checkpoint)
+        except OSError as e:
+            self.add_log_entry(f"ERROR: Failed to save export checkpoint: {e}", level="ERROR")
+        
+        if written:
+            message = f"Scheduled export wrote {written} new calls to: {filename}"
+        else:
+            message = "Scheduled export: no new calls since last run"
+        
+        self.export_status_label.setText(f"Last run {datetime.now().strftime('%Y-%m-%d %H:%M')}: {written} calls")
+        self.add_log_entry(message)
+        self.schedule_next_export()
+    
+    def on_scheduled_export_failed(self, error_msg):
+        """Log a failed scheduled export and retry at the next interval"""
+        self.export_status_label.setText(f"Last run failed: {error_msg}")
+        self.add_log_entry(f"ERROR: Scheduled export failed: {error_msg}", level="ERROR")
+        self.retry_scheduled_export()
+    
+    def retry_scheduled_export(self):
+        """Try a failed scheduled export again in a few minutes"""
+        if self.config['export']['enabled']:
+            self.scheduled_export_timer.start(self.EXPORT_RETRY_DELAY_MS)
     
-    def add_log_entry(self, message):
+    def add_log_entry(self, message, level="INFO"):
         """Add entry to log display"""
+        levels = ConfigManager.LOG_LEVELS
+        if levels.index(level) < levels.index(self.config['logging']['level']):
+            return
+        
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         log_entry = f"[{timestamp}] {message}"
         
+        if self.rendering_suspended:
+            if len(self.hidden_log_lines) == self.hidden_log_lines.maxlen:
+                self.hidden_log_dropped += 1
+            self.hidden_log_lines.append(log_entry)
+            return
+        
         self.log_display.append(log_entry)
         
         if self.auto_scroll_logs:
-            cursor = self.log_display.textCursor()
-            cursor.movePosition(cursor.MoveOperation.End)
-            self.log_display.setTextCursor(cursor)
+            self.scroll_logs_to_end()
+    
+    def scroll_logs_to_end(self):
+        cursor = self.log_display.textCursor()
+        cursor.movePosition(cursor.MoveOperation.End)
+        self.log_display.setTextCursor(cursor)
     
     def clear_logs(self):
         """Clear log display"""
@@ -1185,10 +5191,26 @@ class ListenerMainWindow(QMainWindow):
         self.config['ui']['theme'] = self.theme_combo.currentText().lower()
         self.config['ui']['auto_start'] = self.auto_start_cb.isChecked()
         self.config['ui']['minimize_to_tray'] = self.minimize_tray_cb.isChecked()
+        self.config['ui']['ring_notification'] = self.ring_notification_cb.isChecked()
         
         # Logging settings
         self.config['logging']['level'] = self.log_level_combo.currentText()
         self.config['logging']['max_files'] = self.max_files_spin.value()
+        self.config['journal']['enabled'] = self.journal_enabled_cb.isChecked()
+        self.config['journal']['fsync'] = self.journal_fsync_combo.currentText()
+        self.config['journal']['fsync_interval_ms'] = self.journal_interval_spin.value()
+        
+        # Export settings
+        self.config['export']['enabled'] = self.export_enabled_cb.isChecked()
+        self.config['export']['folder'] = self.export_folder_edit.text().strip()
+        self.config['export']['interval_hours'] = self.export_interval_spin.value()
+        self.config['export']['compress'] = self.export_compress_cb.isChecked()
+        self.schedule_next_export()
+        
+        # Diagnostics settings
+        if self.config['diagnostics']['control_port'] != self.control_port_spin.value():
+            self.config['diagnostics']['control_port'] = self.control_port_spin.value()
+            self.start_control_server()
         
         if self.config_manager.save_config(self.config):
             QMessageBox.information(self, "Success", "All settings saved successfully!")
@@ -1204,8 +5226,7 @@ class ListenerMainWindow(QMainWindow):
             QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No
         ) == QMessageBox.StandardButton.Yes:
             
-            self.config = self.config_manager.default_config.copy()
-            self.load_settings_to_ui()
+            self.apply_config(self.config_manager.defaults())
             
             QMessageBox.information(self, "Reset Complete", "All settings have been reset to defaults")
             self.add_log_entry("All settings reset to defaults")
@@ -1223,15 +5244,28 @@ class ListenerMainWindow(QMainWindow):
         self.extension_edit.setText(self.config['agent']['extension'])
         self.callstatus_path_edit.setText(self.config['agent']['callstatus_file'])
         self.auto_clear_spin.setValue(self.config['agent']['auto_clear_delay'])
+        self.phonebook_path_edit.setText(self.config['enrichment']['phonebook_file'])
+        self.rules_path_edit.setText(self.config['classification']['rules_file'])
         
         # UI settings
         self.theme_combo.setCurrentText(self.config['ui']['theme'].title())
         self.auto_start_cb.setChecked(self.config['ui']['auto_start'])
         self.minimize_tray_cb.setChecked(self.config['ui']['minimize_to_tray'])
+        self.ring_notification_cb.setChecked(self.config['ui']['ring_notification'])
+        self.control_port_spin.setValue(self.config['diagnostics']['control_port'])
         
         # Logging settings
         self.log_level_combo.setCurrentText(self.config['logging']['level'])
         self.max_files_spin.setValue(self.config['logging']['max_files'])
+        self.journal_enabled_cb.setChecked(self.config['journal']['enabled'])
+        self.journal_fsync_combo.setCurrentText(self.config['journal']['fsync'])
+        self.journal_interval_spin.setValue(self.config['journal']['fsync_interval_ms'])
+        
+        # Export settings
+        self.export_enabled_cb.setChecked(self.config['export']['enabled'])
+        self.export_folder_edit.setText(self.config['export']['folder'])
+        self.export_interval_spin.setValue(self.config['export']['interval_hours'])
+        self.export_compress_cb.setChecked(self.config['export']['compress'])
         
         self.on_pbx_enabled_changed()
     
@@ -1247,6 +5281,8 @@ class ListenerMainWindow(QMainWindow):
         self.config['agent']['extension'] = self.extension_edit.text().strip()
         self.config['agent']['callstatus_file'] = self.callstatus_path_edit.text()
         self.config['agent']['auto_clear_delay'] = self.auto_clear_spin.value()
+        self.config['enrichment']['phonebook_file'] = self.phonebook_path_edit.text().strip()
+        self.config['classification']['rules_file'] = self.rules_path_edit.text().strip()
         
         # Save window geometry
         geometry = self.geometry()
@@ -1254,6 +5290,87 @@ class ListenerMainWindow(QMainWindow):
         
         self.config_manager.save_config(self.config)
     
+    def watch_config_file(self):
+        """(Re)register config.json, which may be created or replaced after startup"""
+        path = str(self.config_manager.config_file)
+        if os.path.exists(path) and path not in self.config_watcher.files():
+            self.config_watcher.addPath(path)
+    
+    def on_config_file_changed(self, path):
+        """Debounce bursts of change notifications from a single save"""
+        self.config_reload_timer.start(300)
+    
+    def reload_config_file(self):
+        """Re-read config.json after an external edit and apply it"""
+        self.watch_config_file()
+        
+        text = self.config_manager.read_config_text()
+        if text is None or text == self.config_manager.last_saved_text:
+            return
+        
+        try:
+            new_config = self.config_manager.parse_config(text)
+        except Exception as e:
+            self.add_log_entry(f"ERROR: Ignoring invalid config.json: {e}", level="ERROR")
+            return
+        
+        self.config_manager.last_saved_text = text
+        for problem in self.config_manager.problems:
+            self.add_log_entry(f"Config: {problem}", level="WARNING")
+        
+        changed = self.apply_config(new_config)
+        if changed:
+            self.add_log_entry(f"Configuration reloaded ({', '.join(sorted(changed))})")
+    
+    def apply_config(self, new_config):
+        """Update the live config in place and push changes to running components"""
+        changed = {key for key, value in new_config.items() if self.config.get(key) != value}
+        if not changed:
+            return changed
+        
+        # Mutate the existing sections so the listener thread sees the new values.
+        # Worker threads read them without a lock, so every key stays present
+        # throughout: new values go in first, then keys that disappeared go.
+        previous = copy.deepcopy(self.config)
+        for key in changed:
+            if isinstance(self.config.get(key), dict) and isinstance(new_config[key], dict):
+                section = self.config[key]
+                section.update(new_config[key])
+                for stale in set(section) - set(new_config[key]):
+                    del section[stale]
+            else:
+                self.config[key] = new_config[key]
+        
+        self.load_settings_to_ui()
+        
+        if 'repeat_caller' in changed:
+            self.call_model.set_repeat_threshold(self.config['repeat_caller']['threshold'])
+        if 'ui' in changed:
+            self.call_model.set_max_rows(self.config['ui']['max_table_rows'])
+        if 'logging' in changed:
+            self.log_display.document().setMaximumBlockCount(self.config['logging']['max_display_lines'])
+        if 'export' in changed:
+            self.schedule_next_export()
+        if 'watchdog' in changed:
+            self.configure_gui_watch()
+        if 'diagnostics' in changed:
+            self.start_control_server()
+        
+        if self.ami_thread and self.ami_thread.isRunning():
+            reconnect = {'pbx', 'broker'} | ({'demo'} if self.ami_thread.demo_active else set())
+            if changed & reconnect:
+                self.add_log_entry("Connection settings changed, reconnecting")
+                self.stop_listener()
+                self.start_listener()
+            else:
+                self.ami_thread.apply_config_changes(changed, previous)
+        
+        return changed
+    
+    def schedule_config_save(self):
+        """Debounce config saves triggered by settings widgets"""
+        self.config_save_timer.start(2000)
+    
     def load_window_geometry(self):
         """Load and apply window geometry"""
         geometry_str = self.config['ui'].get('window_geometry', '900x700')
@@ -1267,20 +5384,114 @@ class ListenerMainWindow(QMainWindow):
         """Handle application close event"""
         if self.config['ui']['minimize_to_tray'] and hasattr(self, 'tray_icon'):
             event.ignore()
-            self.hide()
+            self.hide_to_tray()
+            self.save_config()
             return
         
+        # Write any running profile before the threads go away
+        if diagnostics.profiling:
+            diagnostics.stop_profiling()
+            diagnostics.release("gui")
+        if self.control_server:
+            self.control_server.stop()
+        
         # Stop listener if running
         if self.ami_thread:
             self.ami_thread.stop()
+        self.watchdog.stop()
+        self.journal.stop()
         
         # Save configuration
         self.save_config()
         
+        # Save percentile sketches
+        self.save_duration_sketches()
+        
+        # Flush call history
+        for worker in (self.export_worker, self.scheduled_export_worker):
+            if worker and worker.isRunning():
+                worker.cancel()
+                worker.wait()
+        self.call_store.close()
+        
         event.accept()
 
+def application_dir():
+    """Directory holding config, data and logs"""
+    if getattr(sys, 'frozen', False):
+        # Running as compiled executable
+        return Path(sys.executable).parent
+    # Running as script
+    return Path(__file__).parent.parent
+
+def run_broker():
+    """Run a headless broker that shares one AMI session with local clients"""
+    import signal
+    from PyQt6.QtCore import QCoreApplication
+    
+    app = QCoreApplication(sys.argv)
+    config = ConfigManager(application_dir()).load_config()
+    if not config['broker']['secret']:
+        sys.exit("Set broker.secret in config.json before starting the broker")
+    config['broker']['mode'] = "broker"
+    # The broker has no agent of its own, so it never writes a status file
+    config['agent']['extension'] = ""
+    
+    listener = AMIListenerThread(config)
+    listener.status_changed.connect(lambda status: print(f"[{datetime.now():%H:%M:%S}] {status}"))
+    listener.error_occurred.connect(lambda error: print(f"[{datetime.now():%H:%M:%S}] ERROR: {error}"))
+    listener.start()
+    
+    signal.signal(signal.SIGINT, lambda *args: app.quit())
+    # Wake the event loop regularly so Python can handle Ctrl+C
+    wakeup = QTimer()
+    wakeup.timeout.connect(lambda: None)
+    wakeup.start(500)
+    
+    app.exec()
+    listener.stop()
+
+def write_startup_probe(path):
+    """Record when the main window is up so build_tools/build.py can time startup"""
+    Path(path).write_text(repr(time.time()), encoding='utf-8')
+    QApplication.instance().quit()
+
 def main():
     """Main application entry point"""
+    if "--broker" in sys.argv:
+        run_broker()
+        return
+    
+    # --broker-key=<extension> prints the key an agent needs to subscribe
+    extension = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--broker-key=")), None)
+    if extension:
+        secret = ConfigManager(application_dir()).load_config()['broker']['secret']
+        if not secret:
+            sys.exit("Set broker.secret in config.json first")
+        print(broker_key(secret, extension.strip()))
+        return
+    
+    # --diag=<command> talks to an instance that is already running
+    command = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--diag=")), None)
+    if command:
+        config_manager = ConfigManager(application_dir())
+        port = config_manager.load_config()['diagnostics']['control_port']
+        if not port:
+            sys.exit("The diagnostics control port is off; set diagnostics.control_port in config.json")
+        try:
+            print(send_control_command(port, config_manager.config_dir / "control.token", command))
+        except OSError as e:
+            sys.exit(f"No instance listening on 127.0.0.1:{port}: {e}")
+        return
+    
+    # Capture from launch, for problems that show up during startup
+    if "--profile" in sys.argv:
+        diagnostics.start_profiling()
+    if "--trace-memory" in sys.argv:
+        diagnostics.start_memory_tracing()
+    
+    startup_probe = next((arg.split("=", 1)[1] for arg in sys.argv if arg.startswith("--startup-probe=")), None)
+    
     app = QApplication(sys.argv)
     app.setApplicationName("Listener Professional")
     app.setApplicationVersion("4.0")
@@ -1293,8 +5504,11 @@ def main():
     window = ListenerMainWindow()
     window.show()
     
+    if startup_probe:
+        # Fires once the event loop has processed the first show
+        QTimer.singleShot(0, lambda: write_startup_probe(startup_probe))
     # Auto-start listener if configured
-    if window.config['ui']['auto_start']:
+    elif window.config['ui']['auto_start']:
         QTimer.singleShot(1000, window.start_listener)
     
     sys.exit(app.exec())